@@ -70,4 +70,10 @@ async def async_client(test_db, test_cache):
 def pytest_collection_modifyitems(config, items):
     only_items = [item for item in items if "only" in item.keywords]
     if only_items:
-        items[:] = only_items
\ No newline at end of file
+        items[:] = only_items
+
+    # Timings on large frames only run when asked for
+    if not os.getenv('BENCHMARK'):
+        for item in items:
+            if "benchmark" in item.keywords:
+                item.add_marker(pytest.mark.skip(reason="set BENCHMARK=1 to run benchmarks"))
\ No newline at end of file
@@ -0,0 +1,109 @@
+from functools import lru_cache
+from itertools import islice
+from typing import Callable, Iterable
+from pydantic import BaseModel, TypeAdapter
+import asyncio
+
+from src.lib.utils.config import INSERT_CHUNK_SIZE, INSERT_CONCURRENCY
+
+
+@lru_cache(maxsize=None)
+def list_adapter(model: type[BaseModel]) -> TypeAdapter:
+    # The validator for a list of a model is compiled once and reused for every chunk
+    return TypeAdapter(list[model])
+
+
+def validate_many(model: type[BaseModel], records: list) -> list:
+    """
+        Validate records in one pass and dump them as documents
+
+        @param model: The create model of the documents
+        @param records: The records to validate
+
+        @return: The documents, as model_dump would give for each record
+    """
+    adapter = list_adapter(model)
+    return adapter.dump_python(adapter.validate_python(records))
+
+
+def chunked(records: Iterable, size: int = INSERT_CHUNK_SIZE):
+    """
+        Split records into lists of a fixed size
+
+        @param records: The records to split
+        @param size: The size of each chunk
+
+        @return: An iterator over the chunks
+    """
+    records = iter(records)
+    while chunk := list(islice(records, size)):
+        yield chunk
+
+
+async def insert_chunks(collection, chunks: Iterable, concurrency: int = INSERT_CONCURRENCY, progress: Callable = None) -> int:
+    """
+        Insert chunks of documents unordered, with a bounded number of inserts in flight
+
+        @param collection: The collection to insert into
+        @param chunks: The chunks of documents, produced while earlier chunks are being inserted
+        @param concurrency: The number of inserts in flight
+        @param progress: Called with the collection name and the number of documents inserted so far
+
+        @return: The number of documents inserted
+    """
+    chunks = iter(chunks)
+    inserted = 0
+    pending = set()
+
+    async def insert(documents: list):
+        nonlocal inserted
+        await collection.insert_many(documents, ordered=False)
+
+        inserted += len(documents)
+        if progress is not None:
+            progress(collection.name, inserted)
+
+    try:
+        # Chunks are produced in a thread, validating or replaying them would otherwise hold the loop
+        while (documents := await asyncio.to_thread(next, chunks, None)) is not None:
+            if not documents:
+                continue
+
+            # Wait for a free slot, which also lets the other collections' inserts run
+            done = {task for task in pending if task.done()}
+            if len(pending) - len(done) >= concurrency:
+                finished, _ = await asyncio.wait(pending - done, return_when=asyncio.FIRST_COMPLETED)
+                done |= finished
+            pending -= done
+
+            # Stop at the first failed insert, the chunks left are neither produced nor inserted
+            for task in done:
+                task.result()
+
+            pending.add(asyncio.create_task(insert(documents)))
+
+        await asyncio.gather(*pending)
+    except BaseException:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        raise
+
+    return inserted
+
+
+async def bulk_insert(collection, model: type[BaseModel], records: Iterable, chunk_size: int = INSERT_CHUNK_SIZE, concurrency: int = INSERT_CONCURRENCY, progress: Callable = None) -> int:
+    """
+        Validate and insert records in fixed size chunks
+
+        @param collection: The collection to insert into
+        @param model: The create model of the documents
+        @param records: The records to insert
+        @param chunk_size: The number of documents in each insert
+        @param concurrency: The number of inserts in flight
+        @param progress: Called with the collection name and the number of documents inserted so far
+
+        @return: The number of documents inserted
+    """
+    chunks = (validate_many(model, chunk) for chunk in chunked(records, chunk_size))
+    return await insert_chunks(collection, chunks, concurrency=concurrency, progress=progress)
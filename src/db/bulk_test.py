@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import pytest
+
+from src.db.bulk import bulk_insert, chunked, insert_chunks, validate_many
+from src.models.simulation_devices import CreateSimulationDevice
+
+
+class Collection:
+    # Records the inserts and how many ran at the same time
+    def __init__(self, name: str):
+        self.name = name
+        self.inserts = []
+        self.running = 0
+        self.peak = 0
+
+    async def insert_many(self, documents, ordered=True):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(.01)
+        self.inserts.append((documents, ordered))
+        self.running -= 1
+
+
+class FailingCollection(Collection):
+    # Fails the second insert, the inserts after it are never finished
+    async def insert_many(self, documents, ordered=True):
+        if len(self.inserts) == 1:
+            raise RuntimeError('insert failed')
+        if self.inserts:
+            await asyncio.sleep(10)
+        self.inserts.append((documents, ordered))
+
+
+def device(position: int) -> dict:
+    return {'device_id': f'ATM_{position}', 'owner': 'Bank', 'type': 'ATM', 'latitude': 9., 'longitude': 3., 'simulation_id': 'sim'}
+
+
+def test_validate_many_matches_model_dump():
+    stamps = {'created_at', 'updated_at'}
+    documents = validate_many(CreateSimulationDevice, [device(0), device(1)])
+
+    assert [{k: v for k, v in document.items() if k not in stamps} for document in documents] == [CreateSimulationDevice(**device(x)).model_dump(exclude=stamps) for x in range(2)]
+    assert all(stamps <= set(document) for document in documents)
+
+
+def test_chunked_keeps_every_record():
+    assert list(chunked(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(chunked([], 3)) == []
+
+
+def test_bulk_insert_writes_unordered_chunks_concurrently():
+    collection = Collection('simulation_devices')
+    reports = []
+
+    inserted = asyncio.run(bulk_insert(collection, CreateSimulationDevice, (device(x) for x in range(25)), chunk_size=10, concurrency=2, progress=lambda name, count: reports.append((name, count))))
+
+    assert inserted == 25
+    assert sorted(len(documents) for documents, _ in collection.inserts) == [5, 10, 10]
+    assert not any(ordered for _, ordered in collection.inserts)
+    assert collection.peak == 2
+    assert reports[-1] == ('simulation_devices', 25)
+
+
+def test_insert_chunks_produces_chunks_off_the_loop():
+    collection = Collection('simulation_devices')
+    threads = []
+
+    def chunks():
+        for position in range(3):
+            threads.append(threading.get_ident())
+            yield [device(position)]
+
+    assert asyncio.run(insert_chunks(collection, chunks())) == 3
+    assert threading.get_ident() not in threads
+
+
+def test_insert_chunks_stops_at_the_first_failure():
+    collection = FailingCollection('simulation_devices')
+    produced = []
+
+    def chunks():
+        for position in range(100):
+            produced.append(position)
+            yield [device(position)]
+
+    async def run():
+        with pytest.raises(RuntimeError, match='insert failed'):
+            await insert_chunks(collection, chunks(), concurrency=2)
+
+        # The inserts still in flight were cancelled
+        assert len(asyncio.all_tasks()) == 1
+
+    asyncio.run(run())
+    assert len(collection.inserts) == 1
+    assert len(produced) < 10
@@ -1,11 +1,8 @@
-from redis import asyncio
 from redis.asyncio import Redis
 
-from ..lib.utils.config import REDIS_URL
+from src.db.connections import connections
 
-redis_client: Redis = None
 
-def get_cache():
-    global redis_client
-    redis_client = asyncio.from_url(f'{REDIS_URL}/0', decode_responses=True)
-    return redis_client
\ No newline at end of file
+async def get_cache() -> Redis:
+    # The pooled cache client of the running event loop
+    return connections.cache()
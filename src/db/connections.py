@@ -0,0 +1,124 @@
+import asyncio
+import threading
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from pymongo.database import Database
+from redis import asyncio as aioredis
+from redis.asyncio import Redis
+
+from src.lib.utils.config import (
+    APP_NAME, MONGO_URL, REDIS_URL, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, REDIS_MAX_CONNECTIONS, REDIS_HEALTH_CHECK_INTERVAL
+)
+from src.lib.utils.logger import get_logger
+
+
+class Connections:
+    """
+        The pooled Mongo and Redis clients of a process, shared by the handlers, tasks and workflows.
+        Async clients are bound to the event loop they were created on, so every loop gets its own pool
+    """
+
+    logger = get_logger('Connections')
+
+    def __init__(self, mongo_url: str = MONGO_URL, redis_url: str = REDIS_URL):
+        """
+            Initialize the connections, no client is created until it is used
+
+            @param mongo_url: The url of the database
+            @param redis_url: The url of the cache
+        """
+        self.mongo_url = mongo_url
+        self.redis_url = redis_url
+        self.pools = {}
+        self.clients = {}
+        self.lock = threading.Lock()
+
+
+    def pool(self) -> tuple:
+        """
+            Get the clients of the running event loop, creating them on first use
+
+            @return: The Mongo and Redis clients
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if loop not in self.pools:
+                self.pools[loop] = (
+                    AsyncIOMotorClient(self.mongo_url, maxPoolSize=MONGO_MAX_POOL_SIZE, minPoolSize=MONGO_MIN_POOL_SIZE, appname=APP_NAME),
+                    aioredis.from_url(
+                        f'{self.redis_url}/0', decode_responses=True,
+                        max_connections=REDIS_MAX_CONNECTIONS, health_check_interval=REDIS_HEALTH_CHECK_INTERVAL
+                    ),
+                )
+            return self.pools[loop]
+
+
+    def db(self) -> Database:
+        # The database of the running event loop
+        return self.pool()[0][APP_NAME]
+
+
+    def cache(self) -> Redis:
+        # The cache of the running event loop
+        return self.pool()[1]
+
+
+    def sync_client(self, url: str = None) -> MongoClient:
+        """
+            Get a synchronous client, pymongo clients are thread safe so one serves the whole process
+
+            @param url: The url of the database, the application database when missing
+
+            @return: The client
+        """
+        url = url or self.mongo_url
+        with self.lock:
+            if url not in self.clients:
+                self.clients[url] = MongoClient(url, maxPoolSize=MONGO_MAX_POOL_SIZE, minPoolSize=MONGO_MIN_POOL_SIZE, appname=APP_NAME)
+            return self.clients[url]
+
+
+    async def health(self) -> dict:
+        """
+            Check the database and the cache answer
+
+            @return: Whether each of them is healthy
+        """
+        client, cache = self.pool()
+        checks = {}
+        for name, ping in [('mongo', lambda: client.admin.command('ping')), ('redis', cache.ping)]:
+            try:
+                await ping()
+                checks[name] = True
+            except Exception as e:
+                self.logger.error(f'{name} health check failed: {e}')
+                checks[name] = False
+
+        return checks
+
+
+    async def release(self):
+        # Close the clients of the running event loop, tasks running on their own loop release them when done
+        with self.lock:
+            pool = self.pools.pop(asyncio.get_running_loop(), None)
+
+        if pool is not None:
+            client, cache = pool
+            client.close()
+            await cache.aclose()
+
+
+    async def close(self):
+        # Close every client on shutdown, the pools of other loops are closed without waiting on them
+        await self.release()
+        with self.lock:
+            pools, clients = list(self.pools.values()), list(self.clients.values())
+            self.pools, self.clients = {}, {}
+
+        for client, _ in pools:
+            client.close()
+        for client in clients:
+            client.close()
+
+
+connections = Connections()
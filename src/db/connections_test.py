@@ -0,0 +1,47 @@
+import asyncio
+
+from src.db.connections import Connections
+from src.lib.utils.config import MONGO_MAX_POOL_SIZE, REDIS_MAX_CONNECTIONS
+
+
+def test_a_loop_reuses_its_pool_until_released():
+    connections = Connections('mongodb://localhost:27017', 'redis://localhost:6379')
+
+    async def resolve():
+        # Dependencies resolved by many requests on the same loop
+        db, cache = connections.db(), connections.cache()
+        assert all(connections.db().client is db.client and connections.cache() is cache for _ in range(50))
+        assert db.client.options.pool_options.max_pool_size == MONGO_MAX_POOL_SIZE
+        assert cache.connection_pool.max_connections == REDIS_MAX_CONNECTIONS
+
+        await connections.release()
+        assert not connections.pools
+        return db.client
+
+    first, second = asyncio.run(resolve()), asyncio.run(resolve())
+    assert first is not second
+
+
+def test_loops_get_pools_of_their_own():
+    connections = Connections('mongodb://localhost:27017', 'redis://localhost:6379')
+
+    async def client():
+        return connections.db().client
+
+    loops = [asyncio.new_event_loop() for _ in range(2)]
+    clients = [loop.run_until_complete(client()) for loop in loops]
+    assert clients[0] is not clients[1] and len(connections.pools) == 2
+
+    loops[0].run_until_complete(connections.close())
+    assert not connections.pools
+    for loop in loops:
+        loop.close()
+
+
+def test_sync_clients_are_shared_per_url():
+    connections = Connections('mongodb://localhost:27017', 'redis://localhost:6379')
+
+    assert connections.sync_client() is connections.sync_client('mongodb://localhost:27017')
+    assert connections.sync_client('mongodb://localhost:27018') is not connections.sync_client()
+    asyncio.run(connections.close())
+    assert not connections.clients
@@ -1,40 +1,19 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
 from pymongo.database import Database
 
-from src.lib.utils.config import APP_NAME, MONGO_URL
+from src.db.connections import connections
+from src.lib.utils.config import APP_NAME
 
     
 async def get_db() -> Database:
-    """Get async MongoDB database instance with configured indexes.
+    """Get async MongoDB database instance.
 
-    Creates indexes for:
-    - users: email (unique)
-    - roles: title (unique), description
-    - notifications: subject
-    - transactions: item, description, category, vendor
-    - receipts: vendor, notes
+    The client is pooled and shared by the requests on the same event loop.
+    Indexes are created once when the application starts, see src.db.indexes.
 
     Returns:
         AsyncIOMotorClient database instance
     """
-    client = AsyncIOMotorClient(MONGO_URL)
-    db: Database = client[APP_NAME]
-
-    db.users.create_index([('email', 1)], unique=True)
-
-    db.roles.create_index([('title', 1)], unique=True)
-    db.roles.create_index([('description', 1)])
-
-    db.notification.create_index([('subject', 1)])
-
-    db.simulations.create_index([('author_id', 1)])
-    db.simulation_transactions.create_index([('holder', 1), ('holder_bank', 1), ('reference', 1)])
-    db.simulation_profiles.create_index([('user_id', 1), ('user_name', 1), ('name', 1), ('email', 1)])
-    db.simulation_devices.create_index([('owner', 1), ('device_id', 1)])
-    db.simulation_accounts.create_index([('account_no', 1), ('bank_name', 1), ('account_name', 1)])
-
-    return db
+    return connections.db()
 
 
 def get_db_sync() -> Database:
@@ -43,6 +22,6 @@ def get_db_sync() -> Database:
     Returns:
         MongoClient database instance
     """
-    client = MongoClient(MONGO_URL)
+    client = connections.sync_client()
     db: Database = client[APP_NAME]
     return db
\ No newline at end of file
@@ -0,0 +1,71 @@
+import asyncio
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.database import Database
+
+
+# Public listings match {'hidden': False} exactly, a partial index only serves queries that imply its filter,
+# so {'$nor': [{'hidden': True}]} or {'hidden': {'$ne': True}} would scan every simulation instead
+PUBLIC = {'hidden': False}
+
+# The indexes of every collection, each shaped after the queries it serves: equality fields first, then the sort
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], unique=True),
+    ],
+    'roles': [
+        IndexModel([('title', ASCENDING)], unique=True),
+        IndexModel([('description', ASCENDING)]),
+        IndexModel([('users', ASCENDING)]),
+    ],
+    'notifications': [
+        # Each branch of the public or addressed $or is planned on its own index
+        IndexModel([('public', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('users', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('subject', ASCENDING)]),
+    ],
+    'simulations': [
+        IndexModel([('created_at', DESCENDING)], partialFilterExpression=PUBLIC),
+        IndexModel([('author_id', ASCENDING), ('created_at', DESCENDING)], partialFilterExpression=PUBLIC),
+    ],
+    'simulation_transactions': [
+        IndexModel([('simulation_id', ASCENDING), ('created_at', DESCENDING)]),
+        # The history of an account, and the accounts either side of a scope
+        IndexModel([('simulation_id', ASCENDING), ('holder', ASCENDING), ('holder_bank', ASCENDING), ('time', DESCENDING)]),
+        IndexModel([('simulation_id', ASCENDING), ('related', ASCENDING), ('related_bank', ASCENDING), ('time', DESCENDING)]),
+        IndexModel([('simulation_id', ASCENDING), ('features.holder_bvn', ASCENDING)]),
+        IndexModel([('simulation_id', ASCENDING), ('features.related_bvn', ASCENDING)]),
+        # The latest feature vectors a transaction is scored against without a model
+        IndexModel([('simulation_id', ASCENDING), ('time', DESCENDING)], partialFilterExpression={'features': {'$exists': True}}),
+        # Summaries read the quartiles of each numeric field off its index
+        *[
+            IndexModel([('simulation_id', ASCENDING), (field, ASCENDING)])
+            for field in ['amount', 'balance', 'latitude', 'longitude', 'scores.fraud_score']
+        ],
+    ],
+    'simulation_accounts': [
+        IndexModel([('simulation_id', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('simulation_id', ASCENDING), ('account_no', ASCENDING), ('bank_name', ASCENDING)]),
+        IndexModel([('simulation_id', ASCENDING), ('bank_name', ASCENDING)]),
+        IndexModel([('account_no', ASCENDING), ('bank_name', ASCENDING)]),
+    ],
+    'simulation_profiles': [
+        IndexModel([('simulation_id', ASCENDING), ('user_id', ASCENDING)]),
+    ],
+    'simulation_devices': [
+        IndexModel([('simulation_id', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('owner', ASCENDING), ('device_id', ASCENDING)]),
+    ],
+    'simulation_datasets': [
+        IndexModel([('simulation_id', ASCENDING)]),
+        IndexModel([('used_at', DESCENDING)]),
+    ],
+}
+
+
+async def ensure_indexes(db: Database):
+    """
+        Create the indexes of every collection, indexes that already exist are left as they are
+
+        @param db: The database
+    """
+    await asyncio.gather(*[db[collection].create_indexes(indexes) for collection, indexes in INDEXES.items()])
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import DESCENDING
+from pymongo.database import Database
+import pytest
+
+from src.db.indexes import ensure_indexes
+
+
+def stages(plan: dict):
+    # Every stage of a query plan, the classic and the slot based engines nest it differently
+    plan = plan.get('queryPlan', plan)
+    yield plan
+    for child in [plan.get('inputStage'), *plan.get('inputStages', [])]:
+        if child:
+            yield from stages(child)
+
+
+async def plan(cursor) -> list:
+    # The stages of the winning plan of a query
+    explained = await cursor.explain()
+    return list(stages(explained['queryPlanner']['winningPlan']))
+
+
+def index_names(plan: list) -> set:
+    return {stage['indexName'] for stage in plan if stage['stage'] == 'IXSCAN'}
+
+
+def scans(plan: list) -> set:
+    return {stage['stage'] for stage in plan}
+
+
+@pytest.mark.asyncio
+class TestIndexes:
+    async def _seed(self, test_db: Database):
+        await ensure_indexes(test_db)
+
+        now = datetime.now()
+        await test_db.simulation_transactions.insert_many([
+            {
+                'simulation_id': f'SIM_{i % 4}', 'holder': f'ACC_{i % 20}', 'holder_bank': 'Bank', 'related': f'ACC_{(i + 1) % 20}', 'related_bank': 'Bank',
+                'amount': float(i), 'time': (now - timedelta(minutes=i)).isoformat(), 'created_at': now - timedelta(minutes=i),
+                **({'features': {'holder_bvn': f'BVN_{i % 10}'}} if i % 2 else {})
+            }
+            for i in range(400)
+        ])
+        await test_db.simulation_accounts.insert_many([
+            {'simulation_id': f'SIM_{i % 4}', 'account_no': f'ACC_{i // 4}', 'bank_name': 'Bank', 'created_at': now - timedelta(minutes=i)}
+            for i in range(80)
+        ])
+        await test_db.simulations.insert_many([
+            {'author_id': str(ObjectId()), 'hidden': bool(i % 3 == 0), 'created_at': now - timedelta(minutes=i)}
+            for i in range(60)
+        ])
+
+
+    async def test_ensure_indexes_is_idempotent(self, test_db: Database):
+        await ensure_indexes(test_db)
+        first = await test_db.simulation_transactions.index_information()
+        await ensure_indexes(test_db)
+
+        assert await test_db.simulation_transactions.index_information() == first
+
+
+    async def test_account_history_reads_the_holder_index_in_time_order(self, test_db: Database):
+        await self._seed(test_db)
+
+        cursor = test_db.simulation_transactions.find({
+            'simulation_id': 'SIM_1', 'holder': 'ACC_1', 'holder_bank': 'Bank', 'time': {'$lt': datetime.now().isoformat()}
+        }).sort('time', DESCENDING)
+        stages = await plan(cursor)
+
+        assert index_names(stages) == {'simulation_id_1_holder_1_holder_bank_1_time_-1'}
+        assert not scans(stages) & {'SORT', 'COLLSCAN'}
+
+
+    async def test_list_pages_read_the_created_at_index(self, test_db: Database):
+        await self._seed(test_db)
+
+        for collection in [test_db.simulation_transactions, test_db.simulation_accounts]:
+            stages = await plan(collection.find({'simulation_id': 'SIM_2'}).sort('created_at', DESCENDING).limit(11))
+
+            assert index_names(stages) == {'simulation_id_1_created_at_-1'}
+            assert not scans(stages) & {'SORT', 'COLLSCAN'}
+
+
+    async def test_accounts_are_found_by_simulation(self, test_db: Database):
+        await self._seed(test_db)
+
+        stages = await plan(test_db.simulation_accounts.find({'simulation_id': 'SIM_3', 'account_no': 'ACC_7', 'bank_name': 'Bank'}))
+        assert index_names(stages) == {'simulation_id_1_account_no_1_bank_name_1'}
+
+
+    async def test_featured_history_reads_the_partial_index(self, test_db: Database):
+        await self._seed(test_db)
+
+        cursor = test_db.simulation_transactions.find({'simulation_id': 'SIM_1', 'features': {'$exists': True}, '_id': {'$ne': ObjectId()}}).sort('time', DESCENDING).limit(1000)
+        stages = await plan(cursor)
+
+        assert index_names(stages) == {'simulation_id_1_time_-1'}
+        assert not scans(stages) & {'SORT', 'COLLSCAN'}
+
+
+    async def test_public_simulations_read_the_partial_index(self, test_db: Database):
+        await self._seed(test_db)
+
+        stages = await plan(test_db.simulations.find({'hidden': False}).sort('created_at', DESCENDING).limit(11))
+        assert index_names(stages) == {'created_at_-1'}
+        assert not scans(stages) & {'SORT', 'COLLSCAN'}
+
+        # The same listing written as a $nor does not imply the partial filter, so it scans the collection
+        stages = await plan(test_db.simulations.find({'$nor': [{'hidden': True}]}).sort('created_at', DESCENDING).limit(11))
+        assert 'COLLSCAN' in scans(stages)
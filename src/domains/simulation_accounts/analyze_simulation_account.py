@@ -1,8 +1,6 @@
 from typing import Any
 
 
-from pandas import DataFrame
-from pymongo import DESCENDING
 from pymongo.database import Database
 from bson import ObjectId
 from redis.asyncio import Redis
@@ -16,19 +14,11 @@ from src.models.response import DataResponse
 async def analyze_simulation_account(id: ObjectId, db: Database, cache: Redis):
     account_response = await get_simulation_account(id, db, cache)
     account_data = account_response.data
-    simulation_transaction_collection = db.simulation_transactions
-    simulation_account_collection = db.simulation_accounts
-
-    transactions = await simulation_transaction_collection.find({'simulation_id': account_data.simulation_id}).sort({'time': DESCENDING}).to_list()
-    accounts = await simulation_account_collection.find({'simulation_id': account_data.simulation_id}).to_list()
 
+    # Only the transactions of the account are loaded and scored
     transaction_analysis = await analyze_transaction_history(
-        DataFrame(transactions), 
-        DataFrame(accounts),
-        filter_transactions=lambda df: df[
-            ((df['holder'] == account_data.account_no) & (df['holder_bank'] == account_data.bank_name))
-            | 
-            ((df['related'] == account_data.account_no) & (df['related_bank'] == account_data.bank_name))
-        ]
+        account_data.simulation_id,
+        db,
+        scope={'account_no': account_data.account_no, 'bank_name': account_data.bank_name}
     )
     return DataResponse[TransactionsAnalysis](data=transaction_analysis)
\ No newline at end of file
@@ -1,28 +1,22 @@
-import pandas as pd
+from pymongo.database import Database
 
-from src.domains.simulation_transactions.hound_transaction import hound_transaction
-from src.models.simulation_transaction import AnalyzedSimulationTransaction, SimulationTransaction, TransactionsAnalysis
-from src.lib.analytics.anomalizer import detect_fraud
-from src.lib.analytics.engineer import get_cashflow
-from src.lib.utils.lazycache import lazyload
-from src.models.response import DataResponse
+from src.models.simulation_transaction import TransactionsAnalysis
+from src.lib.analytics.materialized import load_analytics, summarize_scope
 
 
-async def analyze_transaction_history(df: pd.DataFrame, accounts_df: pd.DataFrame, extract = [], filter_transactions = lambda df: df):
-    fraud_df = detect_fraud(df, accounts_df)
-    df[['fraud_score', 'fraud', 'week_day']] = fraud_df[['fraud_score', 'fraud', 'week_day']]
-    df['hour'] = fraud_df['hour'].astype('str')
-    df[extract] = fraud_df[extract]
+async def analyze_transaction_history(simulation_id: str, db: Database, scope: dict = None):
+    """
+        Describe the transactions of a simulation, or of one account or user in it
 
-    df = filter_transactions(df)
-    numerical_columns = ['amount', 'balance', 'time', 'latitude', 'longitude', 'fraud_score']
-    numerical = df[numerical_columns].describe().drop(index=['count']).to_dict(orient='index')
-    
-    categorical_columns = ['channel', 'category', 'type', 'fraud', 'hour']
-    categorical = df[categorical_columns].describe().drop(index=['count']).to_dict(orient='index')
+        @param simulation_id: The id of the simulation
+        @param db: The database
+        @param scope: An account, as its account_no and bank_name, or a user, as their bvn. None is the whole simulation
 
-    columns = ['channel', 'category', 'week_day', 'fraud', 'hour']
-    volumns = {c: get_cashflow(df, c).to_dict(orient='records') for c in columns}
+        @return: The analysis of the transactions
+    """
+    # The whole simulation is summarised once, when its analytics are built
+    if not scope:
+        return TransactionsAnalysis(**(await load_analytics(simulation_id, db))['summary'])
 
-    proportions = {c: df[c].value_counts(normalize=True).to_frame().to_dict(orient='index') for c in columns}
-    return TransactionsAnalysis(numerical=numerical, categorical=categorical, volumns=volumns, proportions=proportions)
+    # A scope only scores its own transactions, and is summarised where they are stored
+    return TransactionsAnalysis(**(await summarize_scope(simulation_id, db, scope)))
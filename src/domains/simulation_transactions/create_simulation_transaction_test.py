@@ -47,7 +47,14 @@ class TestCreateSimulationTransctionEndpoint(TestFixture):
         assert 'message' in response_data
         assert response_data['message'] == 'Transaction created successfully'
 
-    
+        features = response_data['data']['features']
+        assert 'fraud_score' in features
+        holder_state = await test_db.simulation_features.find_one({
+            'simulation_id': simulation['_id'], 'scope': 'holder', 'key': f"{holder_account['account_no']}:{holder_account['bank_name']}"
+        })
+        assert holder_state['counters'][f"count|related|{related_account['account_no']}"] == features['holder_related_count_frequency']
+
+
     async def test_create_simulation_transaction_insufficient(self, async_client: AsyncClient, test_db: Database, test_cache: Redis):
         await self._set_up(test_db)
         simulation = await self._create_simulation(test_db, test_cache)
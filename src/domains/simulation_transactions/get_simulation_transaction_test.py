@@ -18,6 +18,10 @@ class TestGetSimulationTransactionEndpoint(TestFixture):
 
         assert data['data']['_id'] == str(transaction['_id'])
 
+        # Transactions are scored with the detectors fitted when the simulation was saved
+        assert await test_db['simulation_models.files'].find_one({'_id': simulation['_id']}) is not None
+        assert 'fraud_score' in data['data']['features']
+
     
     async def test_get_simulation_transaction_not_found(self, async_client: AsyncClient, test_db):
         await self._set_up(test_db)
@@ -1,41 +1,38 @@
 
+from bson import ObjectId
 from pymongo.database import Database
-from pandas import DataFrame
 from pymongo import DESCENDING
 
-from src.models.simulation_transaction import InitiateSimulationTransaction, SimulationTransaction
-from src.lib.analytics.extractor import extract_account_features, extract_frequency_features, extract_money_features, extract_time_features, extract_location_features, extract_bounds, extract_holder_bvn_occurance, extract_holder_occurance, extract_related_bvn_occurance, extract_related_occurance, extract_rolling_averages
-from src.lib.analytics.anomalizer import check_unusual, detect_fraud
+from src.models.simulation_transaction import SimulationTransaction
+from src.lib.analytics.feature_store import TRANSACTION_FIELDS, FeatureStore, feature_frame, load_feature_store
+from src.lib.analytics.registry import load_fraud_model
+from src.lib.analytics.anomalizer import score_fraud
 
 
-async def hound_transaction(transaction: SimulationTransaction, db: Database):
+async def hound_transaction(transaction: SimulationTransaction, db: Database, features: dict = None):
     simulation_transaction_collection = db.simulation_transactions
     simulation_account_collection = db.simulation_accounts
 
-    accounts = await simulation_account_collection.find({'simulation_id': transaction.simulation_id}).to_list()
-
-    base_query = {'simulation_id': transaction.simulation_id, 'time': {'$lte': transaction.time}}
-
-    holder_history = await simulation_transaction_collection.find({
-        **base_query, 'holder': transaction.holder, 'holder_bank': transaction.holder_bank
-    }).sort({'time': DESCENDING}).to_list(length=1000)
-
-    related_history = await simulation_transaction_collection.find({
-        **base_query, 'related': transaction.related, 'related_bank': transaction.related_bank
-    }).sort({'time': DESCENDING}).to_list(length=1000)
-
-    public_history = await simulation_transaction_collection.find({
-        **base_query, 
-        '$nor': [
-            {'holder': transaction.holder, 'holder_bank': transaction.holder_bank},
-            {'related': transaction.related, 'related_bank': transaction.related_bank},
-        ]
-    }).sort({'time': DESCENDING}).to_list(length=1000)
-
-    history = holder_history + related_history + public_history + [transaction.model_dump()]
-
-    df = DataFrame(history).sort_values(by='time', ascending=False)
-    accounts_df = DataFrame(accounts)
-    fraud_df = detect_fraud(df, accounts_df)
-    return fraud_df.to_dict(orient='records')[0]
-
+    transaction_data = transaction.model_dump(include=set(TRANSACTION_FIELDS))
+
+    # Transactions saved before the feature store read their features from the current feature states
+    if features is None:
+        holder_account = await simulation_account_collection.find_one({'simulation_id': transaction.simulation_id, 'account_no': transaction.holder, 'bank_name': transaction.holder_bank})
+        related_account = await simulation_account_collection.find_one({'simulation_id': transaction.simulation_id, 'account_no': transaction.related, 'bank_name': transaction.related_bank})
+        scopes = FeatureStore.scopes(transaction_data, holder_account, related_account)
+        store = await load_feature_store(transaction.simulation_id, list(scopes.values()), db)
+        features = store.features(transaction_data, holder_account, related_account)
+
+    model = await load_fraud_model(transaction.simulation_id, db)
+    population = []
+
+    # Without a fitted model, score against the latest precomputed feature vectors of the simulation
+    if model is None:
+        projection = {name: 1 for name in TRANSACTION_FIELDS} | {'_id': 0, 'features': 1}
+        population = await simulation_transaction_collection.find({
+            'simulation_id': transaction.simulation_id, 'features': {'$exists': True}, '_id': {'$ne': ObjectId(transaction.id)}
+        }, projection).sort({'time': DESCENDING}).to_list(length=1000)
+
+    df = feature_frame([*population, {**transaction_data, 'features': features}])
+    fraud_df = score_fraud(df, model)
+    return fraud_df.to_dict(orient='records')[-1]
@@ -3,7 +3,8 @@ from pymongo.database import Database
 from redis.asyncio import Redis
 
 from src.models.simulation_account import SimulationAccount
-from src.domains.simulation_transactions.hound_transaction import hound_transaction
+from src.lib.analytics.feature_store import load_transaction_features, track_transaction
+from src.lib.analytics.materialized import drop_analytics
 from src.domains.simulation_transactions.get_simulation_transaction import get_simulation_transaction
 from src.models.simulation_transaction import CreateSimulationTransaction, InitiateSimulationTransaction, SimulationTransaction
 
@@ -31,8 +32,13 @@ async def debit_account(holder_account: SimulationAccount, related_account: Simu
         reference=reference
     )
 
-    transaction_data = transaction.model_dump()    
+    transaction_data = transaction.model_dump()
+    store, transaction_data['features'] = await load_transaction_features(transaction_data, holder_account, related_account, db)
     insert = await simulation_transaction_collection.insert_one(transaction_data)
+
+    # Only a stored transaction is counted in the feature states
+    await track_transaction(store, transaction_data, holder_account, related_account, db)
+    await drop_analytics(transaction_data['simulation_id'], db)
     await simulation_account_collection.update_one({'account_no': holder_account['account_no'], 'bank_name': holder_account['bank_name']}, {'$set': {'balance': balance}})
 
     inserted_transaction = await get_simulation_transaction(insert.inserted_id, db, cache)
@@ -59,7 +65,13 @@ async def credit_account(holder_account: SimulationAccount, related_account: Sim
         reference=reference
     )
 
-    insert = await simulation_transaction_collection.insert_one(transaction.model_dump())
+    transaction_data = transaction.model_dump()
+    store, transaction_data['features'] = await load_transaction_features(transaction_data, holder_account, related_account, db)
+    insert = await simulation_transaction_collection.insert_one(transaction_data)
+
+    # Only a stored transaction is counted in the feature states
+    await track_transaction(store, transaction_data, holder_account, related_account, db)
+    await drop_analytics(transaction_data['simulation_id'], db)
     await simulation_account_collection.update_one({'account_no': holder_account['account_no'], 'bank_name': holder_account['bank_name']}, {'$set': {'balance': balance}})
 
     inserted_transaction = await get_simulation_transaction(insert.inserted_id, db, cache)
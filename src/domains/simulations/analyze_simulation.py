@@ -1,8 +1,6 @@
 from typing import Any
 
 
-from pandas import DataFrame
-from pymongo import DESCENDING
 from pymongo.database import Database
 from bson import ObjectId
 from redis.asyncio import Redis
@@ -15,11 +13,6 @@ from src.models.response import DataResponse
 
 async def analyze_simulation(id: ObjectId, db: Database, cache: Redis):
     await get_simulation(id, db, cache)
-    simulation_transaction_collection = db.simulation_transactions
-    simulation_account_collection = db.simulation_accounts
 
-    transactions = await simulation_transaction_collection.find({'simulation_id': str(id)}).sort({'time': DESCENDING}).to_list()
-    accounts = await simulation_account_collection.find({'simulation_id': str(id)}).to_list()
-
-    transaction_analysis = await analyze_transaction_history(DataFrame(transactions), DataFrame(accounts))
+    transaction_analysis = await analyze_transaction_history(str(id), db)
     return DataResponse[TransactionsAnalysis](data=transaction_analysis)
\ No newline at end of file
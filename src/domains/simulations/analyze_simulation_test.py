@@ -3,6 +3,8 @@ from pymongo.database import Database
 from bson import ObjectId
 import pytest
 
+from src.lib.analytics.materialized import score_documents, summarize_transactions
+from src.lib.analytics.registry import load_fraud_model
 from tests.fixture_spec import TestFixture
 
 
@@ -39,3 +41,63 @@ class TestAnalyzeSimulationEndpoint(TestFixture):
         get_resp = await async_client.get(f"/simulations/{simulation['_id']}/analyze", headers={'Authorization': f'Bearer {self.token}'})
         assert get_resp.status_code == 404
         assert get_resp.json()['message'] == f"Simulation not found: {simulation['_id']}"
+
+
+    async def test_analyze_simulation_reads_analytics_until_transactions_change(self, async_client: AsyncClient, test_db: Database, test_cache):
+        await self._set_up(test_db)
+        simulation = await self._create_simulation(test_db, test_cache)
+
+        # The analytics are built when the simulation completes
+        built = await test_db.simulation_analytics.files.find_one({'_id': simulation['_id']})
+        assert built is not None
+
+        get_resp = await async_client.get(f"/simulations/{simulation['_id']}/analyze", headers={'Authorization': f'Bearer {self.token}'})
+        assert get_resp.status_code == 200
+        assert (await test_db.simulation_analytics.files.find_one({'_id': simulation['_id']}))['metadata']['revision'] == built['metadata']['revision']
+
+        # A new transaction drops them, the next read builds them again
+        [holder_account, related_account] = await test_db.simulation_accounts.find({'simulation_id': simulation['_id'], 'balance': {'$gt': 1000}}).limit(2).to_list()
+        create_resp = await async_client.post('/simulation_transactions', json={
+            'amount': 1000,
+            'holder': holder_account['account_no'],
+            'holder_bank': holder_account['bank_name'],
+            'related': related_account['account_no'],
+            'related_bank': related_account['bank_name'],
+            'latitude': 9,
+            'longitude': 3,
+            'type': 'DEBIT',
+            'category': 'WITHDRAWAL',
+            'channel': 'APP',
+            'device': holder_account['opening_device'],
+            'simulation_id': simulation['_id']
+        }, headers={'Authorization': f'Bearer {self.token}'})
+        assert create_resp.status_code == 201
+        assert await test_db.simulation_analytics.files.find_one({'_id': simulation['_id']}) is None
+
+        get_resp = await async_client.get(f"/simulations/{simulation['_id']}/analyze", headers={'Authorization': f'Bearer {self.token}'})
+        assert get_resp.status_code == 200
+        rebuilt = await test_db.simulation_analytics.files.find_one({'_id': simulation['_id']})
+        assert rebuilt['metadata']['revision'] != built['metadata']['revision']
+
+
+    async def test_analyze_simulation_aggregates_stored_scores(self, async_client: AsyncClient, test_db: Database, test_cache):
+        await self._set_up(test_db)
+        simulation = await self._create_simulation(test_db, test_cache)
+
+        get_resp = await async_client.get(f"/simulations/{simulation['_id']}/analyze", headers={'Authorization': f'Bearer {self.token}'})
+        assert get_resp.status_code == 200
+        data = get_resp.json()['data']
+
+        # The scores are kept with the transactions, and summarised like the scored frame
+        transactions = await test_db.simulation_transactions.find({'simulation_id': simulation['_id']}).to_list()
+        assert all('scores' in transaction for transaction in transactions)
+        scored = score_documents(transactions, await load_fraud_model(simulation['_id'], test_db))
+        assert scored['fraud_score'].tolist() == [transaction['scores']['fraud_score'] for transaction in transactions]
+
+        expected = summarize_transactions(scored)
+        for statistic, fields in expected['numerical'].items():
+            assert data['numerical'][statistic] == pytest.approx(fields)
+        assert data['categorical']['unique'] == expected['categorical']['unique']
+        assert data['categorical']['freq'] == expected['categorical']['freq']
+        proportion = lambda proportions: {value: row['proportion'] for value, row in proportions.items()}
+        assert proportion(data['proportions']['channel']) == pytest.approx(proportion(expected['proportions']['channel']))
@@ -9,8 +9,9 @@ from src.models.simulation_transaction import TransactionsAnalysis
 from src.domains.simulations.analyze_simulation import analyze_simulation
 from src.domains.simulations.delete_simulation import delete_simulation
 from src.domains.simulations.get_simulation import get_simulation
+from src.domains.simulations.get_simulation_progress import get_simulation_progress
 from src.domains.simulations.list_simulations import list_simulations
-from src.models.simulation import CreateSimulation, Simulation, ListSimulations, UpdateSimulation
+from src.models.simulation import CreateSimulation, Simulation, ListSimulations, SimulationProgress, UpdateSimulation
 from src.domains.simulations.create_simulation import create_simulation
 from src.db.cache import get_cache
 from src.db.database import get_db
@@ -102,3 +103,17 @@ async def get(
     cache=Depends(get_cache),
 ) -> DataResponse[TransactionsAnalysis]:
     return await analyze_simulation(ObjectId(id), db, cache)
+
+
+@simulations_router.get(
+    '/{id}/progress', 
+    response_model=DataResponse[SimulationProgress], 
+    name="Get Simulation Progress"
+)
+async def get_progress(
+    id: str, 
+    user: CurrentUser = Depends(get_current_user),
+    db=Depends(get_db),
+    cache=Depends(get_cache),
+) -> DataResponse[SimulationProgress]:
+    return await get_simulation_progress(ObjectId(id), db, cache)
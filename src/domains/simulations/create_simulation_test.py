@@ -1,6 +1,7 @@
 from httpx import AsyncClient
 from pymongo.database import Database
 import pytest
+from bson import ObjectId
 
 from src.models.user import User
 from tests.fixture_spec import TestFixture
@@ -109,3 +110,18 @@ class TestSimulateTransactionsEndpoint(TestFixture):
         
         assert create_response.status_code == 422
         assert create_response.json()['message'] == '\'num_banks\': Field required'
+
+
+    async def test_create_simulation_reuses_matching_dataset(self, test_db: Database, test_cache):
+        await self._set_up(test_db)
+        first = await self._create_simulation(test_db, test_cache)
+        second = await self._create_simulation(test_db, test_cache)
+
+        # The second simulation has the settings of the first, so it is cloned instead of simulated
+        references = lambda simulation: test_db.simulation_transactions.distinct('reference', {'simulation_id': simulation['_id']})
+        assert sorted(await references(second)) == sorted(await references(first))
+        assert await test_db.simulation_accounts.count_documents({'simulation_id': second['_id']}) == await test_db.simulation_accounts.count_documents({'simulation_id': first['_id']})
+
+        entry = await test_db.simulation_datasets.find_one({'simulation_id': first['_id']})
+        assert entry['uses'] == 1
+        assert (await test_db.simulations.find_one({'_id': ObjectId(second['_id'])}))['status'] == 'COMPLETE'
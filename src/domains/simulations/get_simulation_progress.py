@@ -0,0 +1,20 @@
+import json
+from pymongo.database import Database
+from bson import ObjectId
+from redis.asyncio import Redis
+
+from src.domains.simulations.get_simulation import get_simulation
+from src.models.simulation import SimulationProgress
+from src.models.response import DataResponse
+
+
+async def get_simulation_progress(id: ObjectId, db: Database, cache: Redis):
+    await get_simulation(id, db, cache)
+
+    # Running simulations report to the cache, the document keeps the last report
+    progress = await cache.get(f'simulation:{id}:progress')
+    if progress is not None:
+        return DataResponse(data=SimulationProgress(**json.loads(progress)))
+
+    simulation = await db.simulations.find_one({'_id': id}, {'progress': 1})
+    return DataResponse(data=SimulationProgress(**(simulation or {}).get('progress', {})))
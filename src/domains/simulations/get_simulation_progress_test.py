@@ -0,0 +1,39 @@
+from httpx import AsyncClient
+from pymongo.database import Database
+from bson import ObjectId
+import pytest
+
+from tests.fixture_spec import TestFixture
+
+
+@pytest.mark.asyncio
+class TestGetSimulationProgressEndpoint(TestFixture):
+    async def test_get_simulation_progress_success(self, async_client: AsyncClient, test_db: Database, test_cache):
+        await self._set_up(test_db)
+        simulation = await self._create_simulation(test_db, test_cache)
+
+        get_resp = await async_client.get(f"/simulations/{simulation['_id']}/progress", headers={'Authorization': f'Bearer {self.token}'})
+        assert get_resp.status_code == 200
+        data = get_resp.json()
+        assert data['data']['stage'] == 'COMPLETE'
+        assert data['data']['progress'] == 1
+        assert data['data']['ledger']['accounts'] > 0
+
+
+    async def test_get_simulation_progress_from_document(self, async_client: AsyncClient, test_db: Database, test_cache):
+        await self._set_up(test_db)
+        simulation = await self._create_simulation(test_db, test_cache)
+
+        # The document keeps the last report once the cached one expires
+        await test_cache.delete(f"simulation:{simulation['_id']}:progress")
+        get_resp = await async_client.get(f"/simulations/{simulation['_id']}/progress", headers={'Authorization': f'Bearer {self.token}'})
+        assert get_resp.status_code == 200
+        assert get_resp.json()['data']['stage'] == 'COMPLETE'
+
+
+    async def test_get_simulation_progress_not_found(self, async_client: AsyncClient, test_db):
+        await self._set_up(test_db)
+        missing_id = str(ObjectId())
+        get_resp = await async_client.get(f'/simulations/{missing_id}/progress', headers={'Authorization': f'Bearer {self.token}'})
+        assert get_resp.status_code == 404
+        assert get_resp.json()['message'] == f'Simulation not found: {missing_id}'
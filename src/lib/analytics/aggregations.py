@@ -0,0 +1,171 @@
+import asyncio
+import math
+from pymongo import ASCENDING
+from pymongo.database import Database
+
+# The numeric fields summarised like DataFrame.describe, by the name the analysis gives them
+NUMERIC_FIELDS = {
+    'amount': 'amount',
+    'balance': 'balance',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+    'fraud_score': 'scores.fraud_score',
+}
+
+# The fields transactions are grouped by, the hour is described as text like the scored frame keeps it
+GROUP_FIELDS = {
+    'channel': '$channel',
+    'category': '$category',
+    'type': '$type',
+    'week_day': '$features.week_day',
+    'fraud': '$scores.fraud',
+    'hour': {'$toString': '$features.hour'},
+}
+
+CATEGORICAL_GROUPS = ['channel', 'category', 'type', 'fraud', 'hour']
+CASHFLOW_GROUPS = ['channel', 'category', 'week_day', 'fraud', 'hour']
+QUARTILES = {'25%': .25, '50%': .5, '75%': .75}
+
+
+def summary_pipeline(query: dict) -> list:
+    """
+        Build the pipeline that summarises transactions in one pass
+
+        @param query: The transactions to summarise
+
+        @return: The stages, a facet of the numeric moments and of the amount and count of every group and type
+    """
+    moments = {'_id': None}
+    for name, field in NUMERIC_FIELDS.items():
+        moments[f'{name}|count'] = {'$sum': {'$cond': [{'$isNumber': f'${field}'}, 1, 0]}}
+        moments[f'{name}|mean'] = {'$avg': f'${field}'}
+        moments[f'{name}|std'] = {'$stdDevSamp': f'${field}'}
+        moments[f'{name}|min'] = {'$min': f'${field}'}
+        moments[f'{name}|max'] = {'$max': f'${field}'}
+
+    groups = {
+        name: [{'$group': {'_id': {'value': expression, 'type': '$type'}, 'amount': {'$sum': '$amount'}, 'count': {'$sum': 1}}}]
+        for name, expression in GROUP_FIELDS.items()
+    }
+
+    return [{'$match': query}, {'$facet': {'moments': [{'$group': moments}], **groups}}]
+
+
+def interpolate(low: float, high: float, fraction: float) -> float:
+    # Linear interpolation between neighbouring values, computed the way numpy.quantile does
+    if low == high:
+        return low
+    return high - (high - low) * (1 - fraction) if fraction >= .5 else low + (high - low) * fraction
+
+
+async def quartiles(query: dict, field: str, count: int, db: Database) -> dict:
+    """
+        Get the quartiles of a numeric field, reading only the values around each one
+
+        @param query: The transactions to summarise
+        @param field: The field
+        @param count: The number of numeric values of the field
+        @param db: The database
+
+        @return: The quartiles, keyed like DataFrame.describe
+    """
+    async def quartile(q: float) -> float:
+        # Sorting on an index of the field leaves the values to skip in the index
+        position = q * (count - 1)
+        low = math.floor(position)
+        cursor = db.simulation_transactions.find({**query, field: {'$type': 'number'}}, {field: 1, '_id': 0}).sort(field, ASCENDING).skip(low).limit(2)
+        values = [document_value(document, field) for document in await cursor.to_list(2)]
+        return interpolate(values[0], values[-1], position - low)
+
+    values = await asyncio.gather(*[quartile(q) for q in QUARTILES.values()])
+    return dict(zip(QUARTILES, values))
+
+
+def document_value(document: dict, field: str):
+    # Read a dotted field of a document
+    for part in field.split('.'):
+        document = document[part]
+    return document
+
+
+def cashflow(name: str, rows: list) -> list:
+    """
+        Shape the grouped amounts of a field like engineer.get_cashflow
+
+        @param name: The field the transactions are grouped by
+        @param rows: The amount and count of every value and type
+
+        @return: The amount of every value and type by amount, then the netflow of every value
+    """
+    flows = sorted(rows, key=lambda row: row['amount'], reverse=True)
+    records = [{name: row['_id']['value'], 'type': row['_id']['type'], 'amount': row['amount']} for row in flows]
+
+    netflows = {}
+    for row in rows:
+        sign = {'CREDIT': 1, 'DEBIT': -1}.get(row['_id']['type'], 0)
+        netflows[row['_id']['value']] = netflows.get(row['_id']['value'], 0) + sign * row['amount']
+
+    return records + [{name: value, 'type': 'NETFLOW', 'amount': netflows[value]} for value in sorted(netflows)]
+
+
+def counts(rows: list) -> dict:
+    # The number of transactions of every value of a field, most common first
+    totals = {}
+    for row in rows:
+        totals[row['_id']['value']] = totals.get(row['_id']['value'], 0) + row['count']
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def describe(facets: dict, quantiles: dict) -> dict:
+    """
+        Shape the aggregates of transactions like summarize_transactions
+
+        @param facets: The result of the summary pipeline
+        @param quantiles: The quartiles of every numeric field with values
+
+        @return: The numerical and categorical descriptions, cashflows and proportions
+    """
+    moments = facets['moments'][0] if facets['moments'] else {}
+
+    numerical = {statistic: {} for statistic in ['mean', 'std', 'min', *QUARTILES, 'max']}
+    for name, quantile in quantiles.items():
+        for statistic in ['mean', 'std', 'min', 'max']:
+            value = moments[f'{name}|{statistic}']
+            numerical[statistic][name] = value if value is not None else math.nan
+        for statistic, value in quantile.items():
+            numerical[statistic][name] = value
+
+    categorical = {'unique': {}, 'top': {}, 'freq': {}}
+    for name in CATEGORICAL_GROUPS:
+        totals = counts(facets[name])
+        categorical['unique'][name] = len(totals)
+        categorical['top'][name] = next(iter(totals), math.nan)
+        categorical['freq'][name] = next(iter(totals.values()), math.nan)
+
+    volumns = {name: cashflow(name, facets[name]) for name in CASHFLOW_GROUPS}
+
+    proportions = {}
+    for name in CASHFLOW_GROUPS:
+        totals = counts(facets[name])
+        proportions[name] = {value: {'proportion': count / sum(totals.values())} for value, count in totals.items()}
+
+    return {'numerical': numerical, 'categorical': categorical, 'volumns': volumns, 'proportions': proportions}
+
+
+async def aggregate_summary(query: dict, db: Database) -> dict:
+    """
+        Summarise transactions in the database, only the aggregates cross the network
+
+        @param query: The transactions to summarise, with their scores
+        @param db: The database
+
+        @return: The numerical and categorical descriptions, cashflows and proportions, as summarize_transactions gives them
+    """
+    [facets] = await db.simulation_transactions.aggregate(summary_pipeline(query), allowDiskUse=True).to_list(1)
+    moments = facets['moments'][0] if facets['moments'] else {}
+
+    # Fields without values are left out, like describe leaves out columns that are not numeric
+    fields = {name: field for name, field in NUMERIC_FIELDS.items() if moments.get(f'{name}|count')}
+    quantiles = await asyncio.gather(*[quartiles(query, field, moments[f'{name}|count'], db) for name, field in fields.items()])
+
+    return describe(facets, dict(zip(fields, quantiles)))
@@ -0,0 +1,66 @@
+import math
+import numpy as np
+import pandas as pd
+
+from src.lib.analytics.aggregations import GROUP_FIELDS, NUMERIC_FIELDS, QUARTILES, describe, interpolate
+from src.lib.analytics.materialized import score_documents, summarize_transactions
+from src.lib.analytics.materialized_test import stored_transactions
+
+
+def pipeline_facets(df: pd.DataFrame) -> dict:
+    # What the summary pipeline gives for scored transactions, grouped the way mongo groups them
+    moments = {'_id': None}
+    for name in NUMERIC_FIELDS:
+        values = df[name]
+        moments.update({f'{name}|count': len(values), f'{name}|mean': values.mean(), f'{name}|std': values.std(), f'{name}|min': values.min(), f'{name}|max': values.max()})
+
+    facets = {'moments': [moments]}
+    for name in GROUP_FIELDS:
+        grouped = df.assign(value=df[name]).groupby(['value', 'type'], sort=False)['amount'].agg(['sum', 'count']).reset_index()
+        facets[name] = [{'_id': {'value': row['value'], 'type': row['type']}, 'amount': row['sum'], 'count': row['count']} for row in grouped.to_dict(orient='records')]
+    return facets
+
+
+def sorted_quartiles(values: pd.Series) -> dict:
+    # The quartiles read off the two sorted values around each position
+    values = np.sort(values.to_numpy())
+    quartiles = {}
+    for statistic, q in QUARTILES.items():
+        position = q * (len(values) - 1)
+        low = math.floor(position)
+        quartiles[statistic] = interpolate(values[low], values[min(low + 1, len(values) - 1)], position - low)
+    return quartiles
+
+
+def test_interpolated_quartiles_match_numpy():
+    values = pd.Series(np.random.default_rng(4).lognormal(8, 2, 1001))
+
+    for size in [1, 2, 5, 1001]:
+        quartiles = sorted_quartiles(values[:size])
+        assert list(quartiles.values()) == np.quantile(values[:size], list(QUARTILES.values())).tolist()
+
+
+def test_aggregates_describe_like_the_scored_frame():
+    documents, model = stored_transactions(1_500, 50)
+    scored = score_documents(documents, model)
+
+    summary = describe(pipeline_facets(scored), {name: sorted_quartiles(scored[name]) for name in NUMERIC_FIELDS})
+    expected = summarize_transactions(scored)
+
+    for statistic, fields in expected['numerical'].items():
+        assert summary['numerical'][statistic] == {name: float(value) for name, value in fields.items()}
+
+    # Values as common as the top one may be reported in either order
+    assert summary['categorical']['unique'] == expected['categorical']['unique']
+    assert summary['categorical']['freq'] == expected['categorical']['freq']
+    for name, top in summary['categorical']['top'].items():
+        assert (scored[name] == top).sum() == expected['categorical']['freq'][name]
+
+    for name, flows in expected['volumns'].items():
+        key = lambda row: (row['type'], str(row[name]))
+        assert sorted(summary['volumns'][name], key=key) == sorted(flows, key=key)
+        assert [row['amount'] for row in summary['volumns'][name]] == [row['amount'] for row in flows]
+
+    for name, proportions in expected['proportions'].items():
+        assert summary['proportions'][name] == proportions
+        assert list(summary['proportions'][name].values()) == list(proportions.values())
@@ -1,5 +1,5 @@
 import pandas as pd
-from sklearn.preprocessing import RobustScaler
+from sklearn.preprocessing import LabelEncoder, RobustScaler
 from sklearn.ensemble import IsolationForest
 
 from src.lib.analytics import engineer, extractor
@@ -41,51 +41,56 @@ def anomalize(df: pd.DataFrame, name, columns=[]):
     return df
 
 
-def unsual_amount(df):
-    # detect unsual amounts
-    columns = [
+# The columns each detector flags unsual transactions on, in the order they run
+DETECTORS = {
+    'unsual_amount': [
         'large_amount', 'large_amount_drain', 'large_amount_pump', 
         'holder_amount_bound_frequency', 
         'holder_large_amount_drain_True_occurance', 'holder_large_amount_pump_True_occurance', 
         'holder_amount_avg_30D'
-    ]
-    return anomalize(df, 'unsual_amount', columns)
-
-
-def unsual_balance(df):
-    # detect unsual balances
-    columns = [
+    ],
+    'unsual_balance': [
         'balance_jump_rate', 'balance_jump_rate_absolute', 'drained_balance', 'pumped_balance', 
         'holder_balance_jump_bound_frequency', 'holder_balance_jump_rate_bound_frequency', 
         'holder_drained_balance_True_occurance', 'holder_pumped_balance_True_occurance', 
         'holder_balance_avg_30D'
-    ]
-    return anomalize(df, 'unsual_balance', columns)
-
-
-def unsual_location(df):
-    # detect unsual locations
-    columns = [
+    ],
+    'unsual_location': [
         'distance_from_home (km)', 
         'far_distance',
         'holder_far_distance_True_occurance',
         'holder_distance_from_home (km)_avg_30D'
-    ]
-    return anomalize(df, 'unsual_location', columns)
+    ],
+    'unsual_time': [
+        'holder_hour_bound_frequency', 'holder_holder_hour_bound_frequency_avg_30D'
+    ],
+    'unsual_device': ['holder_device_count_frequency', 'holder_device_has_history', 'is_opening_device', 'holder_holder_device_count_frequency_avg_30D'],
+}
+
+
+def unsual_amount(df):
+    # detect unsual amounts
+    return anomalize(df, 'unsual_amount', DETECTORS['unsual_amount'])
+
+
+def unsual_balance(df):
+    # detect unsual balances
+    return anomalize(df, 'unsual_balance', DETECTORS['unsual_balance'])
+
+
+def unsual_location(df):
+    # detect unsual locations
+    return anomalize(df, 'unsual_location', DETECTORS['unsual_location'])
 
 
 def unsual_device(df):
     # detect unsual devices
-    columns = ['holder_device_count_frequency', 'holder_device_has_history', 'is_opening_device', 'holder_holder_device_count_frequency_avg_30D']
-    return anomalize(df, 'unsual_device', columns)
+    return anomalize(df, 'unsual_device', DETECTORS['unsual_device'])
 
 
 def unsual_time(df):
     # detect unsual time
-    columns = [
-        'holder_hour_bound_frequency', 'holder_holder_hour_bound_frequency_avg_30D'
-    ]
-    return anomalize(df, 'unsual_time', columns)
+    return anomalize(df, 'unsual_time', DETECTORS['unsual_time'])
 
 
 def check_unusual(df: pd.DataFrame):
@@ -108,6 +113,142 @@ def check_unusual(df: pd.DataFrame):
     return anomalize(df_unsual, 'fraud')
 
 
+def kind(values: pd.Series) -> str:
+    # The kind of values of a column, integers and floats are both numbers
+    inferred = pd.api.types.infer_dtype(values, skipna=True)
+    return 'number' if inferred in ['integer', 'floating', 'mixed-integer-float', 'decimal'] else inferred
+
+
+# The columns that identify transactions, parties and simulations, new transactions bring values never seen while fitting
+IDENTIFIERS = ['reference', 'simulation_id', 'holder', 'related', 'device', 'holder_bvn', 'related_bvn']
+
+
+class FraudModel:
+    """
+        The fraud detectors of a simulation, fitted once and reused to score transactions
+    """
+
+    def __init__(self, random_state: int = 42):
+        """
+            Initialize an unfitted fraud model
+
+            @param random_state: The seed of the isolation forests
+        """
+        self.random_state = random_state
+        self.columns = []
+        self.kinds = {}
+        self.encoders = {}
+        self.codes = {}
+        self.scaler = None
+        self.detectors = {}
+
+
+    def prepare(self, df: pd.DataFrame, fit: bool = False) -> pd.DataFrame:
+        """
+            Encode and scale transactions the way the detectors were fitted
+
+            @param df: The transactions with their engineered features
+            @param fit: Whether to fit the encoders and scaler on these transactions
+
+            returns pd.DataFrame
+        """
+        if fit:
+            # check_unusual collapses time to a single value and identifiers say who, not how, so neither carries signal
+            self.columns = [c for c in df.columns if c != 'time' and c not in IDENTIFIERS]
+            self.kinds = {c: kind(df[c]) for c in self.columns}
+            discrete_features = df[self.columns].select_dtypes(exclude=['number']).columns.tolist()
+            self.encoders = {c: LabelEncoder().fit(df[c]) for c in discrete_features}
+            self.codes = {c: {label: code for code, label in enumerate(encoder.classes_)} for c, encoder in self.encoders.items()}
+        else:
+            self.check(df)
+
+        df = df.reindex(columns=self.columns)
+
+        # Labels that were not seen while fitting are encoded as -1
+        for column, codes in self.codes.items():
+            df[column] = df[column].map(codes).fillna(-1)
+        df = df.fillna(0)
+
+        if fit:
+            self.scaler = RobustScaler().fit(df)
+
+        return pd.DataFrame(self.scaler.transform(df), columns=self.columns)
+
+
+    def check(self, df: pd.DataFrame):
+        """
+            Check transactions carry the features the detectors were fitted on, with values of the same kind.
+            Stored and batch features are engineered differently, so a model only scores the kind it was fitted on
+
+            @param df: The transactions with their engineered features
+        """
+        missing = [c for c in self.columns if c not in df.columns]
+        if missing:
+            raise ValueError(f'The transactions are missing the features {missing}')
+
+        mismatched = [c for c, expected in self.kinds.items() if kind(df[c]) not in [expected, 'empty']]
+        if mismatched:
+            raise ValueError(f'The features {mismatched} are not of the kind the detectors were fitted on')
+
+
+    def detect(self, df: pd.DataFrame, name: str) -> pd.DataFrame:
+        """
+            Flag and score anomalies with a fitted detector
+
+            @param df: The prepared transactions
+            @param name: The name of the detector
+
+            returns pd.DataFrame
+        """
+        detector = self.detectors[name]
+        data = df[detector['columns']]
+
+        # IsolationForest.predict flags the negative decision scores, reuse them instead of scoring twice
+        scores = detector['model'].decision_function(data)
+
+        # Normalize the score against the scores seen while fitting
+        df[f'{name}_score'] = ((detector['max'] - scores) / (detector['max'] - detector['min'])).clip(0, 1)
+        df[name] = scores < 0
+        return df
+
+
+    def fit(self, df: pd.DataFrame):
+        """
+            Fit the encoders, scaler and detectors on the transactions of a simulation
+
+            @param df: The transactions with their engineered features
+
+            returns FraudModel
+        """
+        data = self.prepare(df, fit=True)
+
+        # The fraud detector runs last, over every column including the other detectors' output
+        for name, columns in [*DETECTORS.items(), ('fraud', None)]:
+            columns = data.columns.tolist() if columns is None else columns
+            model = IsolationForest(random_state=self.random_state).fit(data[columns])
+            scores = model.decision_function(data[columns])
+
+            self.detectors[name] = {'model': model, 'columns': columns, 'max': scores.max(), 'min': scores.min()}
+            data = self.detect(data, name)
+
+        return self
+
+
+    def score(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+            Flag and score transactions with the fitted detectors
+
+            @param df: The transactions with their engineered features
+
+            returns pd.DataFrame
+        """
+        data = self.prepare(df)
+        for name in self.detectors:
+            data = self.detect(data, name)
+
+        return data
+
+
 def detect_fraud(df: pd.DataFrame, accounts_df: pd.DataFrame):
     """
         Analyze the dataframe and plot the results
@@ -117,21 +258,22 @@ def detect_fraud(df: pd.DataFrame, accounts_df: pd.DataFrame):
 
         returns pd.DataFrame
     """
-    df = df.apply(lambda row: extractor.extract_account_features(row, accounts_df), axis=1)
-    df = df.apply(extractor.extract_time_features, axis=1)
-    df = df.apply(extractor.extract_money_features, axis=1)
-    df = df.apply(lambda row: extractor.extract_location_features(df, row), axis=1)
-    df = df.apply(lambda row: extractor.extract_frequency_features(df, row), axis=1)
-    df = extractor.extract_bounds(df, 'holder')
-    df = extractor.extract_holder_occurance(df)
-    df = extractor.extract_holder_bvn_occurance(df)
-    df = extractor.extract_related_occurance(df)
-    df = extractor.extract_related_bvn_occurance(df)
-    df = extractor.extract_rolling_averages(df)
-
-    fraud_df = check_unusual(df.copy())
+    # The fitted models learn the stored features, so batch features always fit their own detectors
+    df = extractor.extract_features(df, accounts_df)
+    return score_fraud(df)
+
+
+def score_fraud(df: pd.DataFrame, model: FraudModel = None):
+    """
+        Score engineered transactions for fraud
+
+        @param df: The transactions with their engineered features
+        @param model: The fitted fraud model of the simulation, detectors are fitted on df when missing
+
+        returns pd.DataFrame
+    """
+    fraud_df = model.score(df) if model is not None else check_unusual(df.copy())
     columns = [c for c in fraud_df.columns if c not in df.columns]
-    df[columns] = fraud_df[columns]
+    df[columns] = fraud_df[columns].set_axis(df.index)
 
     return df
-
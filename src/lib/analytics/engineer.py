@@ -1,7 +1,7 @@
 import pandas as pd
 from sklearn.preprocessing import LabelEncoder
 
-from .tracker import distance
+from .tracker import haversine
 
 
 def encoder(df, features):
@@ -19,9 +19,10 @@ def encoder(df, features):
     return feature_df
 
 
-def count_related(df: pd.DataFrame, transaction, target, feature):
-    # Count the frequency of relations between target and feature
-    return len(df[(df[target] == transaction[target]) & (df[feature] == transaction[feature])])
+def count_related(df: pd.DataFrame, target: list, feature):
+    # Count, for every row, the rows sharing its target and feature values
+    keys = [*target, feature]
+    return df.groupby(keys)[feature].transform('size').fillna(0).astype(int)
 
 
 def get_cashflow(df: pd.DataFrame, group):
@@ -34,19 +35,14 @@ def get_cashflow(df: pd.DataFrame, group):
     # Find groups with the highest volumn of transacionts
     cash_flow = df.groupby([group, 'type'])['amount'].sum().sort_values(ascending=False).to_frame().reset_index()
 
-    # Get the netflow for each group
-    cash_flow_pivot = cash_flow.pivot_table(index=group, columns='type', values='amount', aggfunc='sum').reset_index()
-
-    cash_flow_pivot['DEBIT'] = 0 if 'DEBIT' not in cash_flow_pivot.columns else cash_flow_pivot['DEBIT']
-    cash_flow_pivot['CREDIT'] = 0 if 'CREDIT' not in cash_flow_pivot.columns else cash_flow_pivot['CREDIT']
-    
-    cash_flow_pivot['NETFLOW'] = cash_flow_pivot['CREDIT'] - cash_flow_pivot['DEBIT']
+    # Get the netflow for each group, a group without credits or debits has none of them
+    cash_flow_pivot = cash_flow.pivot_table(index=group, columns='type', values='amount', aggfunc='sum', fill_value=0)
+    none = pd.Series(0, index=cash_flow_pivot.index)
+    netflow = cash_flow_pivot.get('CREDIT', none) - cash_flow_pivot.get('DEBIT', none)
 
     # Add the netflow for each group
-    for netflow in cash_flow_pivot[[group, 'NETFLOW']].itertuples(index=False):
-        cash_flow = pd.concat([cash_flow, pd.DataFrame({group: [netflow[0]], 'type': 'NETFLOW', 'amount': [netflow.NETFLOW]})], ignore_index=True)
-
-    return cash_flow
+    netflows = pd.DataFrame({group: netflow.index, 'type': 'NETFLOW', 'amount': netflow.to_numpy()})
+    return pd.concat([cash_flow, netflows], ignore_index=True)
 
 
 def bound_relation(df: pd.DataFrame, transaction, target, feature):
@@ -67,6 +63,25 @@ def count_occurrence(df: pd.DataFrame, transaction, target, feature, value):
     return len(df[(df[target] == transaction[target]) & (df[feature] == value)])
 
 
+def prior_counts(df: pd.DataFrame, keys: list, mask: pd.Series = None) -> pd.Series:
+    """
+        Count, for every row, the earlier rows sharing its keys in one grouped sweep
+
+        @param df: The dataframe, in chronological order
+        @param keys: The columns to match
+        @param mask: The rows to count, rows outside it get 0
+
+        @return: The number of earlier matching rows of every row
+    """
+    groups = [df[key] for key in keys]
+    if mask is None:
+        return df.groupby(groups, dropna=False, sort=False).cumcount()
+
+    counted = mask.astype(int)
+    prior = counted.groupby(groups, dropna=False, sort=False).cumsum() - counted
+    return prior.where(mask, 0)
+
+
 def get_occurrence_count(df: pd.DataFrame, target, features):
     """
         Get the occurance count for a feature with a specified value
@@ -79,34 +94,10 @@ def get_occurrence_count(df: pd.DataFrame, target, features):
     # Copy the dataframe
     df = df.sort_values(by='time').copy()
 
-    # Extract the required columns
-    data = df[[target, *[x['name'] for x in features]]]
-    
-    # Initialize the counter and store
-    counts_dict = {feat['name']: {} for feat in features}
-    results = {f"{target}_{feat['name']}_{feat['value']}_occurance": [] for feat in features}
-    
-    for idx, row in data.iterrows(): # For each row in dataframe
-        for feat in features: 
-            feat_name = feat['name']
-            feat_value = feat['value']
-            row_value = row[feat_name]
-            key = (row[target], row[feat_name]) # Set the store key
-
-            # Check if in bound
-            if row_value == feat_value:
-                # Get current count
-                count = counts_dict[feat_name].get(key, 0)
-                results[f"{target}_{feat_name}_{feat_value}_occurance"].append(count)
-                # Update count
-                counts_dict[feat_name][key] = count + 1
-            else:
-                # Out of bounds → count 0
-                results[f"{target}_{feat_name}_{feat_value}_occurance"].append(0)
-
-    # Add the counts to the dataframe
-    for col, vals in results.items():
-        df[col] = vals
+    # Count the earlier rows of the target with the value, for the rows that have it
+    for feat in features:
+        mask = df[feat['name']] == feat['value']
+        df[f"{target}_{feat['name']}_{feat['value']}_occurance"] = prior_counts(df, [target], mask)
 
     return df
 
@@ -130,15 +121,15 @@ def distance_from_last(df: pd.DataFrame, transaction, target):
     last_geo = (last_transaction['latitude'], last_transaction['longitude'])
     current_geo = (transaction['latitude'], transaction['longitude'])
 
-    return distance(*last_geo, *current_geo)
+    return haversine(*last_geo, *current_geo)
 
 
 def distance_from_home(df: pd.DataFrame, transaction, target):
-    # Get the distance from home of user
+    # Get the distance from home of user, transaction can be a single row or a whole frame
     home_geo = (transaction['central_latitude'], transaction['central_longitude'])
     current_geo = (transaction['latitude'], transaction['longitude'])
 
-    return distance(*home_geo, *current_geo)
+    return haversine(*home_geo, *current_geo)
 
 
 def central_location(df: pd.DataFrame, transaction, target):
@@ -163,36 +154,13 @@ def get_bound_relations_frequency(df: pd.DataFrame, target, features):
     """
     # Copy the dataframe
     df = df.sort_values(by='time').copy()
-    data = df[[target, *[x['name'] for x in features]]]
-    
-    # Prepare dictionaries
-    counts_dict = {feat['name']: {} for feat in features}
-    results = {f"{target}_{feat['name']}_bound_frequency": [] for feat in features}
-
-    # Precompute bounds per feature
-    bounds = {feat['name']: feat['bound'](data[feat['name']]) for feat in features}
-    # Iterate over rows
-    for idx, row in data.iterrows():
-        for feat in features:
-            feat_name = feat['name']
-            key = (row[target], row[feat_name])
-            row_value = row[feat_name]
-            low, high = bounds[feat_name]
-            
-            # Check if in bound
-            if low.iloc[idx] <= row_value <= high.iloc[idx]:
-                # Get current count
-                count = counts_dict[feat_name].get(key, 0)
-                results[f"{target}_{feat_name}_bound_frequency"].append(count)
-                # Update count
-                counts_dict[feat_name][key] = count + 1
-            else:
-                # Out of bounds → count 0
-                results[f"{target}_{feat_name}_bound_frequency"].append(0)
-
-    # Add results as columns
-    for col, vals in results.items():
-        df[col] = vals
+
+    # Count the earlier in-bound rows of the target with the same value, for the rows in bound
+    for feat in features:
+        value = df[feat['name']]
+        low, high = feat['bound'](value)
+        mask = (low <= value) & (value <= high)
+        df[f"{target}_{feat['name']}_bound_frequency"] = prior_counts(df, [target, feat['name']], mask)
 
     return df
 
@@ -206,24 +174,10 @@ def get_count_relations_frequency(df: pd.DataFrame, target, features):
         @params features: The name and value of the features to get the occurance count
     """
     df = df.sort_values(by='time').copy()
-    data = df[[target, *features]]
-    
-    counts_dict = {feat: {} for feat in features}
-    frequencies = {f"{target}_{feat}_count_frequency": [] for feat in features}
-    has_history = {f"{target}_{feat}_has_history": [] for feat in features}
-
-    for idx, row in data.iterrows():
-        for feat in features:
-            key = (row[target], row[feat])
-            count = counts_dict[feat].get(key, 0)
-            frequencies[f"{target}_{feat}_count_frequency"].append(count)
-            has_history[f"{target}_{feat}_has_history"].append(count > 0)
-            counts_dict[feat][key] = count + 1
-
-    for col, vals in frequencies.items():
-        df[col] = vals
-        history_col = col.replace('count_frequency', 'has_history')
-        df[history_col] = has_history[history_col]
+
+    for feat in features:
+        frequency = prior_counts(df, [target, feat])
+        df[f"{target}_{feat}_count_frequency"] = frequency
+        df[f"{target}_{feat}_has_history"] = frequency > 0
 
     return df
-    
\ No newline at end of file
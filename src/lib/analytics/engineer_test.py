@@ -0,0 +1,151 @@
+import time
+import pandas as pd
+import pytest
+
+from src.lib.analytics import engineer, extractor
+from src.lib.analytics.extractor_test import make_transactions, columnar_extract
+
+
+# The iterrows engines the grouped ones replace, kept as the reference. Bounds are read by row label.
+def legacy_occurrence_count(df, target, features):
+    df = df.sort_values(by='time').copy()
+    data = df[[target, *[x['name'] for x in features]]]
+    counts_dict = {feat['name']: {} for feat in features}
+    results = {f"{target}_{feat['name']}_{feat['value']}_occurance": [] for feat in features}
+
+    for idx, row in data.iterrows():
+        for feat in features:
+            key = (row[target], row[feat['name']])
+            column = f"{target}_{feat['name']}_{feat['value']}_occurance"
+            if row[feat['name']] == feat['value']:
+                count = counts_dict[feat['name']].get(key, 0)
+                results[column].append(count)
+                counts_dict[feat['name']][key] = count + 1
+            else:
+                results[column].append(0)
+
+    for col, vals in results.items():
+        df[col] = vals
+    return df
+
+
+def legacy_bound_relations_frequency(df, target, features):
+    df = df.sort_values(by='time').copy()
+    data = df[[target, *[x['name'] for x in features]]]
+    counts_dict = {feat['name']: {} for feat in features}
+    results = {f"{target}_{feat['name']}_bound_frequency": [] for feat in features}
+    bounds = {feat['name']: feat['bound'](data[feat['name']]) for feat in features}
+
+    for idx, row in data.iterrows():
+        for feat in features:
+            key = (row[target], row[feat['name']])
+            low, high = bounds[feat['name']]
+            column = f"{target}_{feat['name']}_bound_frequency"
+            if low.loc[idx] <= row[feat['name']] <= high.loc[idx]:
+                count = counts_dict[feat['name']].get(key, 0)
+                results[column].append(count)
+                counts_dict[feat['name']][key] = count + 1
+            else:
+                results[column].append(0)
+
+    for col, vals in results.items():
+        df[col] = vals
+    return df
+
+
+def legacy_count_relations_frequency(df, target, features):
+    df = df.sort_values(by='time').copy()
+    data = df[[target, *features]]
+    counts_dict = {feat: {} for feat in features}
+    frequencies = {f"{target}_{feat}_count_frequency": [] for feat in features}
+    has_history = {f"{target}_{feat}_has_history": [] for feat in features}
+
+    for idx, row in data.iterrows():
+        for feat in features:
+            key = (row[target], row[feat])
+            count = counts_dict[feat].get(key, 0)
+            frequencies[f"{target}_{feat}_count_frequency"].append(count)
+            has_history[f"{target}_{feat}_has_history"].append(count > 0)
+            counts_dict[feat][key] = count + 1
+
+    for col, vals in frequencies.items():
+        df[col] = vals
+        history_col = col.replace('count_frequency', 'has_history')
+        df[history_col] = has_history[history_col]
+    return df
+
+
+def engineered_transactions(size, num_accounts):
+    # Shuffle so the engines have to sort by time themselves
+    df, accounts = make_transactions(size, num_accounts)
+    df = columnar_extract(df, accounts)
+    return df.sample(frac=1, random_state=7)
+
+
+def test_occurrence_count_matches_iterrows():
+    df = engineered_transactions(400, 60)
+
+    for target, occurances in [('holder', extractor.HOLDER_OCCURANCES), ('holder_bvn', extractor.HOLDER_BVN_OCCURANCES), ('related', extractor.RELATED_OCCURANCES), ('related_bvn', extractor.RELATED_BVN_OCCURANCES)]:
+        pd.testing.assert_frame_equal(engineer.get_occurrence_count(df, target, occurances), legacy_occurrence_count(df, target, occurances))
+
+
+def test_bound_relations_frequency_matches_iterrows():
+    df = engineered_transactions(400, 60)
+    bounds = [
+        { 'name': 'hour', 'bound': lambda x: (x-1, x+1) },
+        { 'name': 'amount', 'bound': lambda x: (x*.5, x*1.5) },
+        { 'name': 'balance_jump', 'bound': lambda x: (x * 0.5, x * 1.5) },
+        { 'name': 'balance_jump_rate', 'bound': lambda x: (x - 0.2, x + 0.2) },
+    ]
+
+    pd.testing.assert_frame_equal(engineer.get_bound_relations_frequency(df, 'holder', bounds), legacy_bound_relations_frequency(df, 'holder', bounds))
+
+
+def test_count_relations_frequency_matches_iterrows():
+    df = engineered_transactions(400, 60)
+    features = ['related', 'device', 'channel']
+
+    pd.testing.assert_frame_equal(engineer.get_count_relations_frequency(df, 'holder', features), legacy_count_relations_frequency(df, 'holder', features))
+
+
+@pytest.mark.benchmark
+def test_grouped_engines_benchmark(record_property):
+    df = engineered_transactions(100_000, 10_000)
+
+    start = time.perf_counter()
+    df = extractor.extract_bounds(df, 'holder')
+    df = extractor.extract_holder_occurance(df)
+    df = extractor.extract_holder_bvn_occurance(df)
+    df = extractor.extract_related_occurance(df)
+    df = extractor.extract_related_bvn_occurance(df)
+    record_property('seconds', time.perf_counter() - start)
+
+    assert len(df) == 100_000
+
+
+def legacy_cashflow(df, group):
+    # One concat per group, the netflow of a group missing a type is nan
+    cash_flow = df.groupby([group, 'type'])['amount'].sum().sort_values(ascending=False).to_frame().reset_index()
+    cash_flow_pivot = cash_flow.pivot_table(index=group, columns='type', values='amount', aggfunc='sum').reset_index()
+    cash_flow_pivot['DEBIT'] = 0 if 'DEBIT' not in cash_flow_pivot.columns else cash_flow_pivot['DEBIT']
+    cash_flow_pivot['CREDIT'] = 0 if 'CREDIT' not in cash_flow_pivot.columns else cash_flow_pivot['CREDIT']
+    cash_flow_pivot['NETFLOW'] = cash_flow_pivot['CREDIT'] - cash_flow_pivot['DEBIT']
+
+    for netflow in cash_flow_pivot[[group, 'NETFLOW']].itertuples(index=False):
+        cash_flow = pd.concat([cash_flow, pd.DataFrame({group: [netflow[0]], 'type': 'NETFLOW', 'amount': [netflow.NETFLOW]})], ignore_index=True)
+    return cash_flow
+
+
+def test_cashflow_matches_the_concat_loop():
+    df, _ = make_transactions(2_000, 60)
+    df['hour'] = df['time'].str[11:13]
+
+    for group in ['channel', 'category', 'hour']:
+        pd.testing.assert_frame_equal(engineer.get_cashflow(df, group), legacy_cashflow(df, group))
+
+    # A group with only credits nets its credits, where the pivot left it nan
+    credited = df[(df['channel'] != 'APP') | (df['type'] == 'CREDIT')]
+    cashflow = engineer.get_cashflow(credited, 'channel')
+    netflows = cashflow[cashflow['type'] == 'NETFLOW'].set_index('channel')['amount']
+    assert legacy_cashflow(credited, 'channel')['amount'].isna().sum() == 1
+    assert netflows['APP'] == credited.groupby('channel')['amount'].sum()['APP']
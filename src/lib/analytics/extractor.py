@@ -2,80 +2,166 @@ import pandas as pd
 
 from src.lib.analytics import engineer, tracker
 
-def extract_account_features(data, accounts: pd.DataFrame):
-    holder_account = accounts[(accounts['account_no'] == data['holder']) & (accounts['bank_name'] == data['holder_bank'])].iloc[0]
 
-    related_accounts = accounts[(accounts['account_no'] == data['related']) & (accounts['bank_name'] == data['related_bank'])]
-
-    data['holder_bvn'] = holder_account['bvn']
-    data['kyc'] = holder_account['kyc']
-    data['merchant'] = holder_account['merchant']
-    data['holder_bvn'] = holder_account['bvn']
-    data['related_bvn'] = related_accounts.iloc[0]['bvn'] if not related_accounts.empty else data['related_bank']
-    data['sub_account'] = data['holder_bvn'] == data['related_bvn']
-    data['is_opening_device'] = data['device'] == holder_account['opening_device']
-
-    return data
-
-
-def extract_money_features(data):
-    transaction_limits = {1: 50_000, 2: 100_000, 3: 500_000, 4: 1_000_000}
-
-    data['large_amount'] = transaction_limits[data['kyc']] < data['amount']
-    data['balance_jump'] = -data['amount'] if data['type'] == 'DEBIT' else data['amount']
-    data['previous_balance'] = data['balance'] - data['balance_jump']
-    data['balance_jump_rate'] = data['balance_jump'] / max(data['previous_balance'], 1)
-    data['balance_jump_rate_absolute'] = abs(data['balance_jump_rate'])
-    data['drained_balance'] = data['balance_jump_rate'] < -.9
-    data['pumped_balance'] = data['balance_jump_rate'] > .9
-    data['large_amount_drain'] = data['large_amount'] & data['drained_balance']
-    data['large_amount_pump'] = data['large_amount'] & data['pumped_balance']
-    return data
-
-
-def extract_time_features(data):
-    dt = pd.to_datetime(data['time'])
-    data['hour'] = dt.hour
+# The transaction limits of each kyc level
+TRANSACTION_LIMITS = {1: 50_000, 2: 100_000, 3: 500_000, 4: 1_000_000}
+
+# The occurance of the following features with the account holder
+HOLDER_OCCURANCES = [
+    { 'name': 'reported', 'value': True },
+    { 'name': 'category', 'value': 'REVERSAL' },
+    { 'name': 'drained_balance', 'value': True },
+    { 'name': 'pumped_balance', 'value': True },
+    { 'name': 'large_amount_drain', 'value': True },
+    { 'name': 'large_amount_pump', 'value': True },
+    { 'name': 'far_distance', 'value': True }
+]
+
+# The occurance of the following features with the account holder_bvn
+HOLDER_BVN_OCCURANCES = [
+    { 'name': 'reported', 'value': True },
+    { 'name': 'category', 'value': 'REVERSAL' },
+    { 'name': 'far_distance', 'value': True }
+]
+
+# The occurance of the following features with the account related
+RELATED_OCCURANCES = [
+    { 'name': 'reported', 'value': True },
+    { 'name': 'category', 'value': 'REVERSAL' }
+]
+
+# The occurance of the following features with the account related_bvn
+RELATED_BVN_OCCURANCES = [
+    { 'name': 'reported', 'value': True },
+    { 'name': 'category', 'value': 'REVERSAL' }
+]
+
+# The features to get the rolling average of
+ROLLING_FEATURES = [
+    # Transaction dynamics
+    'amount', 'balance', 'balance_jump', 'balance_jump_rate',
+
+    # Distance
+    'distance_from_home (km)',  
+    
+    # Device usage
+    'holder_device_count_frequency', 
+
+    # Time
+    'holder_hour_bound_frequency',
+
+    # Holder - Related relationship
+    'holder_related_count_frequency',
+    
+    # Reversal Tracking
+    'holder_category_REVERSAL_occurance',
+
+    # Reported Tracking
+    'holder_reported_True_occurance'
+]
+
+# The rolling windows
+ROLLING_WINDOWS = ['1D', '7D', '30D', '120D']
+
+
+def extract_account_features(df: pd.DataFrame, accounts: pd.DataFrame):
+    # Attach the holder and related account details to every transaction
+    accounts = accounts.drop_duplicates(subset=['account_no', 'bank_name']).set_index(['account_no', 'bank_name'])
+    holder_accounts = accounts.reindex(pd.MultiIndex.from_arrays([df['holder'], df['holder_bank']]))
+    related_accounts = accounts.reindex(pd.MultiIndex.from_arrays([df['related'], df['related_bank']]))
+
+    df = df.copy()
+    df['holder_bvn'] = holder_accounts['bvn'].values
+    df['kyc'] = holder_accounts['kyc'].values
+    df['merchant'] = holder_accounts['merchant'].values
+    df['related_bvn'] = related_accounts['bvn'].set_axis(df.index).fillna(df['related_bank'])
+    df['sub_account'] = df['holder_bvn'] == df['related_bvn']
+    df['is_opening_device'] = df['device'] == holder_accounts['opening_device'].values
+
+    return df
+
+
+def extract_money_features(df: pd.DataFrame):
+    df = df.copy()
+    df['large_amount'] = df['kyc'].map(TRANSACTION_LIMITS) < df['amount']
+    df['balance_jump'] = df['amount'].where(df['type'] != 'DEBIT', -df['amount'])
+    df['previous_balance'] = df['balance'] - df['balance_jump']
+    df['balance_jump_rate'] = df['balance_jump'] / df['previous_balance'].clip(lower=1)
+    df['balance_jump_rate_absolute'] = df['balance_jump_rate'].abs()
+    df['drained_balance'] = df['balance_jump_rate'] < -.9
+    df['pumped_balance'] = df['balance_jump_rate'] > .9
+    df['large_amount_drain'] = df['large_amount'] & df['drained_balance']
+    df['large_amount_pump'] = df['large_amount'] & df['pumped_balance']
+    return df
+
+
+def extract_time_features(df: pd.DataFrame):
+    dt = pd.to_datetime(df['time'], format='ISO8601')
+
+    df = df.copy()
+    df['hour'] = dt.dt.hour.astype(int)
 
     # Extracting the day
-    data['week_day'] = dt.day_name()
+    df['week_day'] = dt.dt.day_name()
 
     # Extracting the month
-    data['month'] = dt.month_name()
+    df['month'] = dt.dt.month_name()
 
     # Extracting the date
-    data['date'] = dt.date()
+    df['date'] = dt.dt.date
 
     # Extracting the month day
-    data['month_day'] = int(dt.day)
-
-    return data
+    df['month_day'] = dt.dt.day.astype(int)
 
+    return df
 
-def extract_location_features(df: pd.DataFrame, data):
-    data['central_latitude'], data['central_longitude'] = engineer.central_location(df, data, 'holder')
-    data['distance_from_home (km)'] = engineer.distance_from_home(data, data, 'holder')
-    data['far_distance'] = data['distance_from_home (km)'] >= 100
-    return data
 
+def extract_location_features(df: pd.DataFrame):
+    df = df.copy()
+    central = df.groupby('holder')[['latitude', 'longitude']].transform('mean')
+    df['central_latitude'] = central['latitude'].fillna(df['latitude'])
+    df['central_longitude'] = central['longitude'].fillna(df['longitude'])
+    df['distance_from_home (km)'] = engineer.distance_from_home(df, df, 'holder')
+    df['far_distance'] = df['distance_from_home (km)'] >= 100
+    return df
 
-def extract_frequency_features(df: pd.DataFrame, data):
-    holder_df = df[(df['holder'] == data['holder']) & (df['holder_bank'] == data['holder_bank'])]
-    holder_bvn_df = df[(df['holder_bvn'] == data['holder_bvn'])]
 
-    # related_df = df.get_transactions('related', data['related'])
-    # related_bvn_df = df.get_transactions('related_bvn', data['related_bvn'])
+def extract_frequency_features(df: pd.DataFrame):
+    df = df.copy()
 
-    holder_count_frequency = {f'holder_{feature}_count_frequency': engineer.count_related(holder_df, data, target='holder', feature=feature) for feature in ['related', 'device', 'channel']}
+    holder_count_frequency = {f'holder_{feature}_count_frequency': engineer.count_related(df, ['holder', 'holder_bank'], feature) for feature in ['related', 'device', 'channel']}
 
-    holder_bvn_count_frequency = {f'holder_bvn_{feature}_count_frequency': engineer.count_related(holder_bvn_df, data, target='holder_bvn', feature=feature) for feature in ['related_bvn', 'device', 'channel']}
+    holder_bvn_count_frequency = {f'holder_bvn_{feature}_count_frequency': engineer.count_related(df, ['holder_bvn'], feature) for feature in ['related_bvn', 'device', 'channel']}
 
     for key, value in { **holder_count_frequency, **holder_bvn_count_frequency }.items():
-        data[key] = value
+        df[key] = value
 
-    data['holder_device_has_history'] = data['holder_device_count_frequency'] > 0
+    df['holder_device_has_history'] = df['holder_device_count_frequency'] > 0
 
-    return data
+    return df
+
+
+def extract_features(df: pd.DataFrame, accounts: pd.DataFrame):
+    """
+        Engineer every transaction feature used for fraud detection
+
+        @param df: The transactions
+        @param accounts: The accounts the transactions belong to
+
+        @returns df: The transactions with the engineered features
+    """
+    df = extract_account_features(df, accounts)
+    df = extract_time_features(df)
+    df = extract_money_features(df)
+    df = extract_location_features(df)
+    df = extract_frequency_features(df)
+    df = extract_bounds(df, 'holder')
+    df = extract_holder_occurance(df)
+    df = extract_holder_bvn_occurance(df)
+    df = extract_related_occurance(df)
+    df = extract_related_bvn_occurance(df)
+    df = extract_rolling_averages(df)
+    return df
 
 
 def extract_bounds(df: pd.DataFrame, key):
@@ -101,83 +187,28 @@ def extract_bounds(df: pd.DataFrame, key):
 
 
 def extract_holder_occurance(df: pd.DataFrame):
-    # Get the occurance of the following features with the account holder
-    occurances = [
-        { 'name': 'reported', 'value': True },
-        { 'name': 'category', 'value': 'REVERSAL' },
-        { 'name': 'drained_balance', 'value': True },
-        { 'name': 'pumped_balance', 'value': True },
-        { 'name': 'large_amount_drain', 'value': True },
-        { 'name': 'large_amount_pump', 'value': True },
-        { 'name': 'far_distance', 'value': True }
-    ]
-
-    return engineer.get_occurrence_count(df, 'holder', occurances)
+    # Get the occurance of features with the account holder
+    return engineer.get_occurrence_count(df, 'holder', HOLDER_OCCURANCES)
 
 
 def extract_holder_bvn_occurance(df: pd.DataFrame):
-    # Get the occurance of the following features with the account holder_bvn
-    occurances = [
-        { 'name': 'reported', 'value': True },
-        { 'name': 'category', 'value': 'REVERSAL' },
-        { 'name': 'far_distance', 'value': True }
-    ]
-
-    return engineer.get_occurrence_count(df, 'holder_bvn', occurances)
+    # Get the occurance of features with the account holder_bvn
+    return engineer.get_occurrence_count(df, 'holder_bvn', HOLDER_BVN_OCCURANCES)
 
 
 def extract_related_occurance(df: pd.DataFrame):
-    # Get the occurance of the following features with the account related
-    occurances = [
-        { 'name': 'reported', 'value': True },
-        { 'name': 'category', 'value': 'REVERSAL' }
-    ]
-
-    return engineer.get_occurrence_count(df, 'related', occurances)
+    # Get the occurance of features with the account related
+    return engineer.get_occurrence_count(df, 'related', RELATED_OCCURANCES)
 
 
 def extract_related_bvn_occurance(df: pd.DataFrame):
-    # Get the occurance of the following features with the account related_bvn
-    occurances = [
-        { 'name': 'reported', 'value': True },
-        { 'name': 'category', 'value': 'REVERSAL' }
-    ]
-
-    return engineer.get_occurrence_count(df, 'related_bvn', occurances)
+    # Get the occurance of features with the account related_bvn
+    return engineer.get_occurrence_count(df, 'related_bvn', RELATED_BVN_OCCURANCES)
 
 
 def extract_rolling_averages(df):
-    # Get the rolling average of these features
-
-    rolling_features = [
-        # Transaction dynamics
-        'amount', 'balance', 'balance_jump', 'balance_jump_rate',
-
-        # Distance
-        'distance_from_home (km)',  
-        
-        # Device usage
-        'holder_device_count_frequency', 
-
-        # Time
-        'holder_hour_bound_frequency',
-
-        # Holder - Related relationship
-        'holder_related_count_frequency',
-        
-        # Reversal Tracking
-        'holder_category_REVERSAL_occurance',
-
-        # Reported Tracking
-        'holder_reported_True_occurance'
-    ]
-
-    # Get for the specified windows
-    window_1 = tracker.rolling_averages(df, 'holder', rolling_features, 1)
-    window_7 = tracker.rolling_averages(df, 'holder', rolling_features, 7)
-    window_30 = tracker.rolling_averages(df, 'holder', rolling_features, 30)
-    window_120 = tracker.rolling_averages(df, 'holder', rolling_features, 120)
+    # Get the rolling average of the rolling features for the specified windows
+    windows = tracker.rolling_averages(df, 'holder', ROLLING_FEATURES, ROLLING_WINDOWS)
 
-    data = pd.concat([df, window_1, window_7, window_30, window_120], axis=1)
+    data = pd.concat([df, windows], axis=1)
     return data
-    
\ No newline at end of file
@@ -0,0 +1,147 @@
+import time
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.lib.analytics import extractor, tracker
+
+
+def make_transactions(size: int, num_accounts: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    banks = np.array(['Alpha Bank', 'Beta Bank', 'Gamma Bank'])
+
+    accounts = pd.DataFrame({
+        'account_no': [f'ACC_{i:010}' for i in range(num_accounts)],
+        'bank_name': rng.choice(banks, num_accounts),
+        'bvn': [f'USER_{i}' for i in rng.integers(0, max(num_accounts // 2, 1), num_accounts)],
+        'kyc': rng.choice([1, 2, 3], num_accounts, p=[.7, .2, .1]),
+        'merchant': rng.random(num_accounts) > .9,
+        'opening_device': [f'MOBILE_{i}' for i in range(num_accounts)],
+    })
+
+    holders = rng.integers(0, num_accounts, size)
+    related = rng.integers(0, num_accounts, size)
+    external = rng.random(size) < .2
+    amount = rng.uniform(100, 100_000, size).round(2)
+
+    df = pd.DataFrame({
+        'amount': amount,
+        'balance': (amount * rng.uniform(0, 20, size)).round(2),
+        'time': (pd.Timestamp('2023-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 60 * 60 * 24 * 30, size)), unit='s')).strftime('%Y-%m-%dT%H:%M:%S'),
+        'holder': accounts['account_no'].values[holders],
+        'holder_bank': accounts['bank_name'].values[holders],
+        'related': np.where(external, accounts['bank_name'].values[related], accounts['account_no'].values[related]),
+        'related_bank': accounts['bank_name'].values[related],
+        'latitude': 9 + rng.normal(0, 1, size),
+        'longitude': 3 + rng.normal(0, 1, size),
+        'channel': rng.choice(['APP', 'CARD', 'USSD'], size),
+        'device': np.where(rng.random(size) < .5, accounts['opening_device'].values[holders], [f'MOBILE_{i}' for i in rng.integers(0, num_accounts, size)]),
+        'status': rng.choice(['SUCCESS', 'FAILED'], size, p=[.7, .3]),
+        'category': rng.choice(['WITHDRAWAL', 'DEPOSIT', 'REVERSAL', 'TRANSFER'], size),
+        'type': rng.choice(['DEBIT', 'CREDIT'], size),
+        'reported': rng.random(size) < .05,
+    })
+
+    return df, accounts
+
+
+# The row-wise extractors the columnar ones replace, kept as the reference
+def legacy_account_features(data, accounts):
+    holder_account = accounts[(accounts['account_no'] == data['holder']) & (accounts['bank_name'] == data['holder_bank'])].iloc[0]
+    related_accounts = accounts[(accounts['account_no'] == data['related']) & (accounts['bank_name'] == data['related_bank'])]
+
+    data['holder_bvn'] = holder_account['bvn']
+    data['kyc'] = holder_account['kyc']
+    data['merchant'] = holder_account['merchant']
+    data['related_bvn'] = related_accounts.iloc[0]['bvn'] if not related_accounts.empty else data['related_bank']
+    data['sub_account'] = data['holder_bvn'] == data['related_bvn']
+    data['is_opening_device'] = data['device'] == holder_account['opening_device']
+    return data
+
+
+def legacy_money_features(data):
+    transaction_limits = {1: 50_000, 2: 100_000, 3: 500_000, 4: 1_000_000}
+
+    data['large_amount'] = transaction_limits[data['kyc']] < data['amount']
+    data['balance_jump'] = -data['amount'] if data['type'] == 'DEBIT' else data['amount']
+    data['previous_balance'] = data['balance'] - data['balance_jump']
+    data['balance_jump_rate'] = data['balance_jump'] / max(data['previous_balance'], 1)
+    data['balance_jump_rate_absolute'] = abs(data['balance_jump_rate'])
+    data['drained_balance'] = data['balance_jump_rate'] < -.9
+    data['pumped_balance'] = data['balance_jump_rate'] > .9
+    data['large_amount_drain'] = data['large_amount'] & data['drained_balance']
+    data['large_amount_pump'] = data['large_amount'] & data['pumped_balance']
+    return data
+
+
+def legacy_time_features(data):
+    dt = pd.to_datetime(data['time'])
+    data['hour'] = dt.hour
+    data['week_day'] = dt.day_name()
+    data['month'] = dt.month_name()
+    data['date'] = dt.date()
+    data['month_day'] = int(dt.day)
+    return data
+
+
+def legacy_location_features(df, data):
+    transaction_list = df[df['holder'] == data['holder']]
+    data['central_latitude'], data['central_longitude'] = transaction_list['latitude'].mean(), transaction_list['longitude'].mean()
+    data['distance_from_home (km)'] = tracker.haversine(data['central_latitude'], data['central_longitude'], data['latitude'], data['longitude'])
+    data['far_distance'] = data['distance_from_home (km)'] >= 100
+    return data
+
+
+def legacy_frequency_features(df, data):
+    holder_df = df[(df['holder'] == data['holder']) & (df['holder_bank'] == data['holder_bank'])]
+    holder_bvn_df = df[(df['holder_bvn'] == data['holder_bvn'])]
+
+    for feature in ['related', 'device', 'channel']:
+        data[f'holder_{feature}_count_frequency'] = len(holder_df[(holder_df['holder'] == data['holder']) & (holder_df[feature] == data[feature])])
+
+    for feature in ['related_bvn', 'device', 'channel']:
+        data[f'holder_bvn_{feature}_count_frequency'] = len(holder_bvn_df[(holder_bvn_df['holder_bvn'] == data['holder_bvn']) & (holder_bvn_df[feature] == data[feature])])
+
+    data['holder_device_has_history'] = data['holder_device_count_frequency'] > 0
+    return data
+
+
+def legacy_extract(df, accounts):
+    df = df.apply(lambda row: legacy_account_features(row, accounts), axis=1)
+    df = df.apply(legacy_time_features, axis=1)
+    df = df.apply(legacy_money_features, axis=1)
+    df = df.apply(lambda row: legacy_location_features(df, row), axis=1)
+    df = df.apply(lambda row: legacy_frequency_features(df, row), axis=1)
+    return df
+
+
+def columnar_extract(df, accounts):
+    df = extractor.extract_account_features(df, accounts)
+    df = extractor.extract_time_features(df)
+    df = extractor.extract_money_features(df)
+    df = extractor.extract_location_features(df)
+    df = extractor.extract_frequency_features(df)
+    return df
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_columnar_extractors_match_row_wise(descending):
+    df, accounts = make_transactions(400, 60)
+    if descending:
+        df = df.sort_values('time', ascending=False).reset_index(drop=True)
+
+    expected = legacy_extract(df, accounts)
+    result = columnar_extract(df, accounts)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.benchmark
+def test_columnar_extractors_benchmark(record_property):
+    df, accounts = make_transactions(100_000, 10_000)
+
+    start = time.perf_counter()
+    result = columnar_extract(df, accounts)
+    record_property('seconds', time.perf_counter() - start)
+
+    assert len(result) == len(df)
@@ -0,0 +1,429 @@
+import math
+from collections import Counter, defaultdict
+import pandas as pd
+from pymongo import UpdateOne
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+
+from src.lib.analytics import tracker
+from src.lib.analytics.extractor import TRANSACTION_LIMITS, HOLDER_OCCURANCES, HOLDER_BVN_OCCURANCES, RELATED_OCCURANCES, RELATED_BVN_OCCURANCES, ROLLING_FEATURES, ROLLING_WINDOWS
+
+
+# The bounds of the holder bound frequencies, either shifted by a width or scaled by a factor
+BOUNDS = {
+    # Has user ever transacted around this hour
+    'hour': {'kind': 'shift', 'width': 1, 'bucket': 1},
+
+    # Has user ever had balance around this balance
+    'balance': {'kind': 'scale', 'low': .5, 'high': 1.5},
+
+    # Has user ever made a transaction around this amount
+    'amount': {'kind': 'scale', 'low': .5, 'high': 1.5},
+
+    # Has user balance ever jumped like this before
+    'balance_jump': {'kind': 'scale', 'low': .5, 'high': 1.5},
+
+    # Relative balance jump rate (percentage-like scaling)
+    'balance_jump_rate': {'kind': 'shift', 'width': .2, 'bucket': .05},
+    'balance_jump_rate_absolute': {'kind': 'shift', 'width': .2, 'bucket': .05},
+}
+
+# Scaled bounds are counted on logarithmic buckets 5% wide
+SCALE_BUCKET = math.log(1.05)
+
+# The occurances tracked for each scope
+OCCURANCES = {
+    'holder': HOLDER_OCCURANCES,
+    'holder_bvn': HOLDER_BVN_OCCURANCES,
+    'related': RELATED_OCCURANCES,
+    'related_bvn': RELATED_BVN_OCCURANCES,
+}
+
+# The days of holder history the rolling windows read, older day buckets are dropped
+HORIZON = max(pd.Timedelta(window).days for window in ROLLING_WINDOWS)
+
+# The latest transactions counted in a feature state, a retried transaction is not counted twice
+RECORDED_TRANSACTIONS = 64
+
+# The transaction fields scored alongside the feature vector
+TRANSACTION_FIELDS = [
+    'amount', 'balance', 'time', 'holder', 'holder_bank', 'related', 'related_bank', 'latitude', 'longitude',
+    'status', 'type', 'category', 'channel', 'device', 'reference', 'reported', 'simulation_id'
+]
+
+
+def bucket(name, value):
+    # Get the bucket a value of a bounded feature is counted in
+    bound = BOUNDS[name]
+    if bound['kind'] == 'shift':
+        return str(math.floor(value / bound['bucket']))
+
+    if value == 0:
+        return '0'
+
+    sign = '+' if value > 0 else '-'
+    return f'{sign}{math.floor(math.log(abs(value)) / SCALE_BUCKET)}'
+
+
+def bound_buckets(name, value):
+    # Get the buckets covered by the bound of a value
+    bound = BOUNDS[name]
+    if bound['kind'] == 'shift':
+        low = math.floor((value - bound['width']) / bound['bucket'])
+        high = math.floor((value + bound['width']) / bound['bucket'])
+        return [str(x) for x in range(low, high + 1)]
+
+    if value == 0:
+        return ['0']
+
+    sign = '+' if value > 0 else '-'
+    low = math.floor(math.log(abs(value) * bound['low']) / SCALE_BUCKET)
+    high = math.floor(math.log(abs(value) * bound['high']) / SCALE_BUCKET)
+    return [f'{sign}{x}' for x in range(low, high + 1)]
+
+
+def feature_frame(transactions: list) -> pd.DataFrame:
+    # Flatten transactions and their feature vectors into one frame
+    # Stored vectors are point-in-time, with bucketed bounds, calendar day windows and iso dates, they never mix with extract_features
+    return pd.DataFrame([{**{field: transaction[field] for field in TRANSACTION_FIELDS}, **transaction['features']} for transaction in transactions])
+
+
+def encode_key(key: str) -> str:
+    # Make a counter name safe to use as a mongo field
+    return key.replace('.', '．').replace('$', '＄')
+
+
+def decode_key(key: str) -> str:
+    # Restore a counter name stored as a mongo field
+    return key.replace('．', '.').replace('＄', '$')
+
+
+class FeatureStore:
+    """
+        Point-in-time transaction features kept as running counters per holder, holder bvn, related and related bvn
+    """
+
+    def __init__(self, states: dict = None):
+        """
+            Initialize a feature store
+
+            @param states: The counters of each scope, keyed by (scope, key)
+        """
+        self.states = defaultdict(Counter, {scope: Counter(counters) for scope, counters in (states or {}).items()})
+        self.changes = defaultdict(Counter)
+
+
+    @classmethod
+    def from_documents(cls, documents: list):
+        """
+            Build a feature store from persisted feature states
+
+            @param documents: The feature state documents
+
+            @return: A feature store holding the states
+        """
+        return cls({
+            (document['scope'], document['key']): {decode_key(k): v for k, v in document.get('counters', {}).items()}
+            for document in documents
+        })
+
+
+    @staticmethod
+    def scopes(transaction: dict, holder_account: dict, related_account: dict) -> dict:
+        """
+            Get the scopes a transaction updates
+
+            @param transaction: The transaction
+            @param holder_account: The account of the transaction holder
+            @param related_account: The account of the related party, None when it is outside the simulation
+
+            @return: The (scope, key) of every scope
+        """
+        return {
+            'holder': ('holder', f"{transaction['holder']}:{transaction['holder_bank']}"),
+            'holder_bvn': ('holder_bvn', holder_account['bvn']),
+            'related': ('related', f"{transaction['related']}:{transaction['related_bank']}"),
+            'related_bvn': ('related_bvn', related_account['bvn'] if related_account else transaction['related_bank']),
+        }
+
+
+    def state(self, scope: tuple) -> Counter:
+        # Read the counters of a scope without creating it
+        return self.states.get(scope, Counter())
+
+
+    def features(self, transaction: dict, holder_account: dict, related_account: dict) -> dict:
+        """
+            Get the features of a transaction from the counters, without recording it
+
+            @param transaction: The transaction
+            @param holder_account: The account of the transaction holder
+            @param related_account: The account of the related party, None when it is outside the simulation
+
+            @return: The feature vector of the transaction
+        """
+        scopes = self.scopes(transaction, holder_account, related_account)
+        holder = self.state(scopes['holder'])
+        holder_bvn = self.state(scopes['holder_bvn'])
+        time = pd.Timestamp(transaction['time'])
+
+        # Account features
+        features = {
+            'holder_bvn': holder_account['bvn'],
+            'kyc': int(holder_account['kyc']),
+            'merchant': bool(holder_account['merchant']),
+            'related_bvn': scopes['related_bvn'][1],
+        }
+        features['sub_account'] = features['holder_bvn'] == features['related_bvn']
+        features['is_opening_device'] = transaction['device'] == holder_account['opening_device']
+
+        # Time features
+        features['hour'] = time.hour
+        features['week_day'] = time.day_name()
+        features['month'] = time.month_name()
+        features['date'] = time.date().isoformat()
+        features['month_day'] = time.day
+
+        # Money features
+        amount, balance = float(transaction['amount']), float(transaction['balance'])
+        features['large_amount'] = TRANSACTION_LIMITS[features['kyc']] < amount
+        features['balance_jump'] = -amount if transaction['type'] == 'DEBIT' else amount
+        features['previous_balance'] = balance - features['balance_jump']
+        features['balance_jump_rate'] = features['balance_jump'] / max(features['previous_balance'], 1)
+        features['balance_jump_rate_absolute'] = abs(features['balance_jump_rate'])
+        features['drained_balance'] = features['balance_jump_rate'] < -.9
+        features['pumped_balance'] = features['balance_jump_rate'] > .9
+        features['large_amount_drain'] = features['large_amount'] and features['drained_balance']
+        features['large_amount_pump'] = features['large_amount'] and features['pumped_balance']
+
+        # Location features, the centre includes this transaction
+        count = holder['n'] + 1
+        features['central_latitude'] = (holder['latitude'] + transaction['latitude']) / count
+        features['central_longitude'] = (holder['longitude'] + transaction['longitude']) / count
+        features['distance_from_home (km)'] = float(tracker.haversine(features['central_latitude'], features['central_longitude'], transaction['latitude'], transaction['longitude']))
+        features['far_distance'] = features['distance_from_home (km)'] >= 100
+
+        values = {**transaction, **features}
+
+        # Frequency features, the counts include this transaction
+        for feature in ['related', 'device', 'channel']:
+            features[f'holder_{feature}_count_frequency'] = holder[f'count|{feature}|{values[feature]}'] + 1
+
+        for feature in ['related_bvn', 'device', 'channel']:
+            features[f'holder_bvn_{feature}_count_frequency'] = holder_bvn[f'count|{feature}|{values[feature]}'] + 1
+
+        features['holder_device_has_history'] = holder[f"count|device|{transaction['device']}"] > 0
+
+        # Bound frequencies over the earlier holder transactions
+        for name in BOUNDS:
+            features[f'holder_{name}_bound_frequency'] = sum(holder[f'bound|{name}|{x}'] for x in bound_buckets(name, values[name]))
+
+        # Occurances over the earlier transactions of each scope
+        for target, occurances in OCCURANCES.items():
+            state = self.state(scopes[target])
+            for occurance in occurances:
+                name, value = occurance['name'], occurance['value']
+                features[f'{target}_{name}_{value}_occurance'] = state[f'occurance|{name}|{value}'] if values[name] == value else 0
+
+        # Rolling averages over calendar days, including this transaction
+        values = {**transaction, **features}
+        windows = {pd.Timedelta(window).days: window for window in ROLLING_WINDOWS}
+        day = time.toordinal()
+        totals = Counter()
+        for offset in range(HORIZON):
+            if holder[f'day|{day - offset}|n']:
+                totals['n'] += holder[f'day|{day - offset}|n']
+                for feature in ROLLING_FEATURES:
+                    totals[feature] += holder[f'day|{day - offset}|{feature}']
+
+            if offset + 1 in windows:
+                for feature in ROLLING_FEATURES:
+                    features[f'holder_{feature}_avg_{windows[offset + 1]}'] = (totals[feature] + values[feature]) / (totals['n'] + 1)
+
+        return features
+
+
+    def record(self, transaction: dict, holder_account: dict, related_account: dict, features: dict):
+        """
+            Add a transaction to the counters
+
+            @param transaction: The transaction
+            @param holder_account: The account of the transaction holder
+            @param related_account: The account of the related party, None when it is outside the simulation
+            @param features: The feature vector of the transaction
+        """
+        scopes = self.scopes(transaction, holder_account, related_account)
+        values = {**transaction, **features}
+        day = pd.Timestamp(transaction['time']).toordinal()
+
+        holder = Counter({'n': 1, 'latitude': transaction['latitude'], 'longitude': transaction['longitude'], f'day|{day}|n': 1})
+        for feature in ['related', 'device', 'channel']:
+            holder[f'count|{feature}|{values[feature]}'] += 1
+        for name in BOUNDS:
+            holder[f'bound|{name}|{bucket(name, values[name])}'] += 1
+        for feature in ROLLING_FEATURES:
+            holder[f'day|{day}|{feature}'] += values[feature]
+
+        holder_bvn = Counter()
+        for feature in ['related_bvn', 'device', 'channel']:
+            holder_bvn[f'count|{feature}|{values[feature]}'] += 1
+
+        counters = {'holder': holder, 'holder_bvn': holder_bvn, 'related': Counter(), 'related_bvn': Counter()}
+        for target, occurances in OCCURANCES.items():
+            for occurance in occurances:
+                if values[occurance['name']] == occurance['value']:
+                    counters[target][f"occurance|{occurance['name']}|{occurance['value']}"] += 1
+
+        for target, counter in counters.items():
+            self.states[scopes[target]].update(counter)
+            self.changes[scopes[target]].update(counter)
+
+
+    def observe(self, transaction: dict, holder_account: dict, related_account: dict) -> dict:
+        """
+            Get the features of a transaction and add it to the counters
+
+            @param transaction: The transaction
+            @param holder_account: The account of the transaction holder
+            @param related_account: The account of the related party, None when it is outside the simulation
+
+            @return: The feature vector of the transaction
+        """
+        features = self.features(transaction, holder_account, related_account)
+        self.record(transaction, holder_account, related_account, features)
+        return features
+
+
+    def prune(self) -> dict:
+        """
+            Drop the day buckets older than the rolling windows reach from the latest day of each state
+
+            @return: The dropped keys of each scope
+        """
+        pruned = {}
+        for scope, counters in self.states.items():
+            days = {key: int(key.split('|')[1]) for key in counters if key.startswith('day|')}
+            if not days:
+                continue
+
+            latest = max(days.values())
+            stale = [key for key, day in days.items() if day <= latest - HORIZON]
+            for key in stale:
+                del counters[key]
+                self.changes[scope].pop(key, None)
+
+            if stale:
+                pruned[scope] = stale
+
+        return pruned
+
+
+    def flush(self) -> dict:
+        # Get and clear the counter increments since the last flush
+        changes, self.changes = self.changes, defaultdict(Counter)
+        return changes
+
+
+def state_id(simulation_id: str, scope: tuple) -> str:
+    # The id of the feature state document of a scope
+    return f'{simulation_id}:{scope[0]}:{scope[1]}'
+
+
+async def load_feature_store(simulation_id: str, scopes: list, db: Database) -> FeatureStore:
+    """
+        Load the feature states of some scopes of a simulation
+
+        @param simulation_id: The id of the simulation
+        @param scopes: The (scope, key) of the states to load
+        @param db: The database
+
+        @return: A feature store holding the states
+    """
+    documents = await db.simulation_features.find({'_id': {'$in': [state_id(simulation_id, scope) for scope in scopes]}}).to_list()
+    return FeatureStore.from_documents(documents)
+
+
+def state_updates(simulation_id: str, store: FeatureStore, transaction_id=None) -> list:
+    """
+        Get the updates that persist the counter increments of a feature store
+
+        @param simulation_id: The id of the simulation
+        @param store: The feature store
+        @param transaction_id: The id of the transaction the increments count, it is only counted once in each state
+
+        @return: The upserts of the feature states
+    """
+    # Day buckets the rolling windows no longer reach are removed, so a state stays bounded over the life of an account
+    pruned = store.prune()
+    changes = store.flush()
+
+    operations = []
+    for scope in [*changes, *(scope for scope in pruned if scope not in changes)]:
+        counters = changes.get(scope, {})
+        if not counters and scope not in pruned:
+            continue
+
+        query = {'_id': state_id(simulation_id, scope)}
+        update = {'$setOnInsert': {'simulation_id': simulation_id, 'scope': scope[0], 'key': scope[1]}}
+        if counters:
+            update['$inc'] = {f'counters.{encode_key(k)}': v for k, v in counters.items()}
+        if scope in pruned:
+            update['$unset'] = {f'counters.{encode_key(k)}': '' for k in pruned[scope]}
+        if transaction_id is not None:
+            query['recorded'] = {'$ne': transaction_id}
+            update['$push'] = {'recorded': {'$each': [transaction_id], '$slice': -RECORDED_TRANSACTIONS}}
+
+        operations.append(UpdateOne(query, update, upsert=True))
+
+    return operations
+
+
+async def save_feature_store(simulation_id: str, store: FeatureStore, db: Database, transaction_id=None):
+    """
+        Persist the counter increments of a feature store
+
+        @param simulation_id: The id of the simulation
+        @param store: The feature store
+        @param db: The database
+        @param transaction_id: The id of the transaction the increments count, it is only counted once in each state
+    """
+    operations = state_updates(simulation_id, store, transaction_id)
+    if not operations:
+        return
+
+    try:
+        await db.simulation_features.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # A state that already counted the transaction does not match, so its upsert collides with the stored state
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            raise
+
+
+async def load_transaction_features(transaction: dict, holder_account: dict, related_account: dict, db: Database) -> tuple:
+    """
+        Get the point-in-time features of a new transaction, without counting it
+
+        @param transaction: The transaction
+        @param holder_account: The account of the transaction holder
+        @param related_account: The account of the related party, None when it is outside the simulation
+        @param db: The database
+
+        @return: The feature store of the transaction scopes, and the feature vector of the transaction
+    """
+    scopes = FeatureStore.scopes(transaction, holder_account, related_account)
+    store = await load_feature_store(transaction['simulation_id'], list(scopes.values()), db)
+    return store, store.features(transaction, holder_account, related_account)
+
+
+async def track_transaction(store: FeatureStore, transaction: dict, holder_account: dict, related_account: dict, db: Database):
+    """
+        Count a stored transaction in the feature states
+
+        @param store: The feature store its features were read from
+        @param transaction: The stored transaction, with its id and features
+        @param holder_account: The account of the transaction holder
+        @param related_account: The account of the related party, None when it is outside the simulation
+        @param db: The database
+    """
+    store.record(transaction, holder_account, related_account, transaction['features'])
+    await save_feature_store(transaction['simulation_id'], store, db, transaction['_id'])
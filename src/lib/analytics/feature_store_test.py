@@ -0,0 +1,85 @@
+import pandas as pd
+from pymongo import UpdateOne
+
+from src.lib.analytics.extractor_test import make_transactions
+from src.lib.analytics.feature_store import HORIZON, RECORDED_TRANSACTIONS, FeatureStore, encode_key, state_id, state_updates
+
+
+def transactions(size: int, num_accounts: int, days: int = 30) -> tuple:
+    # Simulated transactions with the accounts of their parties
+    df, accounts = make_transactions(size, num_accounts)
+    df['time'] = (pd.Timestamp('2023-01-01') + (pd.to_datetime(df['time']) - pd.Timestamp('2023-01-01')) * (days / 30)).dt.strftime('%Y-%m-%dT%H:%M:%S')
+    df['reference'] = [f'REF_{i}' for i in range(size)]
+    df['simulation_id'] = 'SIM'
+    index = {(account['account_no'], account['bank_name']): account for account in accounts.to_dict(orient='records')}
+
+    return [
+        (transaction, index[(transaction['holder'], transaction['holder_bank'])], index.get((transaction['related'], transaction['related_bank'])))
+        for transaction in df.to_dict(orient='records')
+    ]
+
+
+def test_features_are_read_before_the_transaction_is_counted():
+    store, observed = FeatureStore(), FeatureStore()
+    for transaction, holder_account, related_account in transactions(300, 20):
+        features = store.features(transaction, holder_account, related_account)
+        store.record(transaction, holder_account, related_account, features)
+
+        assert observed.observe(transaction, holder_account, related_account) == features
+
+    assert store.states == observed.states
+
+
+def upsert(holder: tuple, increments: dict, transaction_id=None) -> UpdateOne:
+    # The update of a holder state, guarded by the transaction it counts
+    query, update = {'_id': state_id('SIM', holder)}, {
+        '$setOnInsert': {'simulation_id': 'SIM', 'scope': 'holder', 'key': holder[1]},
+        '$inc': {f'counters.{encode_key(key)}': value for key, value in increments.items()},
+    }
+    if transaction_id is not None:
+        query['recorded'] = {'$ne': transaction_id}
+        update['$push'] = {'recorded': {'$each': [transaction_id], '$slice': -RECORDED_TRANSACTIONS}}
+    return UpdateOne(query, update, upsert=True)
+
+
+def test_increments_are_keyed_on_the_transaction():
+    store = FeatureStore()
+    transaction, holder_account, related_account = transactions(1, 5)[0]
+    holder = ('holder', f"{transaction['holder']}:{transaction['holder_bank']}")
+
+    # A state that already counted the transaction does not match the update
+    store.observe(transaction, holder_account, related_account)
+    increments = dict(store.changes[holder])
+    assert upsert(holder, increments, 'TX_1') in state_updates('SIM', store, 'TX_1')
+
+    # The increments were flushed, a replayed simulation is saved without ids
+    assert state_updates('SIM', store) == []
+    store.observe(transaction, holder_account, related_account)
+    assert upsert(holder, dict(store.changes[holder])) in state_updates('SIM', store)
+
+
+def test_day_buckets_outside_the_rolling_windows_are_pruned():
+    pruned, whole = FeatureStore(), FeatureStore()
+    for position, (transaction, holder_account, related_account) in enumerate(transactions(1_500, 5, days=400)):
+        assert pruned.observe(transaction, holder_account, related_account) == whole.observe(transaction, holder_account, related_account)
+        if position % 100 == 0:
+            state_updates('SIM', pruned)
+
+    # Only the days the windows reach are kept once saved
+    state_updates('SIM', pruned)
+    for scope, counters in pruned.states.items():
+        days = {int(key.split('|')[1]) for key in counters if key.startswith('day|')}
+        assert not days or max(days) - min(days) < HORIZON
+    assert sum(map(len, pruned.states.values())) < sum(map(len, whole.states.values()))
+
+
+def test_stored_day_buckets_outside_the_rolling_windows_are_unset():
+    holder = ('holder', 'ACC_1:Bank')
+    store = FeatureStore({holder: {'n': 2, 'day|1|n': 1, f'day|{HORIZON + 1}|n': 1}})
+
+    assert state_updates('SIM', store) == [UpdateOne(
+        {'_id': state_id('SIM', holder)},
+        {'$setOnInsert': {'simulation_id': 'SIM', 'scope': 'holder', 'key': holder[1]}, '$unset': {'counters.day|1|n': ''}},
+        upsert=True
+    )]
+    assert store.states[holder] == {'n': 2, f'day|{HORIZON + 1}|n': 1}
@@ -0,0 +1,272 @@
+import pickle
+import zlib
+from collections import OrderedDict
+from uuid import uuid4
+import pandas as pd
+from gridfs.errors import FileExists, NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo import DESCENDING, UpdateOne
+from pymongo.database import Database
+
+from src.lib.analytics.aggregations import aggregate_summary
+from src.lib.analytics.anomalizer import FraudModel, detect_fraud, score_fraud
+from src.lib.analytics.engineer import get_cashflow
+from src.lib.analytics.feature_store import feature_frame
+from src.lib.analytics.registry import load_fraud_model
+from src.lib.utils.config import ANALYTICS_CACHE_SIZE, SCORE_CHUNK
+
+# Bump when the summary changes, artifacts of older versions are rebuilt when read
+ANALYTICS_VERSION = 3
+
+# The columns of the scored transactions the analyses read
+SCORED_COLUMNS = [
+    'holder', 'holder_bank', 'related', 'related_bank', 'holder_bvn', 'related_bvn',
+    'amount', 'balance', 'time', 'latitude', 'longitude', 'channel', 'category', 'type',
+    'fraud_score', 'fraud', 'week_day', 'hour',
+]
+
+NUMERICAL_COLUMNS = ['amount', 'balance', 'time', 'latitude', 'longitude', 'fraud_score']
+CATEGORICAL_COLUMNS = ['channel', 'category', 'type', 'fraud', 'hour']
+GROUP_COLUMNS = ['channel', 'category', 'week_day', 'fraud', 'hour']
+
+
+# The most recently read artifacts of this process, keyed by simulation id with the revision they were read at
+artifacts: OrderedDict = OrderedDict()
+
+
+def remember(simulation_id: str, revision: str, artifact: dict):
+    # Keep an artifact in the process cache, evicting the least recently used
+    artifacts[simulation_id] = (revision, artifact)
+    artifacts.move_to_end(simulation_id)
+
+    while len(artifacts) > ANALYTICS_CACHE_SIZE:
+        artifacts.popitem(last=False)
+
+
+def score_transactions(df: pd.DataFrame, accounts_df: pd.DataFrame) -> pd.DataFrame:
+    """
+        Score transactions for fraud and keep the columns the analyses read
+
+        @param df: The transactions, newest first
+        @param accounts_df: The accounts of the simulation
+
+        @return: The scored transactions
+    """
+    fraud_df = detect_fraud(df, accounts_df)
+    df[['fraud_score', 'fraud', 'week_day', 'holder_bvn', 'related_bvn']] = fraud_df[['fraud_score', 'fraud', 'week_day', 'holder_bvn', 'related_bvn']]
+    df['hour'] = fraud_df['hour'].astype('str')
+    return df[SCORED_COLUMNS].reset_index(drop=True)
+
+
+def score_documents(transactions: list, model: FraudModel) -> pd.DataFrame:
+    """
+        Score transactions on the features they were stored with
+
+        @param transactions: The transaction documents, with their features
+        @param model: The fitted fraud model of the simulation
+
+        @return: The scored transactions, each scored on its own so any subset scores the same
+    """
+    df = score_fraud(feature_frame(transactions), model)
+    df['hour'] = df['hour'].astype('str')
+    return df[SCORED_COLUMNS].reset_index(drop=True)
+
+
+def scope_query(simulation_id: str, scope: dict = None) -> dict:
+    """
+        Get the query for the transactions of a scope of a simulation
+
+        @param simulation_id: The id of the simulation
+        @param scope: An account, as its account_no and bank_name, or a user, as their bvn. None is the whole simulation
+
+        @return: The query, which matches the transactions the scope holds or is related to
+    """
+    query = {'simulation_id': simulation_id}
+    if not scope:
+        return query
+
+    if 'bvn' in scope:
+        # The bvns of both parties are kept with the features of every transaction
+        query['$or'] = [{'features.holder_bvn': scope['bvn']}, {'features.related_bvn': scope['bvn']}]
+    else:
+        query['$or'] = [
+            {'holder': scope['account_no'], 'holder_bank': scope['bank_name']},
+            {'related': scope['account_no'], 'related_bank': scope['bank_name']},
+        ]
+    return query
+
+
+def in_scope(df: pd.DataFrame, scope: dict) -> pd.Series:
+    # The scored transactions a scope holds or is related to, as scope_query matches them
+    if 'bvn' in scope:
+        return (df['holder_bvn'] == scope['bvn']) | (df['related_bvn'] == scope['bvn'])
+
+    return (
+        ((df['holder'] == scope['account_no']) & (df['holder_bank'] == scope['bank_name']))
+        | ((df['related'] == scope['account_no']) & (df['related_bank'] == scope['bank_name']))
+    )
+
+
+async def write_scores(ids: list, scored: pd.DataFrame, db: Database):
+    # Keep the score of every transaction with it, the summaries aggregate them in the database
+    if ids:
+        await db.simulation_transactions.bulk_write([
+            UpdateOne({'_id': _id}, {'$set': {'scores': {'fraud_score': float(score), 'fraud': bool(fraud)}}})
+            for _id, score, fraud in zip(ids, scored['fraud_score'], scored['fraud'])
+        ], ordered=False)
+
+
+async def score_stored(simulation_id: str, db: Database, scope: dict = None) -> bool:
+    """
+        Score the transactions of a scope that have no score yet, and keep the scores with them
+
+        @param simulation_id: The id of the simulation
+        @param db: The database
+        @param scope: An account, as its account_no and bank_name, or a user, as their bvn. None is the whole simulation
+
+        @return: Whether every transaction of the scope is scored, transactions without a model or features are not
+    """
+    model = await load_fraud_model(simulation_id, db)
+    if model is None:
+        return False
+
+    query = {**scope_query(simulation_id, scope), 'scores.fraud_score': {'$exists': False}}
+    if await db.simulation_transactions.find_one({**query, 'features': {'$exists': False}}, {'_id': 1}):
+        return False
+
+    # Transactions carry their point-in-time features, so they are scored a chunk at a time
+    chunk = []
+    async for transaction in db.simulation_transactions.find(query, batch_size=SCORE_CHUNK):
+        chunk.append(transaction)
+        if len(chunk) == SCORE_CHUNK:
+            await write_scores([transaction['_id'] for transaction in chunk], score_documents(chunk, model), db)
+            chunk = []
+
+    if chunk:
+        await write_scores([transaction['_id'] for transaction in chunk], score_documents(chunk, model), db)
+    return True
+
+
+async def score_simulation(simulation_id: str, db: Database) -> pd.DataFrame:
+    """
+        Score every transaction of a simulation in process, engineering the features over all of them
+
+        @param simulation_id: The id of the simulation
+        @param db: The database
+
+        @return: The scored transactions, newest first
+    """
+    transactions = await db.simulation_transactions.find({'simulation_id': simulation_id}, {'features': 0, 'scores': 0}).sort({'time': DESCENDING}).to_list()
+    if not transactions:
+        return pd.DataFrame(columns=SCORED_COLUMNS)
+
+    # The features are engineered over the whole simulation, so the detectors are fitted on them too
+    accounts = await db.simulation_accounts.find({'simulation_id': simulation_id}).to_list()
+    return score_transactions(pd.DataFrame(transactions), pd.DataFrame(accounts))
+
+
+async def summarize_scope(simulation_id: str, db: Database, scope: dict = None) -> dict:
+    """
+        Summarise the transactions of a scope of a simulation
+
+        @param simulation_id: The id of the simulation
+        @param db: The database
+        @param scope: An account, as its account_no and bank_name, or a user, as their bvn. None is the whole simulation
+
+        @return: The numerical and categorical descriptions, cashflows and proportions
+    """
+    # Scored transactions are summarised by the database, only the aggregates are read
+    if await score_stored(simulation_id, db, scope):
+        return await aggregate_summary(scope_query(simulation_id, scope), db)
+
+    # Otherwise the detectors are fitted on the whole simulation and the scope is summarised from it
+    scored = await score_simulation(simulation_id, db)
+    return summarize_transactions(scored[in_scope(scored, scope)] if scope else scored)
+
+
+def summarize_transactions(df: pd.DataFrame) -> dict:
+    """
+        Describe scored transactions
+
+        @param df: The scored transactions
+
+        @return: The numerical and categorical descriptions, cashflows and proportions
+    """
+    numerical = df[NUMERICAL_COLUMNS].describe().drop(index=['count']).to_dict(orient='index')
+    categorical = df[CATEGORICAL_COLUMNS].describe().drop(index=['count']).to_dict(orient='index')
+    volumns = {c: get_cashflow(df, c).to_dict(orient='records') for c in GROUP_COLUMNS}
+    proportions = {c: df[c].value_counts(normalize=True).to_frame().to_dict(orient='index') for c in GROUP_COLUMNS}
+    return {'numerical': numerical, 'categorical': categorical, 'volumns': volumns, 'proportions': proportions}
+
+
+async def build_analytics(simulation_id: str, db: Database) -> dict:
+    """
+        Score and summarise every transaction of a simulation, and store the summary
+
+        @param simulation_id: The id of the simulation
+        @param db: The database
+
+        @return: The artifact, with its version and summary
+    """
+    artifact = {'version': ANALYTICS_VERSION, 'summary': await summarize_scope(simulation_id, db)}
+
+    bucket = AsyncIOMotorGridFSBucket(db, bucket_name='simulation_analytics')
+    await drop_analytics(simulation_id, db)
+
+    # Another request may have built the same artifact meanwhile, either copy serves
+    revision = uuid4().hex
+    try:
+        await bucket.upload_from_stream_with_id(
+            simulation_id, f'{simulation_id}.pkl', zlib.compress(pickle.dumps(artifact)),
+            metadata={'version': ANALYTICS_VERSION, 'revision': revision}
+        )
+    except FileExists:
+        return artifact
+
+    remember(simulation_id, revision, artifact)
+    return artifact
+
+
+async def load_analytics(simulation_id: str, db: Database) -> dict:
+    """
+        Get the analytics artifact of a simulation, building it when it is missing or outdated
+
+        @param simulation_id: The id of the simulation
+        @param db: The database
+
+        @return: The artifact, with its version and summary
+    """
+    # Only the file document is read to check the process cache is current
+    stored = await db.simulation_analytics.files.find_one({'_id': simulation_id}, {'metadata': 1})
+    if stored is None or stored['metadata'].get('version') != ANALYTICS_VERSION:
+        return await build_analytics(simulation_id, db)
+
+    revision = stored['metadata']['revision']
+    if simulation_id in artifacts and artifacts[simulation_id][0] == revision:
+        artifacts.move_to_end(simulation_id)
+        return artifacts[simulation_id][1]
+
+    bucket = AsyncIOMotorGridFSBucket(db, bucket_name='simulation_analytics')
+    try:
+        stream = await bucket.open_download_stream(simulation_id)
+    except NoFile:
+        return await build_analytics(simulation_id, db)
+
+    artifact = pickle.loads(zlib.decompress(await stream.read()))
+    remember(simulation_id, revision, artifact)
+    return artifact
+
+
+async def drop_analytics(simulation_id: str, db: Database):
+    """
+        Invalidate the analytics artifact of a simulation, the next read rebuilds it
+
+        @param simulation_id: The id of the simulation
+        @param db: The database
+    """
+    artifacts.pop(simulation_id, None)
+    bucket = AsyncIOMotorGridFSBucket(db, bucket_name='simulation_analytics')
+    try:
+        await bucket.delete(simulation_id)
+    except NoFile:
+        pass
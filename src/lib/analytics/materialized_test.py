@@ -0,0 +1,101 @@
+import json
+import pandas as pd
+import pytest
+
+from src.lib.analytics.anomalizer import FraudModel, detect_fraud
+from src.lib.analytics.engineer import get_cashflow
+from src.lib.analytics.extractor import extract_features
+from src.lib.analytics.extractor_test import make_transactions
+from src.lib.analytics.feature_store import FeatureStore, feature_frame
+from src.lib.analytics.materialized import SCORED_COLUMNS, in_scope, scope_query, score_documents, score_transactions, summarize_transactions
+
+
+def legacy_analysis(df: pd.DataFrame, accounts: pd.DataFrame, filter_transactions) -> dict:
+    # Scoring and describing on every request, as the analyze endpoints did
+    fraud_df = detect_fraud(df, accounts)
+    df[['fraud_score', 'fraud', 'week_day']] = fraud_df[['fraud_score', 'fraud', 'week_day']]
+    df['hour'] = fraud_df['hour'].astype('str')
+    df[['holder_bvn', 'related_bvn']] = fraud_df[['holder_bvn', 'related_bvn']]
+
+    df = filter_transactions(df)
+    columns = ['channel', 'category', 'week_day', 'fraud', 'hour']
+    return {
+        'numerical': df[['amount', 'balance', 'time', 'latitude', 'longitude', 'fraud_score']].describe().drop(index=['count']).to_dict(orient='index'),
+        'categorical': df[['channel', 'category', 'type', 'fraud', 'hour']].describe().drop(index=['count']).to_dict(orient='index'),
+        'volumns': {c: get_cashflow(df, c).to_dict(orient='records') for c in columns},
+        'proportions': {c: df[c].value_counts(normalize=True).to_frame().to_dict(orient='index') for c in columns},
+    }
+
+
+def same(first: dict, second: dict) -> bool:
+    # Netflows of groups missing a type are nan, which never equals itself
+    return json.dumps(first, sort_keys=True, default=str) == json.dumps(second, sort_keys=True, default=str)
+
+
+def test_filtered_artifact_matches_scoring_per_request():
+    df, accounts = make_transactions(2_000, 60)
+    df = df.iloc[::-1].reset_index(drop=True)
+    holder = df.loc[0, ['holder', 'holder_bank']]
+    by_account = lambda df: df[((df['holder'] == holder['holder']) & (df['holder_bank'] == holder['holder_bank'])) | ((df['related'] == holder['holder']) & (df['related_bank'] == holder['holder_bank']))]
+
+    scored = score_transactions(df.copy(), accounts)
+
+    assert list(scored.columns) == SCORED_COLUMNS and len(scored) == len(df)
+    assert same(summarize_transactions(by_account(scored)), legacy_analysis(df.copy(), accounts, by_account))
+    assert same(summarize_transactions(scored), legacy_analysis(df.copy(), accounts, lambda df: df))
+
+
+def stored_transactions(size: int, num_accounts: int) -> tuple:
+    # Simulated transactions with the point-in-time features they are saved with
+    df, accounts = make_transactions(size, num_accounts)
+    df['reference'] = [f'REF_{i}' for i in range(size)]
+    df['simulation_id'] = 'SIM'
+    index = {(account['account_no'], account['bank_name']): account for account in accounts.to_dict(orient='records')}
+
+    store, documents = FeatureStore(), []
+    for transaction in df.to_dict(orient='records'):
+        features = store.observe(transaction, index[(transaction['holder'], transaction['holder_bank'])], index.get((transaction['related'], transaction['related_bank'])))
+        documents.append({**transaction, 'features': features})
+
+    return documents[::-1], FraudModel().fit(feature_frame(documents))
+
+
+def matches(document: dict, query: dict) -> bool:
+    # Evaluate the $or of a scope query the way mongo would
+    fields = {**document, **{f'features.{name}': value for name, value in document['features'].items()}}
+    return any(all(fields[field] == value for field, value in condition.items()) for condition in query['$or'])
+
+
+def test_scoped_scores_match_the_whole_simulation():
+    documents, model = stored_transactions(2_000, 60)
+    scored = score_documents(documents, model)
+    holder = documents[0]
+
+    for scope in [{'account_no': holder['holder'], 'bank_name': holder['holder_bank']}, {'bvn': holder['features']['holder_bvn']}]:
+        # Only the documents the pushed down query matches are scored
+        query = scope_query('SIM', scope)
+        scoped = score_documents([document for document in documents if matches(document, query)], model)
+
+        expected = scored[in_scope(scored, scope)].reset_index(drop=True)
+        assert 0 < len(scoped) < len(scored)
+        pd.testing.assert_frame_equal(scoped, expected)
+
+
+def test_a_fitted_model_only_scores_stored_features():
+    documents, model = stored_transactions(500, 20)
+    df, accounts = make_transactions(500, 20)
+    df['reference'] = [f'REF_{i}' for i in range(len(df))]
+    df['simulation_id'] = 'SIM'
+
+    assert len(score_documents(documents[:1], model)) == 1
+
+    # Batch features keep their dates as dates where the stored ones are iso strings
+    with pytest.raises(ValueError, match='date'):
+        model.score(extract_features(df, accounts))
+
+    with pytest.raises(ValueError, match='amount'):
+        model.score(feature_frame(documents).drop(columns=['amount']))
+
+    # Identifiers are not features, a transaction scores the same whatever its reference
+    renamed = [{**document, 'reference': f"NEW_{document['reference']}"} for document in documents[:50]]
+    pd.testing.assert_frame_equal(score_documents(renamed, model), score_documents(documents[:50], model))
@@ -0,0 +1,66 @@
+import pickle
+import zlib
+from collections import OrderedDict
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo.database import Database
+
+from src.lib.analytics.anomalizer import FraudModel
+from src.lib.utils.config import MODEL_CACHE_SIZE
+
+
+# The most recently used fraud models of this process, keyed by simulation id
+fraud_models: OrderedDict = OrderedDict()
+
+
+def remember(simulation_id: str, model: FraudModel):
+    # Keep a model in the process cache, evicting the least recently used
+    fraud_models[simulation_id] = model
+    fraud_models.move_to_end(simulation_id)
+
+    while len(fraud_models) > MODEL_CACHE_SIZE:
+        fraud_models.popitem(last=False)
+
+
+async def save_fraud_model(simulation_id: str, model: FraudModel, db: Database):
+    """
+        Persist the fitted fraud model of a simulation
+
+        @param simulation_id: The id of the simulation
+        @param model: The fitted fraud model
+        @param db: The database
+    """
+    bucket = AsyncIOMotorGridFSBucket(db, bucket_name='simulation_models')
+
+    # Replace the model of a simulation that is fitted again
+    try:
+        await bucket.delete(simulation_id)
+    except NoFile:
+        pass
+
+    await bucket.upload_from_stream_with_id(simulation_id, f'{simulation_id}.pkl', zlib.compress(pickle.dumps(model)))
+    remember(simulation_id, model)
+
+
+async def load_fraud_model(simulation_id: str, db: Database) -> FraudModel | None:
+    """
+        Get the fitted fraud model of a simulation
+
+        @param simulation_id: The id of the simulation
+        @param db: The database
+
+        @return: The fraud model, None when the simulation has none
+    """
+    if simulation_id in fraud_models:
+        fraud_models.move_to_end(simulation_id)
+        return fraud_models[simulation_id]
+
+    bucket = AsyncIOMotorGridFSBucket(db, bucket_name='simulation_models')
+    try:
+        stream = await bucket.open_download_stream(simulation_id)
+    except NoFile:
+        return None
+
+    model = pickle.loads(zlib.decompress(await stream.read()))
+    remember(simulation_id, model)
+    return model
@@ -28,14 +28,23 @@ def hound(df: pd.DataFrame, run=lambda d, t: (d, t)):
     return results
 
 
-def distance(latA, lonA, latB, lonB):
-    # Get the distance between 2 locations
+def haversine(latA, lonA, latB, lonB):
+    """
+        Vectorised haversine kernel, inputs broadcast against each other. Equally sized sets give the
+        distance of every origin to its destination, origins as a column against destinations as a row
+        give the N×M matrix of every pair
+
+        @params latA, lonA: The origin coordinates in degrees
+        @params latB, lonB: The destination coordinates in degrees
+
+        @returns: The distances in km
+    """
 
     # Radius of the earth
     R = 6371
 
     # Convert degrees to radians
-    latA, lonA, latB, lonB = map(np.radians, [latA, lonA, latB, lonB])
+    latA, lonA, latB, lonB = (np.radians(np.asarray(x, dtype=float)) for x in (latA, lonA, latB, lonB))
 
     # Difference
     lat_diff = latB - latA
@@ -45,38 +54,69 @@ def distance(latA, lonA, latB, lonB):
     a = np.sin(lat_diff / 2.0)**2 + np.cos(latA) * np.cos(latB) * np.sin(lon_diff / 2.0)**2
     c = 2 * np.arcsin(np.sqrt(a))
 
-    return R * c
+    # Scalars in, scalar out
+    return (R * c)[()]
+
+
+def window_starts(codes: np.ndarray, times: np.ndarray, window) -> np.ndarray:
+    """
+        Get the position where the time window of every row starts, for rows sorted by group and time.
+
+        @params codes: The group code of every row.
+        @params times: The time of every row, in nanoseconds.
+        @params window: The length of the window.
+
+        @returns starts: The position of the first row of the same group inside the window.
+    """
+    size = len(codes)
+
+    # Merge the rows with the start of their windows, ties put the rows first so they fall outside the window
+    order = np.lexsort((
+        np.repeat([0, 1], size),
+        np.concatenate([times, times - pd.Timedelta(window).value]),
+        np.concatenate([codes, codes])
+    ))
+    is_start = order >= size
+
+    starts = np.empty(size, dtype=np.int64)
+    starts[order[is_start] - size] = np.cumsum(~is_start)[is_start]
+    return starts
 
 
-def rolling_averages(df, group, features, window):
+def rolling_averages(df, group, features, windows, on='time'):
     """
-        Add rolling averages grouped by `group` back to original DataFrame.
+        Get the time-based rolling averages of features within each group, for every window in one pass.
 
         @params df: The dataframe to use.
         @params group: How the dataframe should be grouped.
         @params features: The features to roll.
-        @params window: Number of days to roll.
+        @params windows: The time windows to roll over, e.g. '7D'.
+        @params on: The time column the windows are measured on.
 
-        @returns df: A dataframe containing the original dataframe and the rolled values.
+        @returns df: A dataframe of the rolled values, aligned with the original dataframe.
     """
 
-    # Copy the dataframe
-    df = df.sort_values([group, "date"]).copy()
-    data = df[[group, *features]]
+    # Sort once by group and time
+    data = df[[group, *features]].copy()
+    data[on] = pd.to_datetime(df[on], format='ISO8601')
+    data = data.sort_values([group, on], kind='stable')
 
-    columns = []
-    for feature in features:
-        # Name the average feature
-        rolled_col = f"{group}_{feature}_avg_{window}D"
-        columns.append(rolled_col)
+    codes = pd.factorize(data[group])[0]
+    times = data[on].to_numpy().astype('datetime64[ns]').astype(np.int64)
+    ends = np.arange(1, len(data) + 1)
 
-        # Group and get the average of the feature within the window
-        df[rolled_col] = (
-            data.groupby(group)[feature]
-              .transform(lambda x: x.rolling(window, min_periods=1).mean())
-        )
-    
-    return df[columns]
+    # Prefix sums turn every window into a difference of two lookups
+    values = data[features].to_numpy(dtype=float)
+    sums = np.vstack([np.zeros(len(features)), np.nancumsum(values, axis=0)])
+    counts = np.vstack([np.zeros(len(features)), np.cumsum(~np.isnan(values), axis=0)])
 
+    columns = {}
+    for window in windows:
+        starts = window_starts(codes, times, window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = (sums[ends] - sums[starts]) / (counts[ends] - counts[starts])
 
+        for position, feature in enumerate(features):
+            columns[f"{group}_{feature}_avg_{window}"] = means[:, position]
 
+    return pd.DataFrame(columns, index=data.index).reindex(df.index)
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from src.lib.analytics import tracker
+
+
+def test_rolling_averages_use_time_windows():
+    rng = np.random.default_rng(3)
+    size = 300
+    df = pd.DataFrame({
+        'holder': rng.choice(['A', 'B', 'C'], size),
+        'amount': rng.uniform(0, 1000, size),
+        'balance': rng.uniform(0, 1000, size),
+        'time': pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 60 * 60 * 24 * 20, size), unit='s'),
+    }).sample(frac=1, random_state=1)
+
+    rolled = tracker.rolling_averages(df, 'holder', ['amount', 'balance'], ['1D', '7D'])
+
+    assert list(rolled.columns) == ['holder_amount_avg_1D', 'holder_balance_avg_1D', 'holder_amount_avg_7D', 'holder_balance_avg_7D']
+    assert rolled.index.equals(df.index)
+
+    # Every row averages the rows of its holder within the window ending at its time
+    for idx, row in df.sample(40, random_state=2).iterrows():
+        for window in ['1D', '7D']:
+            earlier = df[(df['holder'] == row['holder']) & (df['time'] <= row['time']) & (df['time'] > row['time'] - pd.Timedelta(window))]
+            for feature in ['amount', 'balance']:
+                assert np.isclose(rolled.loc[idx, f'holder_{feature}_avg_{window}'], earlier[feature].mean())
+
+
+def test_haversine_broadcasts_to_pairs_and_matrices():
+    rng = np.random.default_rng(5)
+    lat, lon = rng.uniform(-60, 60, 4), rng.uniform(-180, 180, 4)
+    lats, lons = rng.uniform(-60, 60, 6), rng.uniform(-180, 180, 6)
+
+    matrix = tracker.haversine(lat[:, None], lon[:, None], lats[None, :], lons[None, :])
+    assert matrix.shape == (4, 6)
+    assert np.allclose(matrix[2], tracker.haversine(lat[2], lon[2], lats, lons))
+    assert np.allclose(np.diag(matrix[:, :4]), tracker.haversine(lat, lon, lats[:4], lons[:4]))
+    assert np.isclose(tracker.haversine(0, 0, 0, 1), 6371 * np.pi / 180)
+    assert isinstance(tracker.haversine(9, 3, 9.1, 3.1), float)
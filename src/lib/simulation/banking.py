@@ -1,12 +1,15 @@
-import random
+import numpy as np
 import pandas as pd
-from uuid import uuid4
 from collections import defaultdict
 import asyncio
 
+from src.lib.simulation.batching import pick_near
 from src.lib.simulation.generator import random_location
 from src.lib.simulation.generator import random_amount
 from src.lib.simulation.clock import global_clock
+from src.lib.simulation.ledger import Ledger
+from src.lib.simulation.rng import RandomStream
+from src.lib.simulation.spatial import SpatialIndex
 from src.models.simulation_devices import CreateSimulationDevice, DeviceType
 
 
@@ -15,7 +18,7 @@ class Bank:
         Simulate the operation of a bank
     """
 
-    def __init__(self, name: str, locations: pd.DataFrame, transactions: pd.DataFrame = pd.DataFrame(), accounts: pd.DataFrame = pd.DataFrame(), devices: pd.DataFrame = pd.DataFrame(), fraudulence = 0.05):
+    def __init__(self, name: str, locations: pd.DataFrame, transactions: pd.DataFrame = pd.DataFrame(), accounts: pd.DataFrame = pd.DataFrame(), devices: pd.DataFrame = pd.DataFrame(), fraudulence = 0.05, location_index: SpatialIndex = None, rng: RandomStream = None):
         """
             Initialize a bank
 
@@ -24,14 +27,64 @@ class Bank:
             @param transactions: The transactions of the bank
             @param accounts: The bank accounts of the bank
             @param devices: The ATM devices of the bank
+            @param location_index: The spatial index over the locations
+            @param rng: The random stream of the bank
         """
         self.name = name
-        self.transactions = transactions
-        self.accounts = accounts
-        self.devices = devices
+        self.transaction_ledger = Ledger.from_frame(transactions, dtypes={'amount': float, 'balance': float})
+        self.account_ledger = Ledger.from_frame(accounts, key='account_no', dtypes={'balance': float})
+        self.device_ledger = Ledger.from_frame(devices, key='device_id', capacity=8)
         self.locations = locations
+        self.location_index = location_index
         self._lock = defaultdict(asyncio.Lock)
         self.fraudulence = fraudulence
+        self.rng = rng if rng is not None else RandomStream()
+
+        # When sharded, the accounts this shard settles and the operations it defers to other shards
+        self.owned = None
+        self.outbox = []
+        self.account_numbers = None
+
+
+    def __getstate__(self):
+        # Locks belong to the event loop that used them, each run starts with fresh ones
+        state = dict(vars(self))
+        state['_lock'] = defaultdict(asyncio.Lock)
+        return state
+
+
+    @property
+    def transactions(self) -> pd.DataFrame:
+        # Materialise the transactions of the bank
+        return self.transaction_ledger.to_frame()
+
+
+    @property
+    def accounts(self) -> pd.DataFrame:
+        # Materialise the accounts of the bank
+        return self.account_ledger.to_frame()
+
+
+    @property
+    def devices(self) -> pd.DataFrame:
+        # Materialise the devices of the bank
+        return self.device_ledger.to_frame()
+
+
+    def get_account(self, account_no) -> dict:
+        """
+            Get an account of the bank through the account index
+
+            @param account_no: The account number
+
+            @return: The account details
+        """
+        return self.account_ledger.row(self.account_ledger.locate(account_no))
+
+
+    def get_balance(self, account_no) -> float:
+        # Read the balance slot of an account
+        return self.account_ledger.get(self.account_ledger.locate(account_no), 'balance')
 
 
     async def generate_device(self):
@@ -41,20 +94,20 @@ class Bank:
         """
 
         # Assign bank device a random location
-        location = await random_location(self.locations)
+        location = await random_location(self.locations, rng=self.rng)
 
         # Set a unique identifier for the device
-        device_id = f"ATM_{self.name}_{uuid4()}"
-        # Set device details
+        device_id = f"ATM_{self.name}_{self.rng.uuid()}"
+        # Set device details, the wall clock stamps are added when the device is saved
         device = CreateSimulationDevice(
             device_id=device_id,
             owner=self.name,
             type='ATM',
             latitude=location['latitude'],
             longitude=location['longitude'],
-        ).model_dump()
+        ).model_dump(exclude={'created_at', 'updated_at'})
 
-        self.devices = pd.concat([self.devices, pd.DataFrame([device])])
+        self.device_ledger.append(device)
         return device
     
 
@@ -67,23 +120,25 @@ class Bank:
             @return: A dictionary containing bank account information.
         """
 
-        account_no = f"ACC_{(len(self.accounts) + 1):010}"
+        # Shards number new accounts on their own stride so they never collide
+        number = next(self.account_numbers) if self.account_numbers is not None else len(self.account_ledger) + 1
+        account_no = f"ACC_{number:010}"
 
         # Set a random kyc level for account
-        kyc = kyc if kyc is not None else random.choices([1, 2, 3], [.7, .19, .109], k=1)[0]
+        kyc = kyc if kyc is not None else self.rng.choices([1, 2, 3], [.7, .19, .109], k=1)[0]
 
         # Set location for where this account is opened
         location = (
             {'latitude': user['latitude'], 'longitude': user['longitude']} 
-            if random.random() > .3 
-            else await random_location(self.locations, user['latitude'], user['longitude'])
+            if self.rng.random() > .3 
+            else await random_location(self.locations, user['latitude'], user['longitude'], index=self.location_index, rng=self.rng)
         )
 
         # Set a random amount as the opening amount based on the account's kyc level
-        opening_balance = random_amount(kyc)
+        opening_balance = random_amount(kyc, rng=self.rng)
 
         # Select a random device for the user
-        device = random.choice(user['devices'])
+        device = self.rng.choice(user['devices'])
 
         # Initialize accout with basic information
         account = {
@@ -93,7 +148,7 @@ class Bank:
             'kyc': kyc,
             'bvn': user['user_id'],
             'bank_name': self.name,
-            'merchant': random.random() > 0.9,
+            'merchant': self.rng.random() > 0.9,
             'opening_device': device
         }
 
@@ -112,27 +167,120 @@ class Bank:
             'category': 'OPENING',
             'channel': 'APP',
             'device': device,
-            'reference': str(uuid4()),
+            'reference': str(self.rng.uuid()),
             'reported': False
         }
 
         # Add opening transaction to the bank transactions
         await self.add_transaction(opening_transaction)
 
-        # Add account to the account dataframe
-        self.accounts = pd.concat([self.accounts, pd.DataFrame([account])])
+        # Add account to the account ledger
+        self.account_ledger.append(account)
+        if self.owned is not None:
+            self.owned.add(account_no)
 
         return account
     
 
+    async def open_accounts(self, users: list) -> list:
+        """
+            Opens a bank account for each user at once, drawing the same details as open_account.
+            @param users: The user data
+
+            @return: A DataFrame containing the opened accounts.
+        """
+        count = len(users)
+        if not count:
+            return pd.DataFrame()
+
+        generator = self.rng.generator
+        numbers = [next(self.account_numbers) for _ in range(count)] if self.account_numbers is not None else range(len(self.account_ledger) + 1, len(self.account_ledger) + count + 1)
+        account_nos = [f"ACC_{number:010}" for number in numbers]
+
+        # Set random kyc levels and opening amounts based on them
+        chances = np.array([.7, .19, .109])
+        kycs = generator.choice([1, 2, 3], size=count, p=chances / chances.sum())
+        balances = np.round(100 + ((10. ** kycs) * 10000 - 100) * generator.random(count), 2)
+
+        # Most accounts are opened where the user lives, the rest somewhere nearby
+        latitudes = np.array([user['latitude'] for user in users], dtype=float)
+        longitudes = np.array([user['longitude'] for user in users], dtype=float)
+        away = generator.random(count) <= .3
+        if away.any():
+            rows = (
+                pick_near(generator, self.location_index, self.locations.index, latitudes[away], longitudes[away])
+                if self.location_index is not None
+                else np.full(int(away.sum()), -1)
+            )
+            rows = np.where(rows >= 0, rows, generator.integers(len(self.locations), size=len(rows)))
+            latitudes[away] = self.locations['latitude'].to_numpy(dtype=float)[rows]
+            longitudes[away] = self.locations['longitude'].to_numpy(dtype=float)[rows]
+
+        # Select a random device for each user
+        picks = generator.random(count)
+        devices = [user['devices'][int(pick * len(user['devices']))] for user, pick in zip(users, picks)]
+        merchants = generator.random(count) > 0.9
+
+        accounts = {
+            'account_no': account_nos,
+            'account_name': [user['name'] for user in users],
+            'balance': balances,
+            'kyc': kycs,
+            'bvn': [user['user_id'] for user in users],
+            'bank_name': [self.name] * count,
+            'merchant': merchants,
+            'opening_device': devices,
+        }
+
+        # The opening transactions, with the columns in the order open_account records them
+        self.transaction_ledger.extend_columns({
+            'amount': balances,
+            'balance': balances,
+            'time': global_clock.advance_many(count, 5),
+            'holder': account_nos,
+            'holder_bank': [self.name] * count,
+            'related': [self.name] * count,
+            'related_bank': [self.name] * count,
+            'latitude': latitudes,
+            'longitude': longitudes,
+            'status': ['SUCCESS'] * count,
+            'type': ['CREDIT'] * count,
+            'category': ['OPENING'] * count,
+            'channel': ['APP'] * count,
+            'device': devices,
+            'reference': self.rng.uuids(count),
+            'reported': np.zeros(count, dtype=bool),
+        })
+
+        self.account_ledger.extend_columns(accounts)
+        if self.owned is not None:
+            self.owned.update(account_nos)
+
+        return pd.DataFrame(accounts)
+
+
+    def defer(self, operation: str, **details) -> dict:
+        """
+            Hold an operation on an account another shard settles
+
+            @param operation: The bank method to run, debit or credit
+            @param details: The arguments of the operation
+
+            @return: The pending operation
+        """
+        message = {'operation': operation, 'bank': self.name, 'details': details}
+        self.outbox.append(message)
+        return {**details, 'status': 'PENDING'}
+
+
     async def add_transaction(self, transaction):
         """
-            Adds a transaction to the transactions dataframe
+            Adds a transaction to the transactions ledger
             @params transaction: The transaction to add
         """
 
         # Add transaction
-        self.transactions = pd.concat([self.transactions, pd.DataFrame([transaction])], ignore_index=True)
+        self.transaction_ledger.append(transaction)
         return transaction
 
 
@@ -152,8 +300,6 @@ class Bank:
             # Add device to the general banks device list
             devices.append(device)
 
-        # Store devices
-        self.devices = pd.DataFrame(devices)
         return devices
     
 
@@ -164,18 +310,8 @@ class Bank:
 
             @return: A DataFrame containing bank accounts information.
         """
-        accounts = []
-
-        # Initialize a random list of bank accounts
-        for user in users:
-            account = await self.open_account(user)
-
-            # Add account to the general banks account list
-            accounts.append(account)
-
-        # store accounts
-        self.accounts = pd.DataFrame(accounts)
-        return accounts
+        # Open the accounts in one pass
+        return await self.open_accounts(users)
     
 
     async def setup(self, num_devices: int, users: list):
@@ -211,45 +347,52 @@ class Bank:
             @return: The debit transaction details
         """
 
+        # Accounts of other shards are settled there at the next tick
+        if self.owned is not None and account_no not in self.owned:
+            return self.defer('debit', account_no=account_no, related=related, related_bank=related_bank, amount=amount, device_id=device_id, location=location, category=category, channel=channel, reference=reference)
+
         # Deterine if the transaction will be successful, randomly. All reversals must be successful.
+        status = 'SUCCESS' if category == 'REVERSAL' else self.rng.choices(['SUCCESS', 'FAILED'], [0.7, 0.3], k=1)[0]
+        position = self.account_ledger.locate(account_no)
+
+        # Only the balance read-modify-write needs to hold the account lock
         async with self._lock[account_no]:
-            status = 'SUCCESS' if category == 'REVERSAL' else random.choices(['SUCCESS', 'FAILED'], [0.7, 0.3], k=1)[0]
-            account = self.accounts.loc[self.accounts['account_no'] == account_no].squeeze()
+            current_balance = self.account_ledger.get(position, 'balance')
 
             # Get the balance of the transaction
-            balance = round(account['balance'] - amount, 2) if status == 'SUCCESS' else account['balance']
+            balance = round(current_balance - amount, 2) if status == 'SUCCESS' else current_balance
 
             # Transaction fails if the balance is insufficient.
             if balance < 0:
                 status = 'FAILED'
             else:
                 # Update user account balance
-                self.accounts.loc[self.accounts['account_no'] == account_no, 'balance'] = balance
-
-            # Randomly report this transaction
-            reported = random.random() < self.fraudulence  if status == 'SUCCESS' else False
-
-            transaction = {
-                'amount': amount,
-                'balance': balance,
-                'time': global_clock.advance(60),
-                'holder': account_no,
-                'holder_bank': account['bank_name'],
-                'related': related,
-                'related_bank': related_bank,
-                **location,
-                'channel': channel,
-                'device': device_id,
-                'status': status,
-                'category': category,
-                'type': 'DEBIT',
-                'reference': reference,
-                'reported': reported
-            }
-
-            # Save transaction
-            await self.add_transaction(transaction)
-            return transaction
+                self.account_ledger.set(position, 'balance', balance)
+
+        # Randomly report this transaction
+        reported = self.rng.random() < self.fraudulence  if status == 'SUCCESS' else False
+
+        transaction = {
+            'amount': amount,
+            'balance': balance,
+            'time': global_clock.advance(60),
+            'holder': account_no,
+            'holder_bank': self.name,
+            'related': related,
+            'related_bank': related_bank,
+            **location,
+            'channel': channel,
+            'device': device_id,
+            'status': status,
+            'category': category,
+            'type': 'DEBIT',
+            'reference': reference,
+            'reported': reported
+        }
+
+        # Save transaction
+        await self.add_transaction(transaction)
+        return transaction
 
 
     async def credit(self, account_no, related, related_bank, amount, device_id, location, category, channel, reference):
@@ -267,35 +410,40 @@ class Bank:
 
             @return: The credit transaction details
         """
-        async with self._lock[account_no]:
-            account = self.accounts.loc[self.accounts['account_no'] == account_no].squeeze()
+        # Accounts of other shards are settled there at the next tick
+        if self.owned is not None and account_no not in self.owned:
+            return self.defer('credit', account_no=account_no, related=related, related_bank=related_bank, amount=amount, device_id=device_id, location=location, category=category, channel=channel, reference=reference)
+
+        position = self.account_ledger.locate(account_no)
 
+        # Only the balance read-modify-write needs to hold the account lock
+        async with self._lock[account_no]:
             # Get the balance of the transaction
-            balance = round(account['balance'] + amount)
+            balance = round(self.account_ledger.get(position, 'balance') + amount)
 
             # Update the account balance
-            self.accounts.loc[self.accounts['account_no'] == account_no, 'balance'] = balance
-
-            # Randomly report this transaction
-            reported = random.random() < self.fraudulence
-
-            transaction = {
-                'amount': amount,
-                'balance': balance,
-                'time': global_clock.advance(60),
-                'holder': account_no,
-                'holder_bank': account['bank_name'],
-                'related': related,
-                'related_bank': related_bank,
-                **location,
-                'channel': channel,
-                'device': device_id,
-                'status': 'SUCCESS',
-                'category': category,
-                'type': 'CREDIT',
-                'reference': reference,
-                'reported': reported
-            }
-
-            await self.add_transaction(transaction)
-            return transaction
+            self.account_ledger.set(position, 'balance', balance)
+
+        # Randomly report this transaction
+        reported = self.rng.random() < self.fraudulence
+
+        transaction = {
+            'amount': amount,
+            'balance': balance,
+            'time': global_clock.advance(60),
+            'holder': account_no,
+            'holder_bank': self.name,
+            'related': related,
+            'related_bank': related_bank,
+            **location,
+            'channel': channel,
+            'device': device_id,
+            'status': 'SUCCESS',
+            'category': category,
+            'type': 'CREDIT',
+            'reference': reference,
+            'reported': reported
+        }
+
+        await self.add_transaction(transaction)
+        return transaction
\ No newline at end of file
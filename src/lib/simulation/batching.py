@@ -0,0 +1,331 @@
+from time import perf_counter
+import numpy as np
+import pandas as pd
+
+from src.lib.simulation import clock
+from src.lib.simulation.individual import EVENTS
+from src.lib.simulation.spatial import SpatialIndex
+
+# The radius in km of a nearby draw and the chance of each, as in the generator helpers
+RADIUS_LIMITS = np.array([1, 10, 100, 1000, 10000])
+RADIUS_CHANCES = np.array([1, .5, .1, .05, .001])
+
+# The share of the balance an event can spend, the last chance is the fraudulence
+SPEND_SHARES = np.array([.1, .4, .7, 1])
+SPEND_CHANCES = [.7, .19, .109]
+
+# The events that debit the holder first and only go on if the debit succeeded
+DEBIT_FIRST = np.isin(EVENTS, ['ATM_WITHDRAWAL', 'ATM_PAYMENT', 'POS_WITHDRAWAL', 'POS_PAYMENT', 'MOBILE_TRANSFER'])
+KIND = {event: position for position, event in enumerate(EVENTS)}
+
+# The columns of a transaction, in the order Bank.debit records them
+TRANSACTION_COLUMNS = ['amount', 'balance', 'time', 'holder', 'holder_bank', 'related', 'related_bank', 'latitude', 'longitude', 'channel', 'device', 'status', 'category', 'type', 'reference', 'reported']
+
+
+def offsets(generator: np.random.Generator, counts: np.ndarray) -> np.ndarray:
+    # A uniform offset inside each group of counts items, zero for empty groups
+    return np.floor(generator.random(len(counts)) * counts).astype(int)
+
+
+def pick_near(generator: np.random.Generator, index: SpatialIndex, labels: pd.Index, lats, lons) -> np.ndarray:
+    """
+        Pick a random indexed point near each location
+
+        @param generator: The generator to draw with
+        @param index: The spatial index over the points
+        @param labels: The labels of the frame the points are picked from
+        @param lats: The latitudes
+        @param lons: The longitudes
+
+        @return: The row of the picked point in the frame, -1 where no point is near
+    """
+    size = len(lats)
+    chances = RADIUS_CHANCES / RADIUS_CHANCES.sum()
+    radii = generator.random(size) * RADIUS_LIMITS[generator.choice(len(RADIUS_LIMITS), size=size, p=chances)]
+
+    rows, positions = index.query_many(lats, lons, radii)
+    counts = np.bincount(rows, minlength=size)
+    if not len(positions):
+        return np.full(size, -1)
+
+    picked = positions[np.minimum(np.cumsum(counts) - counts + offsets(generator, counts), len(positions) - 1)]
+    frame_rows = labels.get_indexer(np.asarray(index.keys, dtype=object)[picked])
+    return np.where(counts > 0, frame_rows, -1)
+
+
+def pick_accounts(generator: np.random.Generator, kyc: np.ndarray, holders: np.ndarray) -> np.ndarray:
+    """
+        Pick a random account other than the holder, favouring the higher kyc levels like random_account
+
+        @param generator: The generator to draw with
+        @param kyc: The kyc level of every account
+        @param holders: The account of each holder
+
+        @return: The picked account of each holder
+    """
+    size, count = len(holders), len(kyc)
+    order = np.argsort(kyc, kind='stable')
+    levels = generator.choice([1, 2, 3, 4], size=size, p=[.1, .2, .3, .4])
+
+    # Accounts at or above the level sit at the end of the sorted order, all of them when there are none
+    starts = np.searchsorted(kyc[order], levels)
+    starts = np.where(starts < count, starts, 0)
+    picks = order[starts + offsets(generator, count - starts)]
+
+    # A holder that picked itself picks again from every other account
+    others = generator.integers(count - 1, size=size)
+    others += others >= holders
+    return np.where(picks == holders, others, picks)
+
+
+def pick_user_devices(generator: np.random.Generator, devices: list, users: np.ndarray) -> np.ndarray:
+    """
+        Pick the device of a transaction, rarely the holder's own and mostly the device of a random user
+
+        @param generator: The generator to draw with
+        @param devices: The devices of every user
+        @param users: The user of each holder
+
+        @return: The picked device of each holder
+    """
+    counts = np.array([len(x) for x in devices])
+    starts = np.cumsum(counts) - counts
+    flat = np.concatenate([np.asarray(x, dtype=object) for x in devices])
+
+    size = len(users)
+    users = np.where(generator.random(size) >= .95, users, generator.integers(len(devices), size=size))
+    return flat[starts[users] + offsets(generator, counts[users])]
+
+
+def settle_leg(balances: np.ndarray, positions: np.ndarray, amounts: np.ndarray, debit: bool, draws: np.ndarray) -> tuple:
+    """
+        Apply one debit or credit to accounts that each appear once, like Bank.debit and Bank.credit
+
+        @param balances: The balance of every account, updated in place
+        @param positions: The accounts to settle
+        @param amounts: The amount of each
+        @param debit: Whether the leg debits the accounts
+        @param draws: Whether each debit drew a success, credits always succeed
+
+        @return: The balance recorded on each transaction and whether it succeeded
+    """
+    current = balances[positions]
+    if not debit:
+        recorded = np.round(current + amounts)
+        balances[positions] = recorded
+        return recorded, np.ones(len(positions), dtype=bool)
+
+    # A failed draw keeps the balance, an overdraft fails but still records the balance it would have left
+    recorded = np.where(draws, np.round(current - amounts, 2), current)
+    success = draws & (recorded >= 0)
+    balances[positions] = np.where(success, recorded, current)
+    return recorded, success
+
+
+async def run_tick(sim, size: int):
+    """
+        Run a batch of events with array operations. Each account settles its events in the order they were drawn,
+        events that share an account with an earlier pending event wait for the next round.
+
+        @param sim: The simulator
+        @param size: The number of events to draw
+    """
+    started = perf_counter()
+    world, rng = sim.world, sim.event_rng
+    generator = rng.generator
+    accounts = world.accounts
+    balances = world.balances()
+
+    candidates = sim.eligible_accounts(balances)
+    if not len(candidates) or len(accounts) < 2:
+        return
+
+    account_no = accounts['account_no'].to_numpy()
+    bank_name = accounts['bank_name'].to_numpy()
+    kyc = accounts['kyc'].to_numpy()
+
+    # Draw the holders and what they spend
+    holders = candidates[generator.integers(len(candidates), size=size)]
+    spend_chances = np.array([*SPEND_CHANCES, sim.fraudulence])
+    limits = np.minimum(SPEND_SHARES[generator.choice(len(SPEND_SHARES), size=size, p=spend_chances / spend_chances.sum())] * balances[holders], sim.max_amount)
+    limits = np.where(limits != 0, limits, (10.0 ** kyc[holders]) * 10000)
+    amounts = np.round(100 + (limits - 100) * generator.random(size), 2)
+    references = np.array([str(rng.uuid()) for _ in range(size)], dtype=object)
+    reverse = generator.random(size) < sim.fraudulence
+
+    # Draw the event of each holder from their behaviour
+    profiles = world.profiles
+    users = pd.Index(profiles['user_id']).get_indexer(accounts['bvn'].to_numpy()[holders])
+    cumulative = world.weights()[users]
+    totals = cumulative[:, -1]
+    kinds = (cumulative <= (generator.random(size) * totals)[:, None]).sum(axis=1)
+    kinds = np.where(totals > 0, kinds, -1)
+
+    holder_lat = profiles['latitude'].to_numpy()[users]
+    holder_lon = profiles['longitude'].to_numpy()[users]
+
+    # Details of each event, filled per kind
+    related = np.full(size, -1)
+    related_label = account_no[holders].copy()
+    related_bank = bank_name[holders].copy()
+    device = np.full(size, None, dtype=object)
+    latitude, longitude = holder_lat.copy(), holder_lon.copy()
+    channel = np.full(size, 'CARD', dtype=object)
+    categories = np.full((size, 2), None, dtype=object)
+    kind_of = lambda *names: np.isin(kinds, [KIND[name] for name in names])
+
+    # Card events at a bank device near the holder
+    atm = np.flatnonzero(kind_of('ATM_WITHDRAWAL', 'ATM_DEPOSIT', 'ATM_PAYMENT'))
+    if len(atm):
+        devices = world.devices
+        rows = pick_near(generator, world.device_index, devices.index, holder_lat[atm], holder_lon[atm])
+        rows = np.where(rows >= 0, rows, generator.integers(len(devices), size=len(atm)))
+        device[atm] = devices['device_id'].to_numpy()[rows]
+        latitude[atm], longitude[atm] = devices['latitude'].to_numpy()[rows], devices['longitude'].to_numpy()[rows]
+        related_label[atm], related_bank[atm] = device[atm], devices['owner'].to_numpy()[rows]
+
+    # Card payments at merchants near the holder
+    pos = np.flatnonzero(kind_of('POS_WITHDRAWAL', 'POS_PAYMENT'))
+    merchants = world.merchants
+    if len(pos) and merchants.empty:
+        kinds[pos] = -1
+    elif len(pos):
+        bvn = merchants['bvn'].to_numpy()
+        order = np.argsort(bvn, kind='stable')
+        merchant_users = pd.Index(np.unique(bvn))
+        rows = pick_near(generator, world.merchant_index, merchant_users, holder_lat[pos], holder_lon[pos])
+
+        # A near merchant user pays into one of their merchant accounts, otherwise any merchant account is paid
+        near = np.maximum(rows, 0)
+        starts = np.searchsorted(bvn[order], merchant_users.to_numpy()[near])
+        counts = np.searchsorted(bvn[order], merchant_users.to_numpy()[near], side='right') - starts
+        picks = np.where(rows >= 0, order[starts + offsets(generator, counts)], generator.integers(len(merchants), size=len(pos)))
+
+        related[pos] = merchants.index.to_numpy()[picks]
+        owners = pd.Index(profiles['user_id']).get_indexer(bvn[picks])
+        device[pos] = np.array([f'POS_{user_id.split("_")[-1]}' for user_id in bvn[picks]], dtype=object)
+        latitude[pos], longitude[pos] = profiles['latitude'].to_numpy()[owners], profiles['longitude'].to_numpy()[owners]
+
+    # Transfers and loans from a user device around the holder
+    mobile = np.flatnonzero(kind_of('MOBILE_TRANSFER', 'TAKE_LOAN'))
+    if len(mobile):
+        device[mobile] = pick_user_devices(generator, profiles['devices'].tolist(), users[mobile])
+        locations = sim.locations
+        rows = pick_near(generator, world.location_index, locations.index, holder_lat[mobile], holder_lon[mobile])
+        rows = np.where(rows >= 0, rows, generator.integers(len(locations), size=len(mobile)))
+        latitude[mobile], longitude[mobile] = locations['latitude'].to_numpy()[rows], locations['longitude'].to_numpy()[rows]
+        channel[mobile] = np.array(['APP', 'USSD'], dtype=object)[generator.choice(2, size=len(mobile), p=[.75, .25])]
+
+    # Payments and transfers go to another account of the simulation
+    paid = np.flatnonzero(kind_of('ATM_PAYMENT', 'MOBILE_TRANSFER'))
+    if len(paid):
+        related[paid] = pick_accounts(generator, kyc, holders[paid])
+
+    paid = np.flatnonzero(related >= 0)
+    related_label[paid], related_bank[paid] = account_no[related[paid]], bank_name[related[paid]]
+
+    # Categories of the holder and the related legs
+    shopping = np.array(['PAYMENT', 'BILL'], dtype=object)[generator.integers(2, size=size)]
+    for names, holder_category, related_category in [
+        (['ATM_WITHDRAWAL', 'POS_WITHDRAWAL'], 'WITHDRAWAL', 'DEPOSIT'),
+        (['ATM_DEPOSIT'], 'DEPOSIT', None),
+        (['ATM_PAYMENT', 'POS_PAYMENT'], shopping, shopping),
+        (['MOBILE_TRANSFER'], 'TRANSFER', 'TRANSFER'),
+        (['TAKE_LOAN'], 'LOAN', None),
+    ]:
+        mask = kind_of(*names)
+        categories[mask, 0] = holder_category[mask] if isinstance(holder_category, np.ndarray) else holder_category
+        categories[mask, 1] = related_category[mask] if isinstance(related_category, np.ndarray) else related_category
+
+    debit_first = (kinds >= 0) & DEBIT_FIRST[np.maximum(kinds, 0)]
+    draws = generator.random(size) < .7
+    settled = world.view('settled', lambda: np.concatenate([
+        np.ones(len(bank.account_ledger), dtype=bool) if bank.owned is None else np.isin(bank.account_ledger.column('account_no'), list(bank.owned))
+        for bank in sim.banks.values()
+    ]))
+
+    records, deferred = [], []
+    def record(events, leg, positions, labels, banks, kind, categories, recorded, success):
+        records.append({
+            'round': np.full(len(events), len(rounds)), 'event': events, 'leg': np.full(len(events), leg),
+            'amount': amounts[events], 'balance': recorded,
+            'holder': account_no[positions], 'holder_bank': bank_name[positions],
+            'related': labels, 'related_bank': banks,
+            'latitude': latitude[events], 'longitude': longitude[events],
+            'channel': channel[events], 'device': device[events],
+            'status': np.where(success, 'SUCCESS', 'FAILED').astype(object), 'category': categories,
+            'type': np.full(len(events), kind, dtype=object), 'reference': references[events],
+            'reported': (generator.random(len(events)) < sim.fraudulence) & success,
+        })
+
+    def settle(events, leg, positions, labels, banks, debit, categories, draws):
+        # Accounts of other shards are deferred to them, the rest are settled here
+        local = settled[positions]
+        for event, position, label, bank, category in zip(events[~local], positions[~local], labels[~local], banks[~local], categories[~local]):
+            deferred.append((event, leg, bank_name[position], 'debit' if debit else 'credit', {
+                'account_no': account_no[position], 'related': label, 'related_bank': bank, 'amount': amounts[event],
+                'device_id': device[event], 'location': {'latitude': latitude[event], 'longitude': longitude[event]},
+                'category': category, 'channel': channel[event], 'reference': references[event],
+            }))
+
+        events, positions, labels, banks, categories, draws = events[local], positions[local], labels[local], banks[local], categories[local], draws[local]
+        recorded, success = settle_leg(balances, positions, amounts[events], debit, draws)
+        record(events, leg, positions, labels, banks, 'DEBIT' if debit else 'CREDIT', categories, recorded, success)
+        return events, success
+
+    # Settle in rounds, an event goes once it is the earliest pending event of every account it touches
+    pending, rounds = np.flatnonzero(kinds >= 0), []
+    while len(pending):
+        first = np.full(len(accounts), size)
+        np.minimum.at(first, holders[pending], pending)
+        linked = pending[related[pending] >= 0]
+        np.minimum.at(first, related[linked], linked)
+        ready = (first[holders[pending]] == pending) & ((related[pending] < 0) | (first[np.maximum(related[pending], 0)] == pending))
+        events, pending = pending[ready], pending[~ready]
+        rounds.append(events)
+
+        # The holder is debited or credited first
+        debited = events[debit_first[events]]
+        done, success = settle(debited, 0, holders[debited], related_label[debited], related_bank[debited], True, categories[debited, 0], draws[debited])
+        credited = events[~debit_first[events]]
+        settle(credited, 0, holders[credited], related_label[credited], related_bank[credited], False, categories[credited, 0], np.ones(len(credited), dtype=bool))
+
+        # A successful debit pays the related account, then may be reversed on both sides
+        done = done[success]
+        paying = done[related[done] >= 0]
+        settle(paying, 1, related[paying], account_no[holders[paying]], bank_name[holders[paying]], False, categories[paying, 1], np.ones(len(paying), dtype=bool))
+
+        reversed_ = done[reverse[done]]
+        settle(reversed_, 2, holders[reversed_], related_label[reversed_], related_bank[reversed_], False, np.full(len(reversed_), 'REVERSAL', dtype=object), np.ones(len(reversed_), dtype=bool))
+        reversed_ = reversed_[related[reversed_] >= 0]
+        settle(reversed_, 3, related[reversed_], account_no[holders[reversed_]], bank_name[holders[reversed_]], True, np.full(len(reversed_), 'REVERSAL', dtype=object), np.ones(len(reversed_), dtype=bool))
+
+    # Write the balances back to the ledgers
+    starts = world.offsets
+    for bank, start, end in zip(sim.banks.values(), starts, starts[1:]):
+        bank.account_ledger.column('balance')[:] = balances[start:end]
+
+    for event, leg, name, operation, details in sorted(deferred, key=lambda item: item[:2]):
+        sim.banks[name].defer(operation, **details)
+
+    # Stamp the transactions round by round, each event's legs in order, and add them to the ledger of their bank
+    if records:
+        transactions = {column: np.concatenate([x[column] for x in records]) for column in records[0]}
+        order = np.lexsort((transactions['leg'], transactions['event'], transactions['round']))
+        transactions = {column: values[order] for column, values in transactions.items()}
+        transactions['time'] = np.array(clock.global_clock.advance_many(len(order), 60), dtype=object)
+
+        for name, bank in sim.banks.items():
+            mask = transactions['holder_bank'] == name
+            if mask.any():
+                bank.transaction_ledger.extend_columns({column: transactions[column][mask] for column in TRANSACTION_COLUMNS})
+
+    # New users come in as often as they do between single events
+    for event in np.flatnonzero((kinds >= 0) & (generator.random(size) > .995)):
+        await sim.grow(bank_name[holders[event]], sim.individuals[accounts['bvn'].iat[holders[event]]].profile)
+
+    # The latency is of the whole tick, its events are counted by type
+    for kind, events in enumerate(np.bincount(kinds[kinds >= 0], minlength=len(EVENTS))):
+        if events:
+            sim.telemetry.count(EVENTS[kind], events)
+    sim.telemetry.observe('TICK', perf_counter() - started)
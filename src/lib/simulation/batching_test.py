@@ -0,0 +1,64 @@
+import asyncio
+import numpy as np
+
+from src.lib.simulation import batching
+from src.lib.simulation.simulator import Simulator
+from src.lib.simulation.spatial import SpatialIndex
+
+
+def simulate(vectorised: bool, batch_size: int, seed=4) -> dict:
+    sim = Simulator(num_users=80, num_banks=3, min_amount=100, max_amount=100_000_000_000, geo=(9, 3), radius=10000, fraudulence=.05, seed=seed)
+    asyncio.run(sim.setup_reality())
+    asyncio.run(sim.simulate(60 * 60 * 24, 1, batch_size=batch_size, vectorised=vectorised))
+    return asyncio.run(sim.extract_data())
+
+
+def test_query_many_matches_query():
+    generator = np.random.default_rng(0)
+    lats, lons = 9 + generator.normal(0, .05, 300), 3 + generator.normal(0, .05, 300)
+    index = SpatialIndex(range(250), lats[:250], lons[:250])
+    for position in range(250, 300):
+        index.add(position, lats[position], lons[position])
+
+    radii = generator.uniform(0, 5, 20)
+    rows, positions = index.query_many(lats[:20], lons[:20], radii)
+    for row in range(20):
+        assert sorted(positions[rows == row].tolist()) == sorted(index.query(lats[row], lons[row], radii[row]))
+
+
+def test_settle_leg_follows_bank_rules():
+    balances = np.array([100., 50., 10.])
+
+    recorded, success = batching.settle_leg(balances, np.array([0, 1, 2]), np.array([30., 80., 5.]), True, np.array([True, True, False]))
+    assert recorded.tolist() == [70., -30., 10.]
+    assert success.tolist() == [True, False, False]
+    assert balances.tolist() == [70., 50., 10.]
+
+    recorded, success = batching.settle_leg(balances, np.array([1]), np.array([20.4]), False, np.array([True]))
+    assert recorded.tolist() == [70.] and success.all()
+
+
+def test_vectorised_ticks_keep_the_ledger_consistent():
+    data = simulate(True, 2000)
+    transactions, accounts = data['transactions'], data['accounts']
+
+    # Conflicting events settle one after the other, so every balance is the last one its account settled at
+    settled = transactions[transactions['status'] == 'SUCCESS'].groupby(['holder', 'holder_bank'])['balance'].last()
+    balances = accounts.set_index(['account_no', 'bank_name'])['balance']
+    assert np.allclose(settled.reindex(balances.index), balances)
+    assert (balances >= 0).all()
+
+    # Openings are stamped by the setup clock, everything after follows the simulation clock
+    simulated = transactions[transactions['category'] != 'OPENING']
+    assert simulated.groupby('holder_bank')['time'].apply(lambda x: x.is_monotonic_increasing).all()
+    assert set(transactions['category']) >= {'TRANSFER', 'WITHDRAWAL', 'DEPOSIT', 'LOAN'}
+    assert simulate(True, 2000)['transactions'].equals(transactions)
+
+
+def test_vectorised_ticks_match_the_event_mix():
+    single = simulate(False, 20)['transactions']
+    vectorised = simulate(True, 2000)['transactions']
+
+    mix = lambda x: x['category'].value_counts(normalize=True)
+    assert (mix(single) - mix(vectorised)).abs().max() < .05
+    assert abs((single['status'] == 'SUCCESS').mean() - (vectorised['status'] == 'SUCCESS').mean()) < .05
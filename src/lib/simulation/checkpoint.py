@@ -0,0 +1,137 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+import pickle
+import zlib
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo.database import Database
+
+from src.lib.simulation import clock
+from src.lib.utils.config import SIMULATION_BATCH_SIZE, SIMULATION_SHARDS, SIMULATION_VECTORISED
+
+# The settings of a simulation that change the data it generates
+PARAMETERS = ['min_num_user', 'num_banks', 'min_amount', 'max_amount', 'latitude', 'longitude', 'radius', 'fraudulence', 'days', 'seed']
+
+# Bump when the simulation generates different data for the same settings, older checkpoints and datasets are not reused
+DATASET_VERSION = 1
+
+
+def engine() -> dict:
+    # The settings of the simulation engine, which change the generated data too
+    return {'vectorised': SIMULATION_VECTORISED, 'batch_size': SIMULATION_BATCH_SIZE, 'shards': SIMULATION_SHARDS}
+
+
+def fingerprint(payload: dict, settings: dict = None) -> str:
+    """
+        Hash the settings of a simulation, checkpoints and cached datasets only serve simulations with the same settings
+
+        @param payload: The simulation
+        @param settings: The settings of the simulation engine, the configured ones when missing
+
+        @return: The hex digest of the settings
+    """
+    settings = engine() if settings is None else settings
+
+    # Numbers are compared as floats, so 9 and 9.0 give the same fingerprint
+    normalise = lambda value: float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+    parameters = {name: normalise(payload.get(name)) for name in PARAMETERS}
+    parameters['engine'] = {name: normalise(value) for name, value in settings.items()}
+    parameters['version'] = DATASET_VERSION
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def snapshot(sim, stage: str, digest: str) -> bytes:
+    """
+        Capture the state of a simulator between two steps
+
+        @param sim: The simulator, with its ledgers, random streams, individuals and sink
+        @param stage: How far the simulation got, SIMULATING or SIMULATED
+        @param digest: The fingerprint of the simulation settings
+
+        @return: The compressed checkpoint
+    """
+    # The clock is shared by the modules of the simulation, so it is saved next to the simulator
+    state = {'stage': stage, 'fingerprint': digest, 'simulator': sim, 'clock': dict(vars(clock.global_clock))}
+    return zlib.compress(pickle.dumps(state))
+
+
+def restore(data: bytes) -> dict:
+    """
+        Load a checkpoint and put the clock back where it was
+
+        @param data: The compressed checkpoint
+
+        @return: The stage, fingerprint and simulator of the checkpoint
+    """
+    state = pickle.loads(zlib.decompress(data))
+
+    # Modules hold on to the clock itself, so it is updated in place
+    vars(clock.global_clock).update(state.pop('clock'))
+    return state
+
+
+class DiskCheckpoints:
+    """
+        Checkpoints kept as files on local disk
+    """
+
+    def __init__(self, path):
+        """
+            Initialize a disk checkpoint store
+
+            @param path: The directory of the checkpoints
+        """
+        self.path = Path(path)
+
+
+    async def save(self, key: str, data: bytes):
+        # Write next to the checkpoint and swap it in, a crash mid write leaves the last checkpoint intact
+        self.path.mkdir(parents=True, exist_ok=True)
+        temporary = self.path / f'{key}.tmp'
+        temporary.write_bytes(data)
+        os.replace(temporary, self.path / f'{key}.ckpt')
+
+
+    async def load(self, key: str) -> bytes | None:
+        file_path = self.path / f'{key}.ckpt'
+        return file_path.read_bytes() if file_path.exists() else None
+
+
+    async def delete(self, key: str):
+        (self.path / f'{key}.ckpt').unlink(missing_ok=True)
+
+
+class GridFSCheckpoints:
+    """
+        Checkpoints kept in GridFS, so another worker can resume them
+    """
+
+    def __init__(self, db: Database):
+        """
+            Initialize a GridFS checkpoint store
+
+            @param db: The database
+        """
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name='simulation_checkpoints')
+
+
+    async def save(self, key: str, data: bytes):
+        # Uploads are not atomic, so the new checkpoint is written before the old one is dropped
+        file_id = await self.bucket.upload_from_stream(f'{key}.ckpt', data, metadata={'key': key})
+        async for stale in self.bucket.find({'metadata.key': key, '_id': {'$ne': file_id}}):
+            await self.bucket.delete(stale._id)
+
+
+    async def load(self, key: str) -> bytes | None:
+        try:
+            stream = await self.bucket.open_download_stream_by_name(f'{key}.ckpt')
+        except NoFile:
+            return None
+        return await stream.read()
+
+
+    async def delete(self, key: str):
+        async for stale in self.bucket.find({'metadata.key': key}):
+            await self.bucket.delete(stale._id)
@@ -0,0 +1,90 @@
+import asyncio
+import pandas as pd
+import pytest
+
+from src.lib.simulation import checkpoint
+from src.lib.simulation.simulator import Simulator
+from src.lib.simulation.sink import TransactionSink
+
+PERIOD = 60 * 60 * 24
+
+
+class Crash(Exception):
+    pass
+
+
+def setup(path) -> Simulator:
+    sim = Simulator(num_users=40, num_banks=3, min_amount=100, max_amount=100_000_000_000, geo=(9, 3), radius=10000, fraudulence=.05, seed=11)
+    sim.sink = TransactionSink(path, format='csv', flush_size=300)
+    sim.checkpoint_interval = 60 * 60 * 6
+    asyncio.run(sim.setup_reality())
+    return sim
+
+
+def collect(sim: Simulator) -> dict:
+    data = asyncio.run(sim.extract_data())
+    return {**data, 'transactions': pd.concat(data['transactions'], ignore_index=True)}
+
+
+def test_fingerprint_follows_the_settings():
+    payload = {'_id': '1', 'name': 'one', 'min_num_user': 40, 'num_banks': 3, 'days': 2, 'seed': 11}
+
+    assert checkpoint.fingerprint(payload) == checkpoint.fingerprint({**payload, '_id': '2', 'name': 'two'})
+    assert checkpoint.fingerprint(payload) != checkpoint.fingerprint({**payload, 'seed': 12})
+    assert checkpoint.fingerprint(payload) == checkpoint.fingerprint({**payload, 'days': 2.0})
+
+
+def test_fingerprint_follows_the_engine():
+    payload = {'min_num_user': 40, 'num_banks': 3, 'days': 2, 'seed': 11}
+    settings = checkpoint.engine()
+
+    assert checkpoint.fingerprint(payload) == checkpoint.fingerprint(payload, settings)
+    for name, value in [('vectorised', not settings['vectorised']), ('batch_size', settings['batch_size'] + 1), ('shards', settings['shards'] + 1)]:
+        assert checkpoint.fingerprint(payload, {**settings, name: value}) != checkpoint.fingerprint(payload)
+
+
+def test_resumed_simulation_matches_an_uninterrupted_one(tmp_path):
+    # Both runs checkpoint at the same times, so both flush the same parts
+    whole = setup(tmp_path / 'whole')
+    whole.checkpoint = lambda sim: asyncio.sleep(0)
+    asyncio.run(whole.simulate(PERIOD, 2, batch_size=200, vectorised=True))
+
+    store = checkpoint.DiskCheckpoints(tmp_path / 'checkpoints')
+    calls = []
+
+    async def crash_on_third(sim):
+        calls.append(sim)
+        if len(calls) == 3:
+            raise Crash()
+        await store.save('sim', checkpoint.snapshot(sim, 'SIMULATING', 'digest'))
+
+    crashed = setup(tmp_path / 'crashed')
+    crashed.checkpoint = crash_on_third
+    with pytest.raises(Crash):
+        asyncio.run(crashed.simulate(PERIOD, 2, batch_size=200, vectorised=True))
+
+    # The parts written after the second checkpoint are dropped and written again
+    state = checkpoint.restore(asyncio.run(store.load('sim')))
+    resumed: Simulator = state['simulator']
+    assert state['stage'] == 'SIMULATING' and resumed.checkpoint is None
+    written = len(resumed.sink.files())
+    resumed.sink.rollback()
+    assert len(resumed.sink.files()) < written
+    resumed.checkpoint = lambda sim: asyncio.sleep(0)
+    asyncio.run(resumed.simulate(PERIOD, 2, batch_size=200, vectorised=True, resume=True))
+
+    expected, actual = collect(whole), collect(resumed)
+    for name in expected:
+        assert actual[name].astype(str).equals(expected[name].astype(str)), name
+
+
+def test_disk_checkpoints_replace_and_delete(tmp_path):
+    store = checkpoint.DiskCheckpoints(tmp_path)
+
+    assert asyncio.run(store.load('sim')) is None
+    asyncio.run(store.save('sim', b'first'))
+    asyncio.run(store.save('sim', b'second'))
+    assert asyncio.run(store.load('sim')) == b'second'
+
+    asyncio.run(store.delete('sim'))
+    assert asyncio.run(store.load('sim')) is None
@@ -1,5 +1,7 @@
-import random
 from datetime import timedelta, datetime
+import numpy as np
+
+from src.lib.simulation.rng import RandomStream
 
 
 class SyntheticClock:
@@ -15,6 +17,8 @@ class SyntheticClock:
         """
         self.basetime = basetime
         self.ticker = 0
+        self.speed = 1
+        self.rng = RandomStream()
 
 
     def advance(self, sec=1):
@@ -26,14 +30,30 @@ class SyntheticClock:
             @return: The current time after ticking forward.
         """
 
-        # Pick a random number of seconds
-        self.ticker += random.randint(0, sec)
+        # Pick a random number of seconds, a clock shared by several shards steps faster
+        self.ticker += self.rng.randint(0, sec * self.speed)
 
         # Update the base time using the selected number of seconds
         time = self.basetime + timedelta(seconds=self.ticker)
         return time.isoformat()
     
 
+    def advance_many(self, count: int, sec=1) -> list:
+        """
+            Tick the clock forward count times at once.
+
+            @param count: The number of ticks.
+            @param sec: The number of seconds each tick can move forward.
+
+            @return: The time after each tick.
+        """
+        tickers = self.ticker + np.cumsum(self.rng.generator.integers(0, sec * self.speed, size=count, endpoint=True))
+        self.ticker = int(tickers[-1]) if count else self.ticker
+
+        # Matches the isoformat of advance, the ticker is in whole seconds
+        return np.datetime_as_string(np.datetime64(self.basetime, 's') + tickers.astype('timedelta64[s]'), unit='s').tolist()
+
+
     def now(self):
         """
             Returns the current time of the synthetic clock.
@@ -43,14 +63,17 @@ class SyntheticClock:
         return self.basetime + timedelta(seconds=self.ticker)
     
 
-    def reset(self, basetime = datetime(2023, 1, 1, 0, 0, 0)):
+    def reset(self, basetime = datetime(2023, 1, 1, 0, 0, 0), rng: RandomStream = None):
         """
             Resets the synthetic clock to a new base time.
 
             @param base_time: The new base time to reset to.
+            @param rng: The random stream to draw ticks from.
         """
         self.basetime = basetime
         self.ticker = 0
+        self.speed = 1
+        self.rng = rng if rng is not None else RandomStream()
 
 
 global_clock = SyntheticClock(datetime(2023, 1, 1, 0, 0, 0))
\ No newline at end of file
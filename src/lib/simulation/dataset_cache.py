@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+import os
+import shutil
+from pymongo.database import Database
+
+from src.lib.analytics.registry import load_fraud_model, save_fraud_model
+from src.lib.utils.config import DATASET_CACHE_PATH, DATASET_CACHE_SIZE, DATASET_CACHE_TTL
+
+# The collections holding the records of a simulation
+COLLECTIONS = ['simulation_transactions', 'simulation_devices', 'simulation_profiles', 'simulation_accounts']
+
+
+def link_tree(source, target):
+    """
+        Link every file of a directory into another, copying when they are on different devices
+
+        @param source: The directory to link from
+        @param target: The directory to link into
+    """
+    def link(src, dst):
+        # Writing over a linked file would change every dataset sharing it
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    shutil.copytree(source, target, copy_function=link, dirs_exist_ok=True)
+
+
+async def evict(entry: dict, db: Database):
+    # Drop a cached dataset, the simulation it came from keeps its own files and records
+    shutil.rmtree(entry['path'], ignore_errors=True)
+    await db.simulation_datasets.delete_one({'_id': entry['_id']})
+
+
+async def evict_datasets(db: Database):
+    """
+        Drop the datasets unused for longer than the ttl, then the least recently used beyond the cache size
+
+        @param db: The database
+    """
+    async for entry in db.simulation_datasets.find({'used_at': {'$lt': datetime.now() - timedelta(seconds=DATASET_CACHE_TTL)}}):
+        await evict(entry, db)
+
+    async for entry in db.simulation_datasets.find().sort('used_at', -1).skip(DATASET_CACHE_SIZE):
+        await evict(entry, db)
+
+
+async def find_dataset(digest: str, db: Database) -> dict | None:
+    """
+        Get the cached dataset of some simulation settings
+
+        @param digest: The fingerprint of the settings
+        @param db: The database
+
+        @return: The cache entry, None when there is no usable dataset
+    """
+    entry = await db.simulation_datasets.find_one({'_id': digest})
+    if entry is None:
+        return None
+
+    if entry['used_at'] < datetime.now() - timedelta(seconds=DATASET_CACHE_TTL) or not Path(entry['path']).exists():
+        await evict(entry, db)
+        return None
+
+    return entry
+
+
+async def store_dataset(digest: str, simulation_id: str, path: str, db: Database):
+    """
+        Cache the dataset of a saved simulation
+
+        @param digest: The fingerprint of the simulation settings
+        @param simulation_id: The id of the simulation, whose records are cloned on reuse
+        @param path: The directory of the simulation files
+        @param db: The database
+    """
+    # Linked files share their data with the simulation, so caching a dataset takes no extra space
+    target = Path(DATASET_CACHE_PATH) / digest
+    shutil.rmtree(target, ignore_errors=True)
+    link_tree(path, target)
+
+    now = datetime.now()
+    await db.simulation_datasets.replace_one(
+        {'_id': digest},
+        {'simulation_id': simulation_id, 'path': str(target), 'created_at': now, 'used_at': now, 'uses': 0},
+        upsert=True
+    )
+    await evict_datasets(db)
+
+
+async def forget_simulation(simulation_id: str, db: Database):
+    """
+        Drop the cached datasets a simulation serves, before its records are replaced
+
+        @param simulation_id: The id of the simulation
+        @param db: The database
+    """
+    async for entry in db.simulation_datasets.find({'simulation_id': simulation_id}):
+        await evict(entry, db)
+
+
+async def clone_dataset(entry: dict, simulation_id: str, path: str, db: Database) -> list:
+    """
+        Give a simulation the files, records, features and fraud model of a cached dataset
+
+        @param entry: The cache entry
+        @param simulation_id: The id of the simulation to clone into
+        @param path: The directory of the simulation files
+        @param db: The database
+
+        @return: The dataset files of the simulation
+    """
+    source = entry['simulation_id']
+    shutil.rmtree(path, ignore_errors=True)
+    link_tree(entry['path'], path)
+
+    # Records are copied by the server, they never leave the database
+    for name in COLLECTIONS:
+        await db[name].aggregate([
+            {'$match': {'simulation_id': source}},
+            {'$unset': '_id'},
+            {'$set': {'simulation_id': simulation_id}},
+            {'$merge': {'into': name}},
+        ]).to_list(None)
+
+    # Feature states are keyed by simulation, scope and key
+    await db.simulation_features.aggregate([
+        {'$match': {'simulation_id': source}},
+        {'$set': {'_id': {'$concat': [simulation_id, ':', '$scope', ':', {'$toString': '$key'}]}, 'simulation_id': simulation_id}},
+        {'$merge': {'into': 'simulation_features', 'whenMatched': 'replace'}},
+    ]).to_list(None)
+
+    model = await load_fraud_model(source, db)
+    if model is not None:
+        await save_fraud_model(simulation_id, model, db)
+
+    await db.simulation_datasets.update_one({'_id': entry['_id']}, {'$set': {'used_at': datetime.now()}, '$inc': {'uses': 1}})
+    return [str(file_path) for file_path in sorted(Path(path).glob('*.csv'))]
@@ -0,0 +1,22 @@
+from src.lib.simulation.dataset_cache import link_tree
+
+
+def test_link_tree_shares_files_without_writing_through(tmp_path):
+    source, cached, clone = tmp_path / 'source', tmp_path / 'cached', tmp_path / 'clone'
+    (source / 'transactions').mkdir(parents=True)
+    (source / 'accounts.csv').write_text('first')
+    (source / 'transactions' / 'part-00000.csv').write_text('part')
+
+    link_tree(source, cached)
+    assert (cached / 'accounts.csv').stat().st_ino == (source / 'accounts.csv').stat().st_ino
+    assert (cached / 'transactions' / 'part-00000.csv').read_text() == 'part'
+
+    # Linking over an existing file replaces it rather than writing into the file it shares
+    (clone / 'accounts.csv').parent.mkdir()
+    (clone / 'accounts.csv').write_text('stale')
+    link_tree(cached, clone)
+    (source / 'accounts.csv').unlink()
+    (source / 'accounts.csv').write_text('second')
+
+    assert (clone / 'accounts.csv').read_text() == 'first'
+    assert (cached / 'accounts.csv').read_text() == 'first'
@@ -1,10 +1,10 @@
 import pandas as pd
-import random
 
 from src.lib.simulation.banking import Bank
 from src.lib.simulation.generator import random_account, random_atm, random_merchant, random_user_device
-from src.lib.simulation.individual import Individual
+from src.lib.simulation.individual import EVENTS, Individual
 from src.lib.simulation.generator import random_location
+from src.lib.simulation.world import World
 
 
 class Events:
@@ -12,16 +12,18 @@ class Events:
         Simulate banking events
     """
 
-    def __init__(self, banks: dict, individuals: dict, locations: pd.DataFrame, fraudulence = 0.05):
+    def __init__(self, banks: dict, individuals: dict, locations: pd.DataFrame, fraudulence = 0.05, world: World = None):
         """
             Initialize events
 
             @param banks: The banks in the simulation
             @param individuals: The individuals in the simulation
             @param locations: The locations in the simulation
+            @param world: The shared views over the banks and individuals
         """
         self.banks = banks
         self.individuals = individuals
+        self.world = world if world is not None else World(banks, individuals)
         self.locations = locations
         self.fraudulence = fraudulence
 
@@ -36,6 +38,9 @@ class Events:
             'TAKE_LOAN': self.take_loan
         }
 
+        # The handlers by the position of their event type, as individuals draw them
+        self.handlers = [self.handler[event] for event in EVENTS]
+
     
     async def atm_withdrawal(self, holder, amount, reference, options: dict):
         """
@@ -46,11 +51,15 @@ class Events:
             @params reference: The reference of the transaction
             @params options: Abnormalities that can happen during this event
         """
+
+        # Draw from the stream of the account holder
+        rng = self.individuals[holder['bvn']].rng
+
         reverse = options.get('reverse', False)
 
         # Select a random bank device for this transaction
-        bank_devices = pd.concat([bank.devices for bank in self.banks.values()])
-        bank_device = await random_atm(bank_devices, holder['latitude'], holder['longitude'])
+        bank_devices = self.world.devices
+        bank_device = await random_atm(bank_devices, holder['latitude'], holder['longitude'], index=self.world.device_index, rng=rng)
 
         # Get the device id
         device_id = bank_device['device_id']
@@ -87,9 +96,12 @@ class Events:
             @params options: Abnormalities that can happen during this event
         """
 
+        # Draw from the stream of the account holder
+        rng = self.individuals[holder['bvn']].rng
+
         # Select a random bank device for this transaction
-        bank_devices = pd.concat([bank.devices for bank in self.banks.values()])
-        bank_device = await random_atm(bank_devices, holder['latitude'], holder['longitude'])
+        bank_devices = self.world.devices
+        bank_device = await random_atm(bank_devices, holder['latitude'], holder['longitude'], index=self.world.device_index, rng=rng)
 
         # Get the device id
         device_id = bank_device['device_id']
@@ -121,11 +133,14 @@ class Events:
             @params options: Abnormalities that can happen during this event
         """
 
+        # Draw from the stream of the account holder
+        rng = self.individuals[holder['bvn']].rng
+
         reverse = options.get('reverse', False)
 
         # Select a random bank device for this transaction
-        bank_devices = pd.concat([bank.devices for bank in self.banks.values()])
-        bank_device = await random_atm(bank_devices, holder['latitude'], holder['longitude'])
+        bank_devices = self.world.devices
+        bank_device = await random_atm(bank_devices, holder['latitude'], holder['longitude'], index=self.world.device_index, rng=rng)
 
         # Get the device id
         device_id = bank_device['device_id']
@@ -137,8 +152,7 @@ class Events:
         }
 
         # Select a random recipient account
-        accounts = pd.concat([bank.accounts for bank in self.banks.values()])
-        account = await random_account(accounts, exclude=holder['account_no'])
+        account = await random_account(self.world.accounts, exclude=holder['account_no'], rng=rng)
 
         # Set the relate account details
         related = account['account_no']
@@ -151,7 +165,7 @@ class Events:
         bank_of_related: Bank = self.banks[related_bank]
 
         # Set the category of the transaction randomly
-        category = random.choice(['PAYMENT', 'BILL'])
+        category = rng.choice(['PAYMENT', 'BILL'])
 
         # Debit the holder and update the transactions dataframe
         debit = await bank_of_holder.debit(account_no=holder['account_no'], related=related, related_bank=related_bank, amount=amount, device_id=device_id, location=location, category=category, channel='CARD', reference=reference)
@@ -179,12 +193,14 @@ class Events:
             @params reference: The reference of the transaction
             @params options: Abnormalities that can happen during this event
         """
+
+        # Draw from the stream of the account holder
+        rng = self.individuals[holder['bvn']].rng
+
         reverse = options.get('reverse', False)
 
         # Select a random merchant for this transaction
-        accounts = pd.concat([bank.accounts for bank in self.banks.values()])
-        profiles = pd.DataFrame([individual.profile for individual in self.individuals.values()])
-        merchant = await random_merchant(profiles, accounts, holder['latitude'], holder['longitude'])
+        merchant = await random_merchant(self.world.profiles, self.world.merchants, holder['latitude'], holder['longitude'], index=self.world.merchant_index, rng=rng)
         if merchant is None:
             return
         
@@ -233,12 +249,14 @@ class Events:
             @params reference: The reference of the transaction
             @params options: Abnormalities that can happen during this event
         """
+
+        # Draw from the stream of the account holder
+        rng = self.individuals[holder['bvn']].rng
+
         reverse = options.get('reverse', False)
 
         # Select a random merchant for this transaction
-        accounts = pd.concat([bank.accounts for bank in self.banks.values()])
-        profiles = pd.DataFrame([individual.profile for individual in self.individuals.values()])
-        merchant = await random_merchant(profiles, accounts, holder['latitude'], holder['longitude'])
+        merchant = await random_merchant(self.world.profiles, self.world.merchants, holder['latitude'], holder['longitude'], index=self.world.merchant_index, rng=rng)
 
         if merchant is None:
             return
@@ -263,7 +281,7 @@ class Events:
         bank_of_related: Bank = self.banks[related_bank]
 
         # Set the category of the transaction randomly
-        category = random.choice(['PAYMENT', 'BILL'])
+        category = rng.choice(['PAYMENT', 'BILL'])
 
         # Debit the holder and update the transactions dataframe
         debit = await bank_of_holder.debit(account_no=holder['account_no'], related=related, related_bank=related_bank, amount=amount, device_id=device_id, location=location, category=category, channel='CARD', reference=reference)
@@ -291,20 +309,23 @@ class Events:
             @params reference: The reference of the transaction
             @params options: Abnormalities that can happen during this event
         """
+
+        # Draw from the stream of the account holder
+        rng = self.individuals[holder['bvn']].rng
+
         reverse = options.get('reverse', False)
 
         # Get the user's BVN
         individual: Individual = self.individuals[holder['bvn']]
 
         # Select a random device belonging to the user or a random device
-        device_id = random.choice(individual.profile['devices']) if random.random() >= .95 else await random_user_device(self.individuals)
+        device_id = rng.choice(individual.profile['devices']) if rng.random() >= .95 else await random_user_device(self.world.profiles, rng=rng)
 
         # Set a location for the transaction (Randomly or User's Location)
-        location = await random_location(self.locations, holder['latitude'], holder['longitude'])
+        location = await random_location(self.locations, holder['latitude'], holder['longitude'], index=self.world.location_index, rng=rng)
 
         # Select a random recipient account
-        accounts = pd.concat([bank.accounts for bank in self.banks.values()])
-        account = await random_account(accounts, exclude=holder['account_no'])
+        account = await random_account(self.world.accounts, exclude=holder['account_no'], rng=rng)
 
         # Set the relate account details
         related = account['account_no']
@@ -317,7 +338,7 @@ class Events:
         bank_of_related: Bank = self.banks[related_bank]
 
         # Set the channel of the transaction randomly
-        channel = random.choices(['APP', 'USSD'], [3, 1], k=1)[0]
+        channel = rng.choices(['APP', 'USSD'], [3, 1], k=1)[0]
 
         # Debit the holder and update the transactions dataframe
         debit = await bank_of_holder.debit(account_no=holder['account_no'], related=related, related_bank=related_bank, amount=amount, device_id=device_id, location=location, category='TRANSFER', channel=channel, reference=reference)
@@ -346,25 +367,27 @@ class Events:
             @params options: Abnormalities that can happen during this event
         """
 
+        # Draw from the stream of the account holder
+        rng = self.individuals[holder['bvn']].rng
+
         # Get the user's BVN
         individual: Individual = self.individuals[holder['bvn']]
 
         # Select a random device belonging to the user or a random device
-        device_id = random.choice(individual.profile['devices']) if random.random() >= .95 else await random_user_device(self.individuals)
+        device_id = rng.choice(individual.profile['devices']) if rng.random() >= .95 else await random_user_device(self.world.profiles, rng=rng)
 
         # Set a location for the transaction (Randomly or User's Location)
-        location = await random_location(self.locations, holder['latitude'], holder['longitude'])
+        location = await random_location(self.locations, holder['latitude'], holder['longitude'], index=self.world.location_index, rng=rng)
 
         # Select the bank for the account
-        accounts = pd.concat([bank.accounts for bank in self.banks.values()])
-        account = accounts.loc[(accounts['account_no'] == holder['account_no']) & (accounts['bank_name'] == holder['bank_name'])].squeeze()
+        account = self.banks[holder['bank_name']].get_account(holder['account_no'])
 
         # Set the relate account details
         related = account['account_no']
         related_bank = account['bank_name']
 
         # Select a random channel for the transaction
-        channel = random.choices(['APP', 'USSD'], [3, 1], k=1)[0]
+        channel = rng.choices(['APP', 'USSD'], [3, 1], k=1)[0]
 
         # Get the bank of the holder
         bank_of_holder: Bank = self.banks[holder['bank_name']]
@@ -376,16 +399,12 @@ class Events:
     async def spin(self, individual: Individual):
         """
             Simulates an event occurring in the banking process
-        """
 
-        events = list(self.handler.keys())
-        chances = [individual.behaviour[e] for e in events]
+            @param individual: The individual taking part in the event
 
-        # # Selects a random event based on occurance rates
-        event_name = random.choices(
-            events,
-            chances,
-            k=1
-        )[0]
+            @return: The handler of the event, None when the individual takes part in no events
+        """
 
-        return self.handler[event_name]
\ No newline at end of file
+        # Selects a random event based on occurance rates
+        kind = individual.draw_event()
+        return self.handlers[kind] if kind >= 0 else None
\ No newline at end of file
@@ -1,10 +1,10 @@
 from faker import Faker
 from faker.providers import profile, bank
-import numpy as np
 import pandas as pd
-import random
 
 from src.lib.analytics import tracker
+from src.lib.simulation.rng import RandomStream, default_stream
+from src.lib.simulation.spatial import SpatialIndex
 
 fake = Faker()
 Faker.seed(42)
@@ -12,12 +12,13 @@ fake.add_provider(profile)
 fake.add_provider(bank)
 
 
-def random_amount(level=1, limit=0):
+def random_amount(level=1, limit=0, rng: RandomStream = default_stream):
     """
         Generate a random amount.
 
         @param level: The level of the account.
         @param limit: The maximum amount to generate.
+        @param rng: The random stream to draw from.
 
         @return: A random amount.
     """
@@ -26,35 +27,34 @@ def random_amount(level=1, limit=0):
     max_amount = limit if limit else  (10 ** level) * 10000
 
     # Generate a random amount and round it 2 decimal places to mimic money.
-    return round(np.random.uniform(100, max_amount), 2) 
+    return round(rng.uniform(100, max_amount), 2)
 
 
-async def random_location(location_df: pd.DataFrame, lat=None, lon=None):
+async def random_location(location_df: pd.DataFrame, lat=None, lon=None, index: SpatialIndex = None, rng: RandomStream = default_stream):
     """
         Select a random location from location_df (vectorized & fast).
 
         @params lat: The latitude
         @params lon: The longitude
+        @params index: A spatial index over location_df, keyed by its index labels
+        @params rng: The random stream to draw from
 
         @returns a random location(lon, lat)
     """
 
 
     limits = [1, 10, 100, 1000, 10000]
-    radius = random.uniform(0, random.choices(limits, [1, .5, .1, .05, .001], k=1)[0])
-    locations = location_df.copy()
-
-    if lat is not None and lon is not None:
-        distances = locations.apply(
-            lambda location: 
-            tracker.distance(
-                latA=lat,
-                lonA=lon,
-                latB=location['latitude'],
-                lonB=location['longitude']
-            ),
-            axis=1
-        )
+    radius = rng.uniform(0, rng.choices(limits, [1, .5, .1, .05, .001], k=1)[0])
+    locations = location_df
+
+    if lat is not None and lon is not None and index is not None:
+        # Filter within radius through the index
+        nearby = locations.loc[index.query(lat, lon, radius)]
+        if not nearby.empty:
+            locations = nearby
+
+    elif lat is not None and lon is not None:
+        distances = tracker.haversine(lat, lon, locations['latitude'], locations['longitude'])
 
         # Filter within radius
         nearby = locations.loc[distances <= radius]
@@ -62,18 +62,19 @@ async def random_location(location_df: pd.DataFrame, lat=None, lon=None):
             locations = nearby
 
     # fallback: pick any location
-    return locations.sample(n=1).squeeze()
+    return locations.sample(n=1, random_state=rng.generator).squeeze()
 
 
-async def random_account(accounts: pd.DataFrame, exclude):
+async def random_account(accounts: pd.DataFrame, exclude, rng: RandomStream = default_stream):
     """
         Select a random account number from the accounts.
 
         @param accounts: The dataframe contianing the accounts
+        @param rng: The random stream to draw from
 
         @return: An account
     """
-    level = random.choices([1, 2, 3, 4], [1, 2, 3, 4], k=1)[0]
+    level = rng.choices([1, 2, 3, 4], [1, 2, 3, 4], k=1)[0]
     
     # Select a random account
     selected = accounts[accounts['account_no'] != exclude]
@@ -82,10 +83,10 @@ async def random_account(accounts: pd.DataFrame, exclude):
     if filtered.empty:
         filtered = selected
 
-    return filtered.sample(n=1).squeeze()
+    return filtered.sample(n=1, random_state=rng.generator).squeeze()
 
 
-async def random_merchant(profiles: pd.DataFrame, accounts: pd.DataFrame, lat, lon):
+async def random_merchant(profiles: pd.DataFrame, accounts: pd.DataFrame, lat, lon, index: SpatialIndex = None, rng: RandomStream = default_stream):
     """
         Select a random merchant from the merchants DataFrame
 
@@ -93,6 +94,8 @@ async def random_merchant(profiles: pd.DataFrame, accounts: pd.DataFrame, lat, l
         @param accounts: The dataframe contianing the accounts
         @params lat: The latitude
         @params lon: The longitude
+        @params index: A spatial index over the merchant users, keyed by user_id
+        @params rng: The random stream to draw from
 
         @returns: a random account that is a merchant within the set location(lon, lat)
     """
@@ -102,35 +105,30 @@ async def random_merchant(profiles: pd.DataFrame, accounts: pd.DataFrame, lat, l
     if merchants_list.empty:
         return
 
-    # Get the users who are merchants
-    merchant_users_list = profiles[profiles['user_id'].isin(merchants_list['bvn'])].copy()
-
     # Pick radius
     limits = [1, 10, 100, 1000, 10000]
-    radius = random.uniform(0, random.choices(limits, [1, .5, .1, .05, .001], k=1)[0])
-
-    # Calculate the distance of merchants
-    merchant_users_list['distance'] = merchant_users_list.apply(
-        lambda merchant: 
-        tracker.distance(
-            latA=lat,
-            lonA=lon,
-            latB=merchant['latitude'],
-            lonB=merchant['longitude']
-        ),
-        axis=1
-    )
-
-    # Filter by radius
-    nearby = merchant_users_list.loc[merchant_users_list['distance'] <= radius]
+    radius = rng.uniform(0, rng.choices(limits, [1, .5, .1, .05, .001], k=1)[0])
+
+    if index is not None:
+        # Filter by radius through the index
+        nearby_ids = index.query(lat, lon, radius)
+    else:
+        # Get the users who are merchants
+        merchant_users_list = profiles[profiles['user_id'].isin(merchants_list['bvn'])].copy()
+
+        # Calculate the distance of merchants
+        merchant_users_list['distance'] = tracker.haversine(lat, lon, merchant_users_list['latitude'], merchant_users_list['longitude'])
+
+        # Filter by radius
+        nearby_ids = merchant_users_list.loc[merchant_users_list['distance'] <= radius, 'user_id'].tolist()
 
     # Select a merchant
-    if not nearby.empty:
-        merchant_id = nearby.sample(n=1).squeeze()['user_id']
+    if len(nearby_ids):
+        merchant_id = rng.choice(nearby_ids)
         merchants_list = merchants_list[merchants_list['bvn'] == merchant_id]
 
     # Final merchant details
-    merchant = merchants_list.sample(n=1).squeeze()    
+    merchant = merchants_list.sample(n=1, random_state=rng.generator).squeeze()
     user_id = merchant['bvn']
     device_id = f'POS_{user_id.split("_")[-1]}'
     user = profiles[profiles['user_id'] == user_id].squeeze()
@@ -141,46 +139,42 @@ async def random_merchant(profiles: pd.DataFrame, accounts: pd.DataFrame, lat, l
         'device_id': device_id,
         'account_no': merchant['account_no'],
         'bvn': user_id,
-        'bank_name': merchant['bank_name'],
-        'balance': merchant['balance']
+        'bank_name': merchant['bank_name']
     }
 
 
-async def random_atm(bank_devices: pd.DataFrame, lat, lon):
+async def random_atm(bank_devices: pd.DataFrame, lat, lon, index: SpatialIndex = None, rng: RandomStream = default_stream):
     """
         Select a random bank device from bank_devices
 
         @param bank_devices: The dataframe contianing the bank_devices
         @params lat: The latitude
         @params lon: The longitude
+        @params index: A spatial index over bank_devices, keyed by its index labels
+        @params rng: The random stream to draw from
 
         @returns: a random account that is a merchant within the set location(lon, lat)
     """
 
     # Pick radius
     limits = [1, 10, 100, 1000, 10000]
-    radius = random.uniform(0, random.choices(limits, [1, .5, .1, .05, .001], k=1)[0])
-
-    # Calculate the distance of merchants
-    distances = bank_devices.apply(
-        lambda bank_device: 
-        tracker.distance(
-            latA=lat,
-            lonA=lon,
-            latB=bank_device['latitude'],
-            lonB=bank_device['longitude']
-        ),
-        axis=1
-    )
-
-    # Filter by radius
-    candidates = bank_devices.loc[distances <= radius]
+    radius = rng.uniform(0, rng.choices(limits, [1, .5, .1, .05, .001], k=1)[0])
+
+    if index is not None:
+        # Filter by radius through the index
+        candidates = bank_devices.loc[index.query(lat, lon, radius)]
+    else:
+        # Calculate the distance of merchants
+        distances = tracker.haversine(lat, lon, bank_devices['latitude'], bank_devices['longitude'])
+
+        # Filter by radius
+        candidates = bank_devices.loc[distances <= radius]
 
     # Select a bank device
     if candidates.empty:
         candidates = bank_devices
     
-    bank_device = candidates.sample(n=1).squeeze()
+    bank_device = candidates.sample(n=1, random_state=rng.generator).squeeze()
 
     return {
         'latitude': bank_device['latitude'],
@@ -192,6 +186,5 @@ async def random_atm(bank_devices: pd.DataFrame, lat, lon):
     }
 
 
-async def random_user_device(individuals: dict):
-    profiles = pd.DataFrame([individual.profile for individual in individuals.values()])
-    return random.choice(profiles.sample(n=1).squeeze()['devices'])
\ No newline at end of file
+async def random_user_device(profiles: pd.DataFrame, rng: RandomStream = default_stream):
+    return rng.choice(profiles.sample(n=1, random_state=rng.generator).squeeze()['devices'])
\ No newline at end of file
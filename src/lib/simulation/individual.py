@@ -1,80 +1,47 @@
-import random
-import pandas as pd
-from uuid import uuid4
-
-from src.lib.simulation.generator import random_location
-from src.lib.simulation.generator import fake
+from src.lib.simulation.population import EVENTS, Population
+from src.lib.simulation.rng import RandomStream
 
 
 class Individual:
     """
-        Simulate an individual actions
+        Simulate an individual actions, the details of the individual live in a row of the population
     """
 
-    def __init__(self, locations: pd.DataFrame, profile: dict = {}, behaviour = {}):
-        """
-            Initialize an individual
+    # Large populations hold one of these per user, so they carry no dict and their stream lives in the population
+    __slots__ = ('population', 'row')
 
-            @param profile: The profile of the individual
+    def __init__(self, population: Population, row: int, rng: RandomStream = None):
         """
-        self.locations = locations
-        self.profile = profile
-        self.behaviour = behaviour
-
+            Initialize an individual
 
-    async def setup_profile(self) -> dict:
-        """
-            Setup the profile of an individual
+            @param population: The population the individual belongs to
+            @param row: The row of the individual in the population
+            @param rng: The random stream of the individual, derived from the population when missing
         """
+        self.population = population
+        self.row = row
+        if rng is not None:
+            population.keep(row, rng)
 
-        # Set the unique identifier for each user
-        user_id = f"USER_{uuid4()}"
-        profile = fake.profile()
-
-        # Assign user a random number of devices
-        num_devices = random.randint(1, 2)
-
-        # Assign user a random location
-        location = await random_location(self.locations)
 
-        # Initialize an empty device list to this user
-        user_devices = []
+    @property
+    def rng(self) -> RandomStream:
+        # The random stream of the individual
+        return self.population.stream(self.row)
 
-        # Generate devices for each user
-        for _ in range(num_devices):
-            # Set a unique identifier for the device
-            device_id = f"{'MOBILE'}_{user_id}_{uuid4()}"
 
-            # Add device to the specific user device list
-            user_devices.append(device_id)
+    @property
+    def profile(self) -> dict:
+        # The profile of the individual
+        return self.population.profile(self.row)
 
-        # Add user to the user list
-        self.profile = {
-            'user_id': user_id,
-            'devices': user_devices,
-            'name': profile['name'],
-            'gender': profile['sex'],
-            'email': profile['mail'],
-            'birthdate': profile['birthdate'].isoformat(),
-            **location
-        }
 
+    @property
+    def behaviour(self) -> dict:
+        # The count of each event type of the individual
+        return self.population.behaviour(self.row)
 
-    async def setup_behaviour(self):
-        """
-            Setup the behaviors of an individual
-        """
-
-        events = ['ATM_WITHDRAWAL', 'ATM_DEPOSIT', 'ATM_PAYMENT', 'POS_WITHDRAWAL', 'POS_PAYMENT', 'MOBILE_TRANSFER', 'TAKE_LOAN']
-        occurances = [1, 1, 2, 3, 3, 7, 3]
-        self.behaviour = {e:random.randint(0, occurances[i]) for i, e in enumerate(events)}
-
-
-    async def setup(self):
-        """
-            Setup an individual
-        """
-
-        await self.setup_profile()
 
-        await self.setup_behaviour()
+    def draw_event(self) -> int:
+        # The position in EVENTS of the next event of the individual, -1 when there is none
+        return self.population.draw(self.row, self.rng)
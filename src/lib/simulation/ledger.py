@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+
+class Ledger:
+    """
+        An append-friendly columnar store for simulation records
+    """
+
+    def __init__(self, columns: list = None, key: str = None, dtypes: dict = None, capacity: int = 1024):
+        """
+            Initialize a ledger
+
+            @param columns: The columns known up front
+            @param key: The column to index rows by
+            @param dtypes: The numpy dtypes of specific columns, other columns hold python objects
+            @param capacity: The number of rows to preallocate
+        """
+        self.key = key
+        self.dtypes = dict(dtypes or {})
+        self.capacity = max(int(capacity), 1)
+        self.size = 0
+        self.columns = {}
+        self.index = {}
+
+        for column in columns if columns is not None else []:
+            self.add_column(column)
+
+
+    def __len__(self):
+        return self.size
+
+
+    def __contains__(self, key):
+        return key in self.index
+
+
+    @property
+    def nbytes(self) -> int:
+        # The memory held by the columns, object columns count their references only
+        return sum(values.nbytes for values in self.columns.values())
+
+
+    def add_column(self, column: str):
+        """
+            Allocate a new column, backfilling the existing rows
+
+            @param column: The name of the column
+        """
+        dtype = self.dtypes.get(column, object)
+        self.columns[column] = np.zeros(self.capacity, dtype=dtype) if dtype is not object else np.full(self.capacity, None, dtype=object)
+
+
+    def grow(self, size: int):
+        """
+            Grow the columns geometrically until they can hold size rows
+
+            @param size: The number of rows required
+        """
+        if size <= self.capacity:
+            return
+
+        capacity = self.capacity
+        while capacity < size:
+            capacity *= 2
+
+        for column, values in self.columns.items():
+            grown = np.zeros(capacity, dtype=values.dtype) if values.dtype != object else np.full(capacity, None, dtype=object)
+            grown[:self.size] = values[:self.size]
+            self.columns[column] = grown
+
+        self.capacity = capacity
+
+
+    def append(self, row: dict) -> int:
+        """
+            Append a row to the ledger
+
+            @param row: The record to store
+
+            @return: The position of the row
+        """
+        self.grow(self.size + 1)
+        position = self.size
+
+        for column, value in row.items():
+            if column not in self.columns:
+                self.add_column(column)
+            self.columns[column][position] = value
+
+        if self.key is not None:
+            self.index[row[self.key]] = position
+
+        self.size += 1
+        return position
+
+
+    def extend(self, rows: list):
+        """
+            Append many rows to the ledger
+
+            @param rows: The records to store
+        """
+        self.grow(self.size + len(rows))
+        for row in rows:
+            self.append(row)
+
+
+    def extend_columns(self, data: dict):
+        """
+            Append many rows given column by column
+
+            @param data: The values of each column, all of the same length
+        """
+        size = len(next(iter(data.values()))) if data else 0
+        self.grow(self.size + size)
+
+        for column, values in data.items():
+            if column not in self.columns:
+                self.add_column(column)
+            self.columns[column][self.size:self.size + size] = values
+
+        if self.key is not None:
+            self.index.update(zip(data[self.key], range(self.size, self.size + size)))
+
+        self.size += size
+
+
+    def locate(self, key) -> int:
+        """
+            Get the position of the row stored under key
+
+            @param key: The value of the key column
+
+            @return: The position of the row
+        """
+        return self.index[key]
+
+
+    def get(self, position: int, column: str):
+        # Read a single cell
+        return self.columns[column][position]
+
+
+    def set(self, position: int, column: str, value):
+        # Write a single cell
+        self.columns[column][position] = value
+
+
+    def row(self, position: int) -> dict:
+        # Read a row as a record
+        return {column: values[position] for column, values in self.columns.items()}
+
+
+    def column(self, column: str) -> np.ndarray:
+        # A view over the filled part of a column
+        return self.columns[column][:self.size]
+
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+            Materialise the ledger as a DataFrame
+
+            @return: A DataFrame holding a copy of every row
+        """
+        data = {column: values[:self.size].copy() for column, values in self.columns.items()}
+        return pd.DataFrame(data).infer_objects()
+
+
+    def drain(self) -> pd.DataFrame:
+        """
+            Materialise the ledger and empty it, keeping the allocated columns for the next rows
+
+            @return: A DataFrame holding every row that was in the ledger
+        """
+        df = self.to_frame()
+
+        for values in self.columns.values():
+            values[:self.size] = 0 if values.dtype != object else None
+
+        self.index = {}
+        self.size = 0
+        return df
+
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, key: str = None, dtypes: dict = None, capacity: int = 1024):
+        """
+            Build a ledger from an existing DataFrame
+
+            @param df: The records to load
+            @param key: The column to index rows by
+            @param dtypes: The numpy dtypes of specific columns
+
+            @return: A ledger holding the records
+        """
+        ledger = cls(columns=list(df.columns), key=key, dtypes=dtypes, capacity=max(capacity, len(df)))
+        ledger.extend(df.to_dict(orient='records'))
+        return ledger
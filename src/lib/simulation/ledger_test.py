@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from src.lib.simulation.ledger import Ledger
+
+DTYPES = {'amount': float, 'count': np.int64}
+
+
+def transaction(position: int) -> dict:
+    return {'reference': f'REF_{position}', 'amount': float(position), 'count': position, 'channel': 'APP' if position % 2 else 'CARD'}
+
+
+def test_ledger_grows_past_its_capacity():
+    ledger = Ledger(key='reference', dtypes=DTYPES, capacity=2)
+    ledger.extend([transaction(x) for x in range(5)])
+
+    assert len(ledger) == 5 and ledger.capacity == 8
+    assert all(len(values) == 8 for values in ledger.columns.values())
+    assert ledger.column('amount').tolist() == [0., 1., 2., 3., 4.]
+
+    ledger.append(transaction(5))
+    ledger.extend_columns({'reference': ['REF_6', 'REF_7', 'REF_8'], 'amount': [6., 7., 8.], 'count': [6, 7, 8], 'channel': ['APP'] * 3})
+    assert len(ledger) == 9 and ledger.capacity == 16
+    assert ledger.column('count').tolist() == list(range(9))
+
+
+def test_keys_locate_rows_however_they_were_added():
+    ledger = Ledger(key='reference', dtypes=DTYPES, capacity=2)
+    ledger.append(transaction(0))
+    ledger.extend([transaction(1), transaction(2)])
+    ledger.extend_columns({'reference': ['REF_3', 'REF_4'], 'amount': [3., 4.], 'count': [3, 4], 'channel': ['APP', 'CARD']})
+
+    assert all(f'REF_{x}' in ledger and ledger.locate(f'REF_{x}') == x for x in range(5))
+    assert 'REF_5' not in ledger
+    assert ledger.row(ledger.locate('REF_3')) == transaction(3) | {'channel': 'APP'}
+
+
+def test_cells_are_read_and_written_in_place():
+    ledger = Ledger(key='reference', dtypes=DTYPES)
+    ledger.extend([transaction(x) for x in range(3)])
+
+    position = ledger.locate('REF_1')
+    ledger.set(position, 'amount', 10.)
+    ledger.set(position, 'channel', 'USSD')
+
+    assert ledger.get(position, 'amount') == 10. and ledger.get(position, 'channel') == 'USSD'
+    assert ledger.column('amount').tolist() == [0., 10., 2.]
+
+    # Columns first seen in a later row are backfilled for the earlier ones
+    ledger.append({**transaction(3), 'device': 'ATM_1'})
+    assert ledger.column('device').tolist() == [None, None, None, 'ATM_1']
+
+
+def test_frames_keep_the_column_dtypes():
+    ledger = Ledger(key='reference', dtypes=DTYPES)
+    ledger.extend([transaction(x) for x in range(3)])
+    df = ledger.to_frame()
+
+    assert df['amount'].dtype == np.float64 and df['count'].dtype == np.int64
+    assert df['reference'].dtype == object and df['channel'].tolist() == ['CARD', 'APP', 'CARD']
+
+    # The frame is a copy, writing to it leaves the ledger as it was
+    df.loc[0, 'amount'] = 100.
+    assert ledger.get(0, 'amount') == 0.
+
+
+def test_frames_round_trip_through_a_ledger():
+    df = pd.DataFrame([transaction(x) for x in range(7)])
+    ledger = Ledger.from_frame(df, key='reference', dtypes=DTYPES, capacity=2)
+
+    assert len(ledger) == 7 and ledger.locate('REF_6') == 6
+    pd.testing.assert_frame_equal(ledger.to_frame(), df)
+
+
+def test_drain_empties_the_ledger():
+    ledger = Ledger(key='id', dtypes={'amount': float}, capacity=2)
+    ledger.extend([{'id': 1, 'amount': 5.}, {'id': 2, 'amount': 7.}, {'id': 3, 'amount': 9.}])
+
+    assert ledger.drain()['amount'].tolist() == [5., 7., 9.]
+    assert len(ledger) == 0 and 1 not in ledger
+
+    ledger.append({'id': 4, 'amount': 1.})
+    assert ledger.to_frame().to_dict(orient='records') == [{'id': 4, 'amount': 1.}]
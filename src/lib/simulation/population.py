@@ -0,0 +1,231 @@
+from faker.providers.internet.en_US import Provider as InternetProvider
+from faker.providers.person.en_US import Provider as PersonProvider
+from bisect import bisect_right
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from src.lib.simulation import clock
+from src.lib.simulation.ledger import Ledger
+from src.lib.simulation.rng import RandomStream
+
+# The events an individual can take part in, and the most times each can come up in a behaviour
+EVENTS = ['ATM_WITHDRAWAL', 'ATM_DEPOSIT', 'ATM_PAYMENT', 'POS_WITHDRAWAL', 'POS_PAYMENT', 'MOBILE_TRANSFER', 'TAKE_LOAN']
+OCCURANCES = np.array([1, 1, 2, 3, 3, 7, 3])
+
+# Faker's own name and email tables, drawn from with their weights
+FIRST_NAMES = {'M': PersonProvider.first_names_male, 'F': PersonProvider.first_names_female}
+LAST_NAMES = PersonProvider.last_names
+EMAIL_DOMAINS = np.array(InternetProvider.free_email_domains)
+
+# The streams of the individuals drawn from most recently are kept built, the others are saved as their PCG64 words.
+# It has to hold more streams than there are events in flight, so no event draws from a stream that was saved
+STREAM_CACHE = 4096
+
+# Birthdates span the ages of Faker's profiles
+MAX_AGE_DAYS = 115 * 365
+
+# The fields of a profile, in the order they are stored
+PROFILE_FIELDS = ['user_id', 'devices', 'name', 'gender', 'email', 'birthdate', 'latitude', 'longitude']
+
+
+def draw_names(generator: np.random.Generator, names: dict, size: int) -> np.ndarray:
+    # Draw names by their weights
+    weights = np.fromiter(names.values(), dtype=float)
+    return np.array(list(names), dtype=object)[generator.choice(len(names), size=size, p=weights / weights.sum())]
+
+
+def build_population(count: int, locations: pd.DataFrame, rng: RandomStream) -> dict:
+    """
+        Generate the profiles and behaviours of many individuals in one pass
+
+        @param count: The number of individuals
+        @param locations: The locations for the simulation
+        @param rng: The random stream to draw from
+
+        @return: The columns of the population, the profile fields and a behaviour matrix over EVENTS
+    """
+    generator = rng.generator
+    user_ids = [f'USER_{uuid}' for uuid in rng.uuids(count)]
+
+    # Names follow the gender, and emails follow the names
+    genders = np.where(generator.random(count) < .5, 'M', 'F')
+    first_names = np.empty(count, dtype=object)
+    for gender, names in FIRST_NAMES.items():
+        mask = genders == gender
+        first_names[mask] = draw_names(generator, names, int(mask.sum()))
+    last_names = draw_names(generator, LAST_NAMES, count)
+    domains = EMAIL_DOMAINS[generator.integers(len(EMAIL_DOMAINS), size=count)]
+
+    # Ages are counted back from the start of the clock, so the same seed gives the same birthdates
+    birthdates = np.datetime64(clock.global_clock.basetime, 'D') - generator.integers(0, MAX_AGE_DAYS, size=count).astype('timedelta64[D]')
+
+    # Every user has one or two mobile devices
+    device_counts = generator.integers(1, 2, size=count, endpoint=True)
+    device_ids = iter(rng.uuids(int(device_counts.sum())))
+    devices = [[f'MOBILE_{user_id}_{next(device_ids)}' for _ in range(devices)] for user_id, devices in zip(user_ids, device_counts)]
+
+    rows = generator.integers(len(locations), size=count)
+
+    return {
+        'user_id': user_ids,
+        'devices': devices,
+        'name': [f'{first} {last}' for first, last in zip(first_names, last_names)],
+        'gender': genders.tolist(),
+        'email': [f'{first.lower()}{last.lower()}@{domain}' for first, last, domain in zip(first_names, last_names, domains)],
+        'birthdate': np.datetime_as_string(birthdates, unit='D').tolist(),
+        'latitude': locations['latitude'].to_numpy(dtype=float)[rows].tolist(),
+        'longitude': locations['longitude'].to_numpy(dtype=float)[rows].tolist(),
+        'behaviour': generator.integers(0, OCCURANCES + 1, size=(count, len(EVENTS))),
+    }
+
+
+def individual_records(population: dict):
+    """
+        Split a population into the profile and behaviour of each individual
+
+        @param population: The columns of the population
+
+        @return: An iterator over (profile, behaviour) pairs
+    """
+    for position, values in enumerate(zip(*[population[field] for field in PROFILE_FIELDS])):
+        yield dict(zip(PROFILE_FIELDS, values)), dict(zip(EVENTS, population['behaviour'][position].tolist()))
+
+
+class Population:
+    """
+        The profiles and behaviours of every individual, stored column by column
+    """
+
+    def __init__(self, capacity: int = 1024, rng: RandomStream = None):
+        """
+            Initialize an empty population
+
+            @param capacity: The number of individuals to preallocate
+            @param rng: The stream the streams of the individuals are derived from
+        """
+        self.profiles = Ledger(PROFILE_FIELDS, key='user_id', dtypes={'latitude': float, 'longitude': float}, capacity=capacity)
+
+        # Behaviours are counts per event type, kept with their running sums for drawing events
+        self.codes = np.zeros((self.profiles.capacity, len(EVENTS)), dtype=np.int8)
+        self.cumulative = np.zeros((self.profiles.capacity, len(EVENTS)), dtype=np.int16)
+
+        # Every individual draws from its own stream, derived from its row until it has been saved
+        self.rng = rng if rng is not None else RandomStream()
+        self.positions = np.zeros((self.profiles.capacity, 6), dtype=np.uint64)
+        self.saved = np.zeros(self.profiles.capacity, dtype=bool)
+        self.streams = OrderedDict()
+
+
+    def __len__(self):
+        return len(self.profiles)
+
+
+    def extend(self, population: dict) -> range:
+        """
+            Add the individuals of a population built by build_population
+
+            @param population: The columns of the population
+
+            @return: The rows of the added individuals
+        """
+        start = len(self.profiles)
+        columns = {field: population[field] for field in PROFILE_FIELDS}
+        columns['devices'] = np.fromiter(population['devices'], dtype=object, count=len(population['devices']))
+        self.profiles.extend_columns(columns)
+
+        # The behaviour and stream rows follow the capacity of the profiles
+        if self.profiles.capacity > len(self.codes):
+            grown = self.profiles.capacity - len(self.codes)
+            self.codes = np.concatenate([self.codes, np.zeros((grown, len(EVENTS)), dtype=np.int8)])
+            self.cumulative = np.concatenate([self.cumulative, np.zeros((grown, len(EVENTS)), dtype=np.int16)])
+            self.positions = np.concatenate([self.positions, np.zeros((grown, 6), dtype=np.uint64)])
+            self.saved = np.concatenate([self.saved, np.zeros(grown, dtype=bool)])
+
+        rows = range(start, len(self.profiles))
+        self.codes[start:rows.stop] = population['behaviour']
+        self.cumulative[start:rows.stop] = np.cumsum(population['behaviour'], axis=1)
+        return rows
+
+
+    def take(self, rows) -> dict:
+        """
+            Get the columns of some individuals, in the form build_population gives them
+
+            @param rows: The rows of the individuals
+
+            @return: The columns of the individuals
+        """
+        rows = np.asarray(rows, dtype=int)
+        return {
+            **{field: self.profiles.column(field)[rows].tolist() for field in PROFILE_FIELDS},
+            'behaviour': self.codes[rows].copy(),
+        }
+
+
+    def profile(self, row: int) -> dict:
+        # The profile of an individual as a record
+        return self.profiles.row(row)
+
+
+    def behaviour(self, row: int) -> dict:
+        # The count of each event type of an individual
+        return dict(zip(EVENTS, self.codes[row].tolist()))
+
+
+    def frame(self) -> pd.DataFrame:
+        # The profiles of every individual
+        return self.profiles.to_frame()
+
+
+    def weights(self) -> np.ndarray:
+        # The running sums of every behaviour, aligned with the rows of frame
+        return self.cumulative[:len(self)]
+
+
+    def stream(self, row: int) -> RandomStream:
+        """
+            Get the random stream of an individual, building it when it is not kept
+
+            @param row: The row of the individual
+
+            @return: The stream, the same one for as long as it is kept
+        """
+        if row in self.streams:
+            self.streams.move_to_end(row)
+            return self.streams[row]
+
+        stream = RandomStream.load(self.positions[row]) if self.saved[row] else self.rng.child('individual', row)
+        self.keep(row, stream)
+        return stream
+
+
+    def keep(self, row: int, stream: RandomStream):
+        """
+            Make a stream the stream of an individual, saving the least recently used streams
+
+            @param row: The row of the individual
+            @param stream: The stream
+        """
+        self.streams[row] = stream
+        self.streams.move_to_end(row)
+
+        while len(self.streams) > STREAM_CACHE:
+            saved, oldest = self.streams.popitem(last=False)
+            self.positions[saved] = oldest.save()
+            self.saved[saved] = True
+
+
+    def draw(self, row: int, rng: RandomStream) -> int:
+        """
+            Draw the type of the next event of an individual from their behaviour
+
+            @param row: The row of the individual
+            @param rng: The random stream to draw with
+
+            @return: The position of the event type in EVENTS, -1 when the individual takes part in none
+        """
+        cumulative = self.cumulative[row].tolist()
+        if not cumulative[-1]:
+            return -1
+        return bisect_right(cumulative, rng.random() * cumulative[-1])
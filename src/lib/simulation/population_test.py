@@ -0,0 +1,101 @@
+import asyncio
+import pandas as pd
+
+import numpy as np
+
+from src.lib.simulation import population as population_module
+from src.lib.simulation.banking import Bank
+from src.lib.simulation.individual import Individual
+from src.lib.simulation.population import EVENTS, OCCURANCES, Population, build_population, individual_records
+from src.lib.simulation.rng import RandomStream
+from src.lib.simulation.simulator import Simulator
+from src.lib.simulation.spatial import SpatialIndex
+
+LOCATIONS = pd.DataFrame({'latitude': [9., 9.01, 9.02, 9.03], 'longitude': [3., 3.01, 3.02, 3.03]})
+
+
+def test_population_has_the_fields_individuals_store():
+    population = build_population(500, LOCATIONS, RandomStream(3))
+    profile, behaviour = next(individual_records(population))
+
+    assert list(profile) == ['user_id', 'devices', 'name', 'gender', 'email', 'birthdate', 'latitude', 'longitude']
+    assert list(behaviour) == EVENTS
+    assert len(set(population['user_id'])) == 500
+    assert all(1 <= len(devices) <= 2 and all(device.startswith(f'MOBILE_{user_id}_') for device in devices) for user_id, devices in zip(population['user_id'], population['devices']))
+    assert set(population['gender']) == {'M', 'F'}
+    assert all('@' in email for email in population['email'])
+    assert ((population['behaviour'] >= 0) & (population['behaviour'] <= OCCURANCES)).all()
+    assert set(zip(population['latitude'], population['longitude'])) <= set(zip(LOCATIONS['latitude'], LOCATIONS['longitude']))
+
+
+def test_same_stream_gives_the_same_population():
+    first, second = build_population(50, LOCATIONS, RandomStream(9)), build_population(50, LOCATIONS, RandomStream(9))
+
+    assert first['user_id'] == second['user_id'] and first['email'] == second['email'] and first['birthdate'] == second['birthdate']
+    assert (first['behaviour'] == second['behaviour']).all()
+
+
+def test_bulk_accounts_match_the_ledgers():
+    bank = Bank('Test Bank', locations=LOCATIONS, location_index=SpatialIndex(LOCATIONS.index, LOCATIONS['latitude'], LOCATIONS['longitude']), rng=RandomStream(4))
+    users = [profile for profile, _ in individual_records(build_population(200, LOCATIONS, RandomStream(5)))]
+    accounts = asyncio.run(bank.setup_accounts(users))
+
+    transactions, ledger = bank.transactions, bank.accounts
+    assert accounts['account_no'].tolist() == ledger['account_no'].tolist() == transactions['holder'].tolist()
+    assert ledger['account_no'].tolist() == [f'ACC_{number:010}' for number in range(1, 201)]
+    assert (transactions['amount'] == ledger['balance']).all() and (transactions['category'] == 'OPENING').all()
+    assert transactions['time'].is_monotonic_increasing
+    assert all(device in user['devices'] for device, user in zip(ledger['opening_device'], users))
+    assert ledger['kyc'].isin([1, 2, 3]).all()
+
+
+def test_setup_opens_accounts_for_the_population():
+    sim = Simulator(num_users=300, num_banks=3, min_amount=100, max_amount=100_000_000_000, geo=(9, 3), radius=10000, fraudulence=.05, seed=2)
+    asyncio.run(sim.setup_reality())
+
+    assert len(sim.individuals) == 300
+    assert all(individual.profile['user_id'] == user_id for user_id, individual in sim.individuals.items())
+    assert set(pd.concat([bank.accounts for bank in sim.banks.values()])['bvn']) <= set(sim.individuals)
+
+
+def test_population_table_round_trips_the_columns():
+    columns = build_population(300, LOCATIONS, RandomStream(6))
+    population = Population(capacity=16)
+    first, second = population.extend(build_population(0, LOCATIONS, RandomStream(1))), population.extend(columns)
+
+    assert len(first) == 0 and second == range(0, 300) and len(population) == 300
+    taken = population.take(second)
+    assert all(taken[field] == columns[field] for field in ['user_id', 'devices', 'name', 'email', 'latitude'])
+    assert (taken['behaviour'] == columns['behaviour']).all()
+    assert population.frame()['user_id'].tolist() == columns['user_id']
+    assert (population.weights() == np.cumsum(columns['behaviour'], axis=1)).all()
+
+
+def test_individuals_draw_only_the_events_they_take_part_in():
+    behaviour = np.zeros((2, len(EVENTS)), dtype=int)
+    behaviour[0, [2, 5]] = [1, 3]
+    columns = {**build_population(2, LOCATIONS, RandomStream(2)), 'behaviour': behaviour}
+    population = Population()
+    rows = population.extend(columns)
+    busy, idle = Individual(population, rows[0], rng=RandomStream(3)), Individual(population, rows[1], rng=RandomStream(3))
+
+    draws = np.bincount([busy.draw_event() for _ in range(2000)], minlength=len(EVENTS))
+    assert set(np.flatnonzero(draws)) == {2, 5} and draws[5] > draws[2]
+    assert idle.draw_event() == -1
+    assert busy.behaviour == dict(zip(EVENTS, behaviour[0].tolist())) and busy.profile['user_id'] == columns['user_id'][0]
+    assert not hasattr(busy, '__dict__')
+
+
+def test_individual_streams_survive_being_saved(monkeypatch):
+    monkeypatch.setattr(population_module, 'STREAM_CACHE', 4)
+    columns = {**build_population(10, LOCATIONS, RandomStream(2)), 'behaviour': np.ones((10, len(EVENTS)), dtype=int)}
+    population, whole = Population(rng=RandomStream(8)), Population(capacity=16, rng=RandomStream(8))
+    rows, _ = population.extend(columns), whole.extend(columns)
+    individuals = [Individual(population, row) for row in rows]
+
+    # Drawing from every individual in turn saves most streams, they continue as if they had been kept
+    draws = [[individual.draw_event() for individual in individuals] for _ in range(5)]
+    assert len(population.streams) == 4 and population.saved[:10].all()
+    assert draws == [[whole.draw(row, whole.stream(row)) for row in rows] for _ in range(5)]
+    assert individuals[0].rng is individuals[0].rng and individuals[0].rng is not individuals[1].rng
+    assert not hasattr(individuals[0], '__dict__')
@@ -0,0 +1,150 @@
+from uuid import UUID
+import zlib
+import numpy as np
+
+# The low 64 bits of the 128 bit PCG64 words
+LOW_BITS = (1 << 64) - 1
+
+
+class RandomStream:
+    """
+        A reproducible stream of random draws for the simulation, backed by a numpy Generator
+    """
+
+    def __init__(self, seed=None):
+        """
+            Initialize a random stream
+
+            @param seed: The seed of the stream, or the seed sequence it was spawned from
+        """
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self._generator = None
+
+
+    @property
+    def generator(self) -> np.random.Generator:
+        # Every individual gets a substream, the generator is only built once the stream is drawn from
+        if self._generator is None:
+            self._generator = np.random.default_rng(self.seed_sequence)
+        return self._generator
+
+
+    def child(self, *keys) -> 'RandomStream':
+        """
+            Derive an independent substream, the same keys always give the same substream
+
+            @param keys: The ints or names that identify the substream
+
+            @return: The substream
+        """
+        spawn_key = tuple(key if isinstance(key, int) else zlib.crc32(str(key).encode()) for key in keys)
+        return RandomStream(np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=self.seed_sequence.spawn_key + spawn_key))
+
+
+    def save(self) -> list:
+        """
+            Get the position of the stream, so it can be rebuilt without keeping its generator
+
+            @return: The 64 bit words of the PCG64 state and increment, and of its buffered 32 bit draw
+        """
+        state = self.generator.bit_generator.state
+        counter, increment = state['state']['state'], state['state']['inc']
+        return [counter >> 64, counter & LOW_BITS, increment >> 64, increment & LOW_BITS, state['has_uint32'], state['uinteger']]
+
+
+    @classmethod
+    def load(cls, words) -> 'RandomStream':
+        """
+            Rebuild a stream where it was saved, the rebuilt stream has no seed to derive substreams from
+
+            @param words: The words save gave
+
+            @return: The stream, continuing from the saved position
+        """
+        words = [int(word) for word in words]
+        generator = np.random.Generator(np.random.PCG64())
+        generator.bit_generator.state = {
+            'bit_generator': 'PCG64',
+            'state': {'state': words[0] << 64 | words[1], 'inc': words[2] << 64 | words[3]},
+            'has_uint32': words[4],
+            'uinteger': words[5],
+        }
+
+        stream = cls.__new__(cls)
+        stream.seed_sequence = None
+        stream._generator = generator
+        return stream
+
+
+    def random(self) -> float:
+        # A float in [0, 1)
+        return float(self.generator.random())
+
+
+    def uniform(self, low: float, high: float) -> float:
+        # A float between low and high, like random.uniform it allows high below low
+        return low + (high - low) * float(self.generator.random())
+
+
+    def randint(self, low: int, high: int) -> int:
+        # An int in [low, high], both ends included
+        return int(self.generator.integers(low, high, endpoint=True))
+
+
+    def choice(self, population):
+        # A single item of the population
+        return population[int(self.generator.integers(len(population)))]
+
+
+    def choices(self, population, weights=None, k=1) -> list:
+        """
+            Pick k items of the population with replacement
+
+            @param population: The items to pick from
+            @param weights: The relative chance of each item
+            @param k: The number of items to pick
+
+            @return: The picked items
+        """
+        p = None if weights is None else np.asarray(weights, dtype=float) / np.sum(weights)
+        return [population[i] for i in self.generator.choice(len(population), size=k, p=p)]
+
+
+    def sample(self, population, k: int) -> list:
+        # Pick k distinct items of the population
+        return [population[i] for i in self.generator.choice(len(population), size=k, replace=False)]
+
+
+    def uuid(self) -> UUID:
+        # A version 4 uuid drawn from the stream
+        return UUID(bytes=self.generator.bytes(16), version=4)
+
+
+    def uuids(self, count: int) -> list:
+        """
+            Draw many version 4 uuids at once, formatted as strings without building a UUID each
+
+            @param count: The number of uuids
+
+            @return: The uuid strings, the same as str(uuid()) for the same draws
+        """
+        data = np.frombuffer(self.generator.bytes(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+
+        # Set the version and variant bits like UUID(version=4)
+        data[:, 6] = data[:, 6] & 0x0f | 0x40
+        data[:, 8] = data[:, 8] & 0x3f | 0x80
+
+        digits = data.tobytes().hex()
+        return [
+            f'{digits[p:p + 8]}-{digits[p + 8:p + 12]}-{digits[p + 12:p + 16]}-{digits[p + 16:p + 20]}-{digits[p + 20:p + 32]}'
+            for p in range(0, 32 * count, 32)
+        ]
+
+
+    def seed(self) -> int:
+        # A seed for libraries that keep their own random state, like Faker
+        return int(self.generator.integers(2 ** 32))
+
+
+# The stream used by callers that do not thread one through
+default_stream = RandomStream()
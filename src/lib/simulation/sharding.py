@@ -0,0 +1,246 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+from collections import defaultdict
+from queue import Empty
+from threading import BrokenBarrierError
+import itertools
+import asyncio
+import pickle
+import math
+import pandas as pd
+
+from src.lib.simulation import banking, clock
+from src.lib.simulation.individual import Individual
+from src.lib.simulation.events import Events
+from src.lib.simulation.world import World
+from src.lib.simulation.rng import RandomStream
+from src.lib.utils.config import SHARD_TIMEOUT
+from src.lib.utils.logger import get_logger
+
+
+class ShardStopped(RuntimeError):
+    """
+        A shard stopped because another shard failed or did not reach a tick boundary in time
+    """
+
+
+logger = get_logger('Simulation Logger')
+
+
+def partition(user_ids, shards: int) -> list:
+    """
+        Split the users across shards by their sorted position
+
+        @param user_ids: The ids of the users
+        @param shards: The number of shards
+
+        @return: The set of users each shard owns
+    """
+    owners = [set() for _ in range(shards)]
+    for position, user_id in enumerate(sorted(user_ids)):
+        owners[position % shards].add(user_id)
+    return owners
+
+
+def account_owners(banks: dict, owners: list) -> dict:
+    """
+        Map every account to the shard that settles it
+
+        @param banks: The banks in the simulation
+        @param owners: The set of users each shard owns
+
+        @return: The shard of each (bank, account) pair
+    """
+    shard_of = {user_id: shard for shard, users in enumerate(owners) for user_id in users}
+    return {
+        (name, account_no): shard_of[bvn]
+        for name, bank in banks.items()
+        for account_no, bvn in zip(bank.account_ledger.column('account_no'), bank.account_ledger.column('bvn'))
+    }
+
+
+async def run_ticks(sim, shard, shards, duration, tick, batch_size, routes, queues, barrier):
+    """
+        Simulate the shard tick by tick, exchanging deferred operations with the other shards at each tick boundary
+
+        @param sim: The simulator of the shard
+        @param shard: The position of the shard
+        @param shards: The number of shards
+        @param duration: The duration of the simulation in seconds
+        @param tick: The number of seconds between exchanges
+        @param batch_size: The number of events to run at once
+        @param routes: The shard of each (bank, account) pair
+        @param queues: The inbox of every shard
+        @param barrier: Holds the shards until every outbox has been sent
+    """
+    sim.semaphore = asyncio.Semaphore(batch_size)
+
+    for count in range(math.ceil(duration / tick)):
+        boundary = min((count + 1) * tick, duration)
+        while clock.global_clock.ticker < boundary:
+            await sim.step(batch_size)
+
+        # Send one batch to every other shard, even when empty, so each inbox knows when a tick is complete
+        batches = {other: [] for other in range(shards) if other != shard}
+        for bank in sim.banks.values():
+            for message in bank.outbox:
+                batches[routes[(message['bank'], message['details']['account_no'])]].append(message)
+            bank.outbox = []
+
+        for other, batch in batches.items():
+            queues[other].put((shard, batch))
+
+        barrier.wait(SHARD_TIMEOUT)
+
+        # Settle the operations of the other shards in a fixed order
+        inbox = sorted([queues[shard].get(timeout=SHARD_TIMEOUT) for _ in range(shards - 1)], key=lambda item: item[0])
+        for _, batch in inbox:
+            for message in batch:
+                bank = sim.banks[message['bank']]
+                await getattr(bank, message['operation'])(**message['details'])
+
+        if sim.sink is not None and sim.sink.due(sim.banks):
+            sim.sink.flush(sim.banks)
+
+
+def run_shard(state: bytes, shard: int, shards: int, duration: int, tick: int, batch_size: int, seed: int, owners: list, queues: list, barrier) -> dict:
+    """
+        Simulate the individuals and accounts a shard owns, in a worker process
+
+        @param state: The pickled simulator
+        @param shard: The position of the shard
+        @param shards: The number of shards
+        @param duration: The duration of the simulation in seconds
+        @param tick: The number of seconds between exchanges
+        @param batch_size: The number of events to run at once
+        @param seed: The seed of the simulation
+        @param owners: The set of users each shard owns
+        @param queues: The inbox of every shard
+        @param barrier: Holds the shards until every outbox has been sent
+
+        @return: The records the shard settled
+    """
+    sim = pickle.loads(state)
+
+    # Shards share the banks, so the event and bank streams are split per shard. The individuals keep theirs.
+    sim.event_rng = (RandomStream(seed) if seed is not None else sim.event_rng).child('shard', shard)
+    for bank in sim.banks.values():
+        bank.rng = bank.rng.child('shard', shard)
+
+    # Every shard fires events for a share of the users, so its clock steps faster to keep the volume
+    clock.global_clock.reset(rng=sim.event_rng.child('clock'))
+    clock.global_clock.speed = shards
+
+    if sim.sink is not None:
+        sim.sink.suffix = f'-{shard}'
+
+    routes = account_owners(sim.banks, owners)
+    existing = set(sim.individuals)
+    settled = {name: (len(bank.transaction_ledger), len(bank.device_ledger)) for name, bank in sim.banks.items()}
+    sim.owned_users = set(owners[shard])
+    for bank in sim.banks.values():
+        bank.owned = {account_no for (name, account_no), owner in routes.items() if name == bank.name and owner == shard}
+        bank.account_numbers = itertools.count(len(bank.account_ledger) + 1 + shard, shards)
+
+    try:
+        asyncio.run(run_ticks(sim, shard, shards, duration, tick, batch_size, routes, queues, barrier))
+    except BrokenBarrierError as e:
+        raise ShardStopped(f'Shard {shard} stopped, another shard failed or timed out') from e
+    except Empty as e:
+        barrier.abort()
+        raise ShardStopped(f'Shard {shard} stopped, another shard did not send its operations in time') from e
+    except BaseException:
+        # Release the other shards waiting at the barrier, they fail instead of waiting on this one
+        barrier.abort()
+        raise
+    if sim.sink is not None:
+        sim.sink.flush(sim.banks)
+
+    joined = [sim.individuals[user_id] for user_id in sorted(sim.owned_users - existing)]
+    return {
+        'banks': {
+            name: {
+                'transactions': bank.transactions.iloc[settled[name][0]:],
+                'accounts': bank.accounts[bank.accounts['account_no'].isin(bank.owned)],
+                'devices': bank.devices.iloc[settled[name][1]:],
+            }
+            for name, bank in sim.banks.items()
+        },
+        'individuals': {
+            'population': sim.population.take([individual.row for individual in joined]),
+            'rngs': [individual.rng for individual in joined],
+        },
+        'telemetry': sim.telemetry,
+    }
+
+
+def merge_shards(sim, results: list):
+    """
+        Merge the records of every shard back into the simulator
+
+        @param sim: The simulator that was sharded
+        @param results: The records of each shard, in shard order
+    """
+    merged = defaultdict(lambda: defaultdict(list))
+    for result in results:
+        for name, records in result['banks'].items():
+            for key, frame in records.items():
+                merged[name][key].append(frame)
+
+        sim.telemetry.merge(result['telemetry'])
+        # The individuals that joined in the shard get rows in the population of the simulator
+        joined = result['individuals']
+        rows = sim.population.extend(joined['population'])
+        for row, user_id, rng in zip(rows, joined['population']['user_id'], joined['rngs']):
+            sim.individuals[user_id] = Individual(sim.population, row, rng=rng)
+
+    # Shards return only what they added, so the records from before the run come first
+    for name, bank in sim.banks.items():
+        transactions = pd.concat([bank.transactions, *merged[name]['transactions']], ignore_index=True)
+        transactions = transactions.sort_values(by='time', kind='stable', ignore_index=True)
+        accounts = pd.concat(merged[name]['accounts'], ignore_index=True).sort_values(by='account_no', ignore_index=True)
+        devices = pd.concat([bank.devices, *merged[name]['devices']], ignore_index=True)
+
+        sim.banks[name] = banking.Bank(name, locations=sim.locations, transactions=transactions, accounts=accounts, devices=devices, fraudulence=bank.fraudulence, location_index=bank.location_index, rng=bank.rng)
+
+    sim.world = World(banks=sim.banks, individuals=sim.individuals, location_index=sim.location_index, population=sim.population)
+    sim.events = Events(banks=sim.banks, individuals=sim.individuals, locations=sim.locations, world=sim.world)
+
+
+async def simulate_sharded(sim, period, iterations, shards, batch_size=20, seed=None, tick=60 * 60):
+    """
+        Simulate banking processes across processes, each owning a share of the individuals
+
+        @param sim: The simulator to run
+        @param period: The period of the simulation
+        @param iterations: The iteration of periods
+        @param shards: The number of processes
+        @param batch_size: The number of events to run at once
+        @param seed: The seed for the random number generator
+        @param tick: The number of seconds between exchanges of cross shard operations
+    """
+    duration = period * iterations
+    owners = partition(sim.individuals.keys(), shards)
+
+    # Shards only stream the transactions they add
+    if sim.sink is not None:
+        sim.sink.flush(sim.banks)
+    state = pickle.dumps(sim)
+
+    loop = asyncio.get_running_loop()
+    with Manager() as manager, ProcessPoolExecutor(max_workers=shards) as pool:
+        queues = [manager.Queue() for _ in range(shards)]
+        barrier = manager.Barrier(shards)
+        results = await asyncio.gather(*[
+            loop.run_in_executor(pool, run_shard, state, shard, shards, duration, tick, batch_size, seed, owners, queues, barrier)
+            for shard in range(shards)
+        ], return_exceptions=True)
+
+    # The shards a failing shard stopped only report the barrier broke, the failure is raised instead
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        raise next((failure for failure in failures if not isinstance(failure, ShardStopped)), failures[0])
+
+    merge_shards(sim, results)
+    clock.global_clock.ticker = duration
+    logger.info('Simulation complete.')
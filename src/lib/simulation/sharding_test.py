@@ -0,0 +1,58 @@
+import asyncio
+import numpy as np
+import pytest
+
+from src.lib.simulation import sharding
+from src.lib.simulation.simulator import Simulator
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashingSimulator(Simulator):
+    async def step(self, batch_size):
+        # The shard owning the second user fails on its first step
+        if sorted(self.individuals)[1] in self.owned_users:
+            raise Crash()
+        return await super().step(batch_size)
+
+
+def make_simulator(num_users=40):
+    sim = Simulator(num_users=num_users, num_banks=3, min_amount=100, max_amount=100_000_000_000, geo=(9, 3), radius=10000, fraudulence=.05, seed=1)
+    asyncio.run(sim.setup_reality())
+    return sim
+
+
+def test_partition_covers_every_user_once():
+    user_ids = [f'USER_{i}' for i in range(11)]
+    owners = sharding.partition(reversed(user_ids), 3)
+
+    assert sorted(user_id for users in owners for user_id in users) == sorted(user_ids)
+    assert [len(users) for users in owners] == [4, 4, 3]
+
+
+def test_sharded_simulation_settles_every_account_and_repeats():
+    runs = []
+    for _ in range(2):
+        sim = make_simulator()
+        asyncio.run(sim.simulate(60 * 60 * 24, .2, batch_size=5, shards=2))
+        runs.append(asyncio.run(sim.extract_data()))
+
+    # Every account is settled by one shard, so its balance is the last balance it transacted at
+    transactions, accounts = runs[0]['transactions'], runs[0]['accounts']
+    for _, account in accounts.iterrows():
+        history = transactions[(transactions['holder'] == account['account_no']) & (transactions['holder_bank'] == account['bank_name'])]
+        assert np.isclose(history['balance'].iloc[-1], account['balance'])
+
+    for name, data in runs[0].items():
+        assert data.equals(runs[1][name])
+
+
+def test_a_failing_shard_fails_the_run_instead_of_hanging():
+    sim = make_simulator()
+    sim.__class__ = CrashingSimulator
+
+    # The other shard waits at the barrier until the failing shard aborts it
+    with pytest.raises(Crash):
+        asyncio.run(sim.simulate(60 * 60 * 24, .2, batch_size=5, shards=2))
@@ -1,20 +1,27 @@
-from time import sleep
+from time import perf_counter, sleep
 import math
 from pathlib import Path
-import random
+import numpy as np
 import pandas as pd
 import asyncio
 import stat
 import os
-from uuid import uuid4
 
 from src.lib.analytics import extractor
 from src.lib.analytics.anomalizer import check_unusual
-from src.lib.simulation import banking, clock
+from src.lib.simulation import banking, batching, clock, sharding
 from src.lib.simulation.individual import Individual
+from src.lib.simulation.population import Population, build_population
 from src.lib.simulation.events import Events
+from src.lib.simulation.world import World
+from src.lib.simulation.spatial import SpatialIndex
+from src.lib.simulation.rng import RandomStream
+from src.lib.simulation.telemetry import Telemetry
 from src.lib.simulation.generator import random_amount
 from src.lib.simulation.generator import fake
+from src.lib.utils.logger import get_logger
+
+logger = get_logger('Simulation Logger')
 
 
 class Simulator:
@@ -30,7 +37,8 @@ class Simulator:
             max_amount = 5_000_000,
             geo=(9.3, 3.9),
             radius=50_000,
-            fraudulence = .05
+            fraudulence = .05,
+            seed = 42
     ):
         """
             Initialize a banking system
@@ -38,6 +46,7 @@ class Simulator:
             @param min_amount: The minimum amount to transact
             @param num_users: The number of users
             @param bank_names: The names of banks
+            @param seed: The seed every random stream of the simulation is spawned from
         """
         self.geo = geo
         self.radius = radius
@@ -47,14 +56,44 @@ class Simulator:
         self.num_users = num_users
         self.num_banks = num_banks
 
+        # The users whose accounts this simulator runs events for, None runs all of them
+        self.owned_users = None
+        self.vectorised = False
+
+        # Where transactions are streamed to while the simulation runs, None keeps them in the banks
+        self.sink = None
+
+        # Called with the simulator every checkpoint_interval simulated seconds, None skips checkpoints
+        self.checkpoint = None
+        self.checkpoint_interval = 60 * 60 * 24
+
+        # Called with a progress report every report_interval wall seconds, None skips reports
+        self.telemetry = Telemetry()
+        self.report = None
+        self.report_interval = 5
+
+        # Banks and individuals draw from their own substreams so draws do not depend on who else is drawing
+        self.rng = RandomStream(seed)
+        self.event_rng = self.rng.child('events')
+
+
+    def __getstate__(self):
+        # The semaphore belongs to the event loop of the run, and the checkpoint hook to its caller
+        state = dict(vars(self))
+        state.pop('semaphore', None)
+        state['checkpoint'] = None
+        state['report'] = None
+        return state
+
 
     async def generate_locations(self, count=1000):
         degrees = self.radius / 111_320
         locations = []
+        rng = self.rng.child('locations')
 
         for _ in range(count):
-            radius = degrees * math.sqrt(random.random())
-            theta = random.random() * 2 * math.pi
+            radius = degrees * math.sqrt(rng.random())
+            theta = rng.random() * 2 * math.pi
             
             lat, lon = self.geo
             new_lat = lat + radius * math.cos(theta)
@@ -63,6 +102,7 @@ class Simulator:
             locations.append({'latitude': new_lat, 'longitude': new_lon})
 
         self.locations = pd.DataFrame(locations)
+        self.location_index = SpatialIndex(self.locations.index, self.locations['latitude'], self.locations['longitude'])
 
 
     async def setup_individuals(self, num_users: int):
@@ -71,14 +111,13 @@ class Simulator:
 
             @param num_users: The number of users
         """
-        # Generate all the individuals
-        self.individuals = {}
-        for _ in range(num_users):
-            # Initialize the bank
-            individual = Individual(locations=self.locations)
-
-            await individual.setup()
-            self.individuals[individual.profile['user_id']] = individual
+        # Generate all the individuals in one pass, the population derives the stream of each from its row
+        self.population = Population(capacity=num_users, rng=self.rng)
+        rows = self.population.extend(build_population(num_users, self.locations, self.rng.child('population')))
+        self.individuals = {
+            user_id: Individual(self.population, row)
+            for row, user_id in zip(rows, self.population.profiles.column('user_id'))
+        }
 
 
     async def setup_banks(self, num_banks: int):
@@ -89,17 +128,19 @@ class Simulator:
         """
         # Reset the banks in the simulation
         self.banks = {}
-        profiles = [individual.profile for individual in self.individuals.values()]
+        profiles = [self.population.profile(row) for row in range(len(self.population))]
         min_accounts = int(len(profiles) * .3)
 
 
         # Generate a bank for each bank name
-        for _ in range(num_banks):
+        for position in range(num_banks):
             # Initialize the bank
+            rng = self.rng.child('bank', position)
+            fake.seed_instance(rng.seed())
             name = f'{fake.name()} Bank'
-            bank = banking.Bank(name, locations=self.locations, fraudulence=self.fraudulence)
+            bank = banking.Bank(name, locations=self.locations, fraudulence=self.fraudulence, location_index=self.location_index, rng=rng)
 
-            await bank.setup(num_devices=random.randint(3, 5), users=random.sample(profiles, random.randint(min_accounts, min_accounts * 2)))
+            await bank.setup(num_devices=rng.randint(3, 5), users=rng.sample(profiles, rng.randint(min_accounts, min_accounts * 2)))
             self.banks[name] = bank
 
 
@@ -107,10 +148,14 @@ class Simulator:
         """
             Sets the reality for the simulation
         """
+        # Opening transactions are stamped by the clock
+        clock.global_clock.reset(rng=self.rng.child('clock', 'setup'))
+
         await self.generate_locations()
         await self.setup_individuals(self.num_users)
         await self.setup_banks(self.num_banks)
-        self.events = Events(banks=self.banks, individuals=self.individuals, locations=self.locations)
+        self.world = World(banks=self.banks, individuals=self.individuals, location_index=self.location_index, population=self.population)
+        self.events = Events(banks=self.banks, individuals=self.individuals, locations=self.locations, world=self.world)
             
 
     async def run_event(self):
@@ -119,50 +164,113 @@ class Simulator:
         """
 
         # Selects a random account to initiate event
-        accounts = pd.concat([bank.accounts for bank in self.banks.values()])
-        account = accounts[accounts['balance'] >= self.min_amount].sample(n=1).squeeze()
-        balance = account['balance']
+        position = self.pick_account()
+        if position is None:
+            return
+
+        account = self.world.accounts.iloc[position]
+        balance = self.world.balances([position])[0]
+        individual: Individual = self.individuals[account['bvn']]
+        rng = individual.rng
 
         # Decide on amount for transaction
-        spend_limit = random.choices([.1, .4, .7, 1], [.7, .19, .109, self.fraudulence], k=1)[0] * balance
+        spend_limit = rng.choices([.1, .4, .7, 1], [.7, .19, .109, self.fraudulence], k=1)[0] * balance
 
         limit = spend_limit if spend_limit > self.min_amount else balance 
         limit = spend_limit if spend_limit < self.max_amount else self.max_amount
         
-        amount = random_amount(level=account['kyc'], limit=limit)
+        amount = random_amount(level=account['kyc'], limit=limit, rng=rng)
 
         # Generate transaction reference
-        reference = str(uuid4())
-
-        individual: Individual = self.individuals[account['bvn']]
+        reference = str(rng.uuid())
 
         # Set the account holders details
         holder = {
             'account_no': account['account_no'],
             'bvn': account['bvn'],
             'bank_name': account['bank_name'],
-            'balance': account['balance'],
+            'balance': balance,
             'latitude': individual.profile['latitude'],
             'longitude': individual.profile['longitude']
         }
 
 
         # Will transaction be reversed?
-        reverse = random.random() < self.fraudulence
+        reverse = rng.random() < self.fraudulence
 
-        # Play event
+        # Play event, individuals without any behaviour sit it out
         event = await self.events.spin(individual)
+        if event is None:
+            return
+
+        started = perf_counter()
         await event(holder, amount, reference, {'reverse': reverse})
+        self.telemetry.observe(event.__name__.upper(), perf_counter() - started)
+        self.telemetry.count(event.__name__.upper())
 
         # A new user comes in
-        if random.random() > .995:
-            if random.random() > .5:
-                new_individual = Individual(self.locations)
-                await new_individual.setup()
-                self.individuals[new_individual.profile['user_id']] = new_individual
-                self.events.individuals = self.individuals
-            else:
-                await self.banks[account['bank_name']].open_account(individual.profile)
+        if self.event_rng.random() > .995:
+            await self.grow(account['bank_name'], individual.profile)
+
+
+    def candidates(self) -> np.ndarray:
+        # The positions of the accounts this simulator plays, every account unless it runs a shard
+        if self.owned_users is None:
+            return self.world.view('candidates', lambda: np.arange(self.world.offsets[-1]))
+        return self.world.view('candidates', lambda: np.flatnonzero(self.world.accounts['bvn'].isin(self.owned_users).to_numpy()))
+
+
+    def eligible_accounts(self, balances: np.ndarray) -> np.ndarray:
+        """
+            The accounts that can start an event
+
+            @param balances: The balances of every account of the world
+
+            @return: The positions of the accounts
+        """
+        candidates = self.candidates()
+        return candidates[balances[candidates] >= self.min_amount]
+
+
+    def pick_account(self, tries: int = 32):
+        """
+            Pick one of the accounts that can start an event, all of them equally likely
+
+            @param tries: The accounts to try before reading every balance
+
+            @return: The position of the account, None when there is none
+        """
+        candidates = self.candidates()
+        if not len(candidates):
+            return None
+
+        # Most accounts can start an event, so a few picks find one by reading only their balances
+        generator = self.event_rng.generator
+        for _ in range(tries):
+            position = candidates[generator.integers(len(candidates))]
+            if self.world.balances([position])[0] >= self.min_amount:
+                return position
+
+        eligible = self.eligible_accounts(self.world.balances())
+        return eligible[generator.integers(len(eligible))] if len(eligible) else None
+
+
+    async def grow(self, bank_name: str, profile: dict):
+        """
+            A new individual joins, or the holder opens another account
+
+            @param bank_name: The bank of the holder
+            @param profile: The profile of the holder
+        """
+        if self.event_rng.random() > .5:
+            rng = self.event_rng.child('individual', len(self.individuals))
+            rows = self.population.extend(build_population(1, self.locations, rng))
+            new_individual = Individual(self.population, rows[0], rng=rng)
+            self.world.add_individual(new_individual)
+            if self.owned_users is not None:
+                self.owned_users.add(new_individual.profile['user_id'])
+        else:
+            await self.world.open_account(self.banks[bank_name], profile)
 
 
     async def run_batches(self):
@@ -175,59 +283,101 @@ class Simulator:
             await self.run_event()
 
 
-    async def simulate(self, period, iterations, batch_size=20, seed=42, wait_time=0):
+    async def step(self, batch_size):
+        """
+            Run one batch of events, fewer in the early hours
+
+            @param batch_size: The number of events to run at once
+        """
+
+        # Factoring time for sleep and low transaction volumn
+        batch_events = lambda: asyncio.gather(*[self.run_batches() for _ in range(batch_size)])
+        if self.vectorised:
+            batch_events = lambda: batching.run_tick(self, batch_size)
+        if clock.global_clock.now().hour <= 6:
+            await batch_events() if self.event_rng.random() > .7 else clock.global_clock.advance(10)
+        else:
+            await batch_events()
+
+
+    async def simulate(self, period, iterations, batch_size=20, seed=None, wait_time=0, shards=1, vectorised=False, resume=False):
         """
             Simulate banking processes
 
             @param period: The period of the simulation
             @param iteration: The iteration of periods
             @param batch_size: The number of events to run at once
-            @param seed: The seed for the random number generator
+            @param seed: Replaces the seed of the simulation's event streams, the individuals and banks keep theirs
             @param fraudulence: The percentage of fraudulence
             @param wait_time: The time to wait between batches
+            @param shards: The number of processes to split the individuals across
+            @param vectorised: Draw and settle each batch of events with array operations, batches can then hold thousands of events
+            @param resume: Carry on from a restored checkpoint instead of starting the clock again
         """
+        self.vectorised = vectorised
+
+        # Shards do not checkpoint, so a resumed simulation finishes in this process
+        if shards > 1 and not resume:
+            return await sharding.simulate_sharded(self, period, iterations, shards, batch_size=batch_size, seed=seed)
 
         self.semaphore = asyncio.Semaphore(batch_size)
         
-        # Set a seed for familiar generation
-        random.seed(seed)
+        if not resume:
+            # Set a seed for familiar generation
+            if seed is not None:
+                self.event_rng = RandomStream(seed).child('events')
 
-        # Reset the clock
-        clock.global_clock.reset()
+            # Reset the clock
+            clock.global_clock.reset(rng=self.event_rng.child('clock'))
 
         # Calculation the duration of the simulation
         duration = period * iterations
 
         # Initialize the milestone
-        milestone = 0
+        milestone = clock.global_clock.ticker // period
+        next_checkpoint = clock.global_clock.ticker + self.checkpoint_interval
+        self.telemetry.start()
+        next_report = perf_counter() + self.report_interval
 
         # Run for each scene
         while (duration > clock.global_clock.ticker):
-
-            # Factoring time for sleep and low transaction volumn
-            batch_events = lambda: asyncio.gather(*[self.run_batches() for _ in range(batch_size)])
-            if clock.global_clock.now().hour <= 6:
-                await batch_events() if random.random() > .7 else clock.global_clock.advance(10)
-            else:
-                await batch_events()
+            await self.step(batch_size)
 
             progress = clock.global_clock.ticker // period
             if milestone < progress:
                 milestone = progress
-                print(f'Season: {milestone}')
+                logger.info(f'Season: {milestone}')
+
+            # Move the buffered transactions out of memory
+            if self.sink is not None and self.sink.due(self.banks):
+                self.sink.flush(self.banks)
+
+            # Checkpoints are taken between steps, after the streamed transactions are on disk
+            if self.checkpoint is not None and clock.global_clock.ticker >= next_checkpoint and duration > clock.global_clock.ticker:
+                next_checkpoint = clock.global_clock.ticker + self.checkpoint_interval
+                if self.sink is not None:
+                    self.sink.flush(self.banks)
+                await self.checkpoint(self)
+
+            if self.report is not None and perf_counter() >= next_report:
+                next_report = perf_counter() + self.report_interval
+                await self.report(self.telemetry.report(self, duration))
 
             # Advance the clock
             clock.global_clock.advance(wait_time)
             sleep(wait_time)
 
+        if self.sink is not None:
+            self.sink.flush(self.banks)
 
-        print('Simulation complete.')
+        logger.info('Simulation complete.')
 
     
     async def extract_data(self):
-        transactions = pd.concat([bank.transactions for bank in self.banks.values()])
+        # Streamed transactions stay on disk and are read part by part
+        transactions = self.sink if self.sink is not None else pd.concat([bank.transactions for bank in self.banks.values()])
         bank_devices = pd.concat([bank.devices for bank in self.banks.values()])
-        profiles = pd.DataFrame([individual.profile for individual in self.individuals.values()])
+        profiles = self.population.frame()
         accounts = pd.concat([bank.accounts for bank in self.banks.values()])
         accounts = accounts.reset_index().merge(
             profiles.reset_index()[['latitude', 'longitude', 'devices', 'user_id', 'name', 'gender', 'email', 'birthdate']], 
@@ -251,23 +401,22 @@ class Simulator:
         for name, dataframe in data.items():
             file_path = target_dir / f'{name}.csv'
             self.datasets.append(str(file_path))
-            dataframe.to_csv(file_path, index=False)
+
+            # The file may be linked into a cached dataset, so it is replaced rather than overwritten
+            file_path.unlink(missing_ok=True)
+
+            # Streamed datasets are appended a part at a time
+            chunks = [dataframe] if isinstance(dataframe, pd.DataFrame) else dataframe
+            for position, chunk in enumerate(chunks):
+                chunk.to_csv(file_path, index=False, mode='w' if position == 0 else 'a', header=position == 0)
 
 
     async def engineer_features(self):
-        df = self.generated_data['transactions'].reset_index(drop=True)
+        transactions = self.generated_data['transactions']
+        df = transactions if isinstance(transactions, pd.DataFrame) else pd.concat(transactions)
+        df = df.reset_index(drop=True)
         accounts_df = self.generated_data['accounts']
 
-        df = df.apply(lambda row: extractor.extract_account_features(row, accounts_df), axis=1)
-        df = df.apply(extractor.extract_time_features, axis=1)
-        df = df.apply(extractor.extract_money_features, axis=1)
-        df = df.apply(lambda row: extractor.extract_location_features(df, row), axis=1)
-        df = df.apply(lambda row: extractor.extract_frequency_features(df, row), axis=1)
-        df = extractor.extract_bounds(df, 'holder')
-        df = extractor.extract_holder_occurance(df)
-        df = extractor.extract_holder_bvn_occurance(df)
-        df = extractor.extract_related_occurance(df)
-        df = extractor.extract_related_bvn_occurance(df)
-        df = extractor.extract_rolling_averages(df)
+        df = extractor.extract_features(df, accounts_df)
 
         return check_unusual(df)
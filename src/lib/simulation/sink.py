@@ -0,0 +1,155 @@
+from collections import defaultdict
+from pathlib import Path
+import pandas as pd
+
+# The file extension of each part format
+EXTENSIONS = {'parquet': 'parquet', 'csv': 'csv'}
+
+
+class TransactionSink:
+    """
+        Streams the transactions of a simulation to part files partitioned by day, so the banks only hold the rows since the last flush
+    """
+
+    def __init__(self, path, format: str = 'parquet', flush_size: int = 50_000):
+        """
+            Initialize a transaction sink
+
+            @param path: The directory to write the parts to
+            @param format: The format of the parts, parquet or csv
+            @param flush_size: The number of buffered transactions that triggers a flush
+        """
+        if format not in EXTENSIONS:
+            raise ValueError(f'Unknown transaction sink format: {format}')
+
+        # Fail before the simulation runs rather than at its first flush when no parquet engine is installed
+        if format == 'parquet':
+            pd.io.parquet.get_engine('auto')
+
+        self.path = Path(path)
+        self.format = format
+        self.flush_size = flush_size
+        self.parts = 0
+        self.rows = 0
+
+        # Shards write to the same directory, each part name ends with the shard that wrote it
+        self.suffix = ''
+
+
+    def pending(self, banks: dict) -> int:
+        # The number of transactions buffered in the banks
+        return sum(len(bank.transaction_ledger) for bank in banks.values())
+
+
+    def due(self, banks: dict) -> bool:
+        # Whether the buffered transactions should be flushed
+        return self.pending(banks) >= self.flush_size
+
+
+    def flush(self, banks: dict) -> list:
+        """
+            Move the buffered transactions of every bank to a part file per day
+
+            @param banks: The banks in the simulation
+
+            @return: The paths of the written parts
+        """
+        frames = [bank.transaction_ledger.drain() for bank in banks.values() if len(bank.transaction_ledger)]
+        if not frames:
+            return []
+
+        df = pd.concat(frames, ignore_index=True).sort_values(by='time', kind='stable', ignore_index=True)
+        files = []
+
+        for day, rows in df.groupby(df['time'].str[:10], sort=True):
+            directory = self.path / f'date={day}'
+            directory.mkdir(parents=True, exist_ok=True)
+
+            file_path = directory / f'part-{self.parts:05d}{self.suffix}.{EXTENSIONS[self.format]}'
+            if self.format == 'parquet':
+                rows.to_parquet(file_path, index=False)
+            else:
+                rows.to_csv(file_path, index=False)
+            files.append(file_path)
+
+        self.parts += 1
+        self.rows += len(df)
+        return files
+
+
+    def files(self) -> list:
+        # Every part in the directory, by day and then in the order they were flushed
+        return sorted(self.path.glob(f'date=*/part-*.{EXTENSIONS[self.format]}'))
+
+
+    def rollback(self):
+        # Remove the parts flushed after the sink was checkpointed, the resumed run writes them again
+        for file_path in self.files():
+            if int(file_path.stem.split('-')[1]) >= self.parts:
+                file_path.unlink()
+
+
+    def clear(self):
+        # Remove every part, for a simulation that starts over
+        for file_path in self.files():
+            file_path.unlink()
+        self.parts = 0
+        self.rows = 0
+
+
+    def load(self, file_path: Path, columns: list = None) -> pd.DataFrame:
+        # Read a part
+        if self.format == 'parquet':
+            return pd.read_parquet(file_path, columns=columns)
+        return pd.read_csv(file_path, usecols=columns, float_precision='round_trip')
+
+
+    def read(self, columns: list = None):
+        """
+            Read the transactions in time order, a part at a time.
+            Every shard writes its own parts of a day, so the parts of each shard are merged by time
+
+            @param columns: The columns to read, all of them by default
+
+            @return: An iterator over the transactions, in time order
+        """
+        fields = None if columns is None else list(dict.fromkeys([*columns, 'time']))
+
+        # The parts of a shard follow one another in time, the shards of a day overlap
+        days = defaultdict(lambda: defaultdict(list))
+        for file_path in self.files():
+            days[file_path.parent][tuple(file_path.stem.split('-')[2:])].append(file_path)
+
+        for shards in days.values():
+            streams = [(self.load(file_path, fields) for file_path in parts) for parts in shards.values()]
+            for frame in merge_parts(streams):
+                yield frame if columns is None else frame[columns]
+
+
+    def __iter__(self):
+        return self.read()
+
+
+def merge_parts(streams: list):
+    """
+        Merge streams of parts that are each in time order
+
+        @param streams: The iterators over the parts of each stream
+
+        @return: An iterator over the transactions, in time order
+    """
+    streams = [iter(stream) for stream in streams]
+    buffers = [next(stream, None) for stream in streams]
+
+    while live := [position for position, buffer in enumerate(buffers) if buffer is not None]:
+        # No unread row comes before the earliest last row of the buffers
+        cutoff = min(buffers[position]['time'].iloc[-1] for position in live)
+
+        ready = []
+        for position in live:
+            buffer = buffers[position]
+            count = buffer['time'].searchsorted(cutoff, side='right')
+            ready.append(buffer.iloc[:count])
+            buffers[position] = buffer.iloc[count:] if count < len(buffer) else next(streams[position], None)
+
+        yield pd.concat(ready, ignore_index=True).sort_values(by='time', kind='stable', ignore_index=True)
@@ -0,0 +1,52 @@
+import asyncio
+import pandas as pd
+import pytest
+
+from src.lib.simulation.simulator import Simulator
+from src.lib.simulation.sink import TransactionSink
+
+
+def simulate(sink: TransactionSink = None, shards=1) -> Simulator:
+    sim = Simulator(num_users=40, num_banks=3, min_amount=100, max_amount=100_000_000_000, geo=(9, 3), radius=10000, fraudulence=.05, seed=7)
+    sim.sink = sink
+    asyncio.run(sim.setup_reality())
+    asyncio.run(sim.simulate(60 * 60 * 24, 2, batch_size=200, shards=shards, vectorised=True))
+    return sim
+
+
+def canonical(df: pd.DataFrame) -> pd.DataFrame:
+    # Streamed parts come back in a different order and through csv
+    return df.sort_values(by=['time', 'reference', 'type'], ignore_index=True).astype(str)
+
+
+def test_sink_streams_every_transaction(tmp_path):
+    sink = TransactionSink(tmp_path / 'transactions', format='csv', flush_size=500)
+    streamed = simulate(sink)
+    expected = asyncio.run(simulate().extract_data())['transactions']
+
+    # The banks only buffer what came after the last flush
+    assert sink.pending(streamed.banks) == 0
+    assert len(sink.files()) > 2
+    for file in sink.files():
+        assert (pd.read_csv(file)['time'].str[:10] == file.parent.name.removeprefix('date=')).all()
+
+    asyncio.run(streamed.save_data(tmp_path))
+    saved = pd.read_csv(tmp_path / 'transactions.csv', float_precision='round_trip')
+    assert canonical(saved).equals(canonical(expected.reset_index(drop=True)))
+    assert canonical(pd.concat(streamed.generated_data['transactions'], ignore_index=True)).equals(canonical(saved))
+
+
+def test_sharded_sink_streams_every_transaction(tmp_path):
+    sink = TransactionSink(tmp_path / 'transactions', format='csv', flush_size=500)
+    streamed = asyncio.run(simulate(sink, shards=2).extract_data())['transactions']
+    expected = asyncio.run(simulate(shards=2).extract_data())['transactions']
+
+    assert canonical(pd.concat(streamed, ignore_index=True)).equals(canonical(expected.reset_index(drop=True)))
+
+    # The parts of the shards are merged, so the transactions are replayed in time order
+    assert pd.concat(streamed, ignore_index=True)['time'].is_monotonic_increasing
+
+
+def test_sink_rejects_unknown_formats(tmp_path):
+    with pytest.raises(ValueError):
+        TransactionSink(tmp_path, format='json')
@@ -0,0 +1,117 @@
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from src.lib.analytics import tracker
+
+# Radius of the earth in km, matching tracker.haversine
+EARTH_RADIUS = 6371
+
+
+class SpatialIndex:
+    """
+        A haversine radius index over labelled points
+    """
+
+    def __init__(self, keys: list = None, latitudes: list = None, longitudes: list = None, rebuild_size: int = 32):
+        """
+            Initialize a spatial index
+
+            @param keys: The labels of the points
+            @param latitudes: The latitudes of the points
+            @param longitudes: The longitudes of the points
+            @param rebuild_size: The number of unindexed points to tolerate before rebuilding the tree
+        """
+        self.keys = list(keys) if keys is not None else []
+        self.latitudes = [float(x) for x in latitudes] if latitudes is not None else []
+        self.longitudes = [float(x) for x in longitudes] if longitudes is not None else []
+        self.rebuild_size = rebuild_size
+        self.tree = None
+        self.built = 0
+        self.rebuild()
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    def __contains__(self, key):
+        return key in self._members
+
+
+    def rebuild(self):
+        """
+            Rebuild the tree over every point
+        """
+        self._members = set(self.keys)
+        self.built = len(self.keys)
+        self.tree = BallTree(np.radians(np.column_stack([self.latitudes, self.longitudes])), metric='haversine') if self.built else None
+
+
+    def add(self, key, lat, lon):
+        """
+            Add a point to the index
+
+            @param key: The label of the point
+            @param lat: The latitude
+            @param lon: The longitude
+        """
+        self.keys.append(key)
+        self.latitudes.append(float(lat))
+        self.longitudes.append(float(lon))
+        self._members.add(key)
+
+        # New points are scanned linearly until there are enough to justify a rebuild
+        if len(self.keys) - self.built > max(self.rebuild_size, self.built // 4):
+            self.rebuild()
+
+
+    def query(self, lat, lon, radius) -> list:
+        """
+            Get the labels of the points within radius of a location
+
+            @param lat: The latitude
+            @param lon: The longitude
+            @param radius: The radius in km
+
+            @return: The labels of the points within the radius
+        """
+        positions = []
+
+        if self.tree is not None:
+            positions = self.tree.query_radius(np.radians([[lat, lon]]), r=radius / EARTH_RADIUS)[0].tolist()
+
+        if self.built < len(self.keys):
+            distances = tracker.haversine(lat, lon, self.latitudes[self.built:], self.longitudes[self.built:])
+            positions += (np.flatnonzero(distances <= radius) + self.built).tolist()
+
+        return [self.keys[position] for position in positions]
+
+
+    def query_many(self, lats, lons, radii) -> tuple:
+        """
+            Get the points within radius of many locations at once
+
+            @param lats: The latitudes
+            @param lons: The longitudes
+            @param radii: The radius in km of each location
+
+            @return: The location and the position of the point of every match, grouped by location
+        """
+        lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        radii = np.broadcast_to(np.asarray(radii, dtype=float), lats.shape)
+        rows, positions = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)]
+
+        if self.tree is not None and len(lats):
+            matches = self.tree.query_radius(np.radians(np.column_stack([lats, lons])), r=radii / EARTH_RADIUS)
+            rows.append(np.repeat(np.arange(len(lats)), [len(match) for match in matches]))
+            positions.append(np.concatenate(list(matches)).astype(int))
+
+        if self.built < len(self.keys) and len(lats):
+            distances = tracker.haversine(lats[:, None], lons[:, None], np.array(self.latitudes[self.built:])[None, :], np.array(self.longitudes[self.built:])[None, :])
+            row, column = np.nonzero(distances <= radii[:, None])
+            rows.append(row)
+            positions.append(column + self.built)
+
+        rows, positions = np.concatenate(rows), np.concatenate(positions)
+        order = np.argsort(rows, kind='stable')
+        return rows[order], positions[order]
@@ -0,0 +1,55 @@
+import numpy as np
+
+from src.lib.analytics import tracker
+from src.lib.simulation.spatial import SpatialIndex
+
+
+def within(lats, lons, lat, lon, radius) -> list:
+    # The positions of the points within radius of a location, by brute force
+    return np.flatnonzero(tracker.haversine(lat, lon, lats, lons) <= radius).tolist()
+
+
+def points(size: int, seed: int = 0) -> tuple:
+    generator = np.random.default_rng(seed)
+    return 9 + generator.normal(0, .05, size), 3 + generator.normal(0, .05, size)
+
+
+def test_query_matches_brute_force_across_the_unbuilt_tail():
+    lats, lons = points(300)
+    index = SpatialIndex(range(200), lats[:200], lons[:200], rebuild_size=64)
+
+    # Points added after the build are scanned until enough of them pile up, then the tree is rebuilt
+    for position in range(200, 300):
+        index.add(position, lats[position], lons[position])
+        if position == 240:
+            assert index.built == 200
+
+        for lat, lon, radius in [(lats[position], lons[position], 2.), (9., 3., 4.)]:
+            assert sorted(index.query(lat, lon, radius)) == within(lats[:position + 1], lons[:position + 1], lat, lon, radius)
+
+    assert len(index) == 300 and index.built > 200
+
+
+def test_query_many_matches_brute_force():
+    lats, lons = points(300, seed=1)
+    index = SpatialIndex(range(250), lats[:250], lons[:250])
+    for position in range(250, 300):
+        index.add(position, lats[position], lons[position])
+    assert index.built < len(index)
+
+    generator = np.random.default_rng(2)
+    origins, radii = generator.integers(0, 300, 40), generator.uniform(0, 6, 40)
+    rows, positions = index.query_many(lats[origins], lons[origins], radii)
+
+    assert (np.diff(rows) >= 0).all()
+    for row, (origin, radius) in enumerate(zip(origins, radii)):
+        assert sorted(positions[rows == row].tolist()) == within(lats, lons, lats[origin], lons[origin], radius)
+
+
+def test_an_empty_index_finds_nothing():
+    index = SpatialIndex()
+    assert index.query(9, 3, 10) == []
+    assert all(len(result) == 0 for result in index.query_many([9., 9.1], [3., 3.1], 10))
+
+    index.add('ATM_1', 9, 3)
+    assert 'ATM_1' in index and index.query(9, 3, 1) == ['ATM_1']
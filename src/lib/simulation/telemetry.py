@@ -0,0 +1,107 @@
+from collections import Counter
+from time import perf_counter
+import resource
+import numpy as np
+
+from src.lib.simulation import clock
+
+# The upper bounds in microseconds of the latency histogram buckets, the last bucket is unbounded.
+# Whole numbers keep the labels usable as mongo field names.
+LATENCY_BOUNDS = [100, 500, 1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000]
+LATENCY_LABELS = [f'<={bound}us' for bound in LATENCY_BOUNDS] + [f'>{LATENCY_BOUNDS[-1]}us']
+
+
+class Telemetry:
+    """
+        Throughput and latency counters of a simulation run
+    """
+
+    def __init__(self):
+        """
+            Initialize the counters
+        """
+        self.events = Counter()
+        self.latencies = {}
+        self.latency_totals = Counter()
+        self.start()
+
+
+    def start(self):
+        # Rates are measured from the start of the run, a resumed run measures from its restart
+        self.started = perf_counter()
+        self.start_ticker = clock.global_clock.ticker
+        self.start_events = sum(self.events.values())
+
+
+    def count(self, name: str, events: int = 1):
+        # Count events of a type
+        self.events[name] += int(events)
+
+
+    def observe(self, name: str, seconds: float):
+        """
+            Add a latency to the histogram of an operation
+
+            @param name: The operation, an event type or a vectorised tick
+            @param seconds: The time the operation took
+        """
+        histogram = self.latencies.setdefault(name, np.zeros(len(LATENCY_LABELS), dtype=int))
+        histogram[np.searchsorted(LATENCY_BOUNDS, seconds * 1_000_000)] += 1
+        self.latency_totals[name] += seconds
+
+
+    def merge(self, other: 'Telemetry'):
+        """
+            Add the counters of another run, like a shard's
+
+            @param other: The telemetry to add
+        """
+        self.events.update(other.events)
+        self.latency_totals.update(other.latency_totals)
+        for name, histogram in other.latencies.items():
+            self.latencies[name] = self.latencies.get(name, 0) + histogram
+
+
+    def report(self, sim, duration: float) -> dict:
+        """
+            Summarise the run so far
+
+            @param sim: The simulator
+            @param duration: The duration of the simulation in simulated seconds
+
+            @return: The progress, throughput, latencies and ledger sizes
+        """
+        wall = perf_counter() - self.started
+        ticker = clock.global_clock.ticker
+        events = sum(self.events.values())
+
+        ledgers = [ledger for bank in sim.banks.values() for ledger in (bank.transaction_ledger, bank.account_ledger, bank.device_ledger)]
+        streamed = sim.sink.rows if sim.sink is not None else 0
+
+        return {
+            'progress': min(ticker / duration, 1.) if duration else 1.,
+            'simulated_seconds': float(ticker),
+            'wall_seconds': wall,
+            'events': events,
+            'events_per_second': (events - self.start_events) / wall if wall else 0.,
+            'time_ratio': (ticker - self.start_ticker) / wall if wall else 0.,
+            'event_counts': dict(self.events),
+            'latency': {
+                name: {
+                    'count': int(histogram.sum()),
+                    'mean_ms': self.latency_totals[name] * 1000 / max(int(histogram.sum()), 1),
+                    'histogram': dict(zip(LATENCY_LABELS, histogram.tolist())),
+                }
+                for name, histogram in self.latencies.items()
+            },
+            'ledger': {
+                'transactions': sum(len(bank.transaction_ledger) for bank in sim.banks.values()) + streamed,
+                'buffered_transactions': sum(len(bank.transaction_ledger) for bank in sim.banks.values()),
+                'accounts': sum(len(bank.account_ledger) for bank in sim.banks.values()),
+                'devices': sum(len(bank.device_ledger) for bank in sim.banks.values()),
+                'individuals': len(sim.individuals),
+                'bytes': sum(ledger.nbytes for ledger in ledgers),
+            },
+            # ru_maxrss is in kilobytes on linux
+            'peak_memory_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
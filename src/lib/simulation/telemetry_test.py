@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+from src.lib.simulation.simulator import Simulator
+from src.lib.simulation.telemetry import LATENCY_LABELS, Telemetry
+
+
+def simulate(vectorised: bool) -> list:
+    sim = Simulator(num_users=30, num_banks=3, min_amount=100, max_amount=100_000_000_000, geo=(9, 3), radius=10000, fraudulence=.05, seed=5)
+    reports = []
+
+    async def report(progress):
+        reports.append(progress)
+
+    sim.report, sim.report_interval = report, 0
+    asyncio.run(sim.setup_reality())
+    asyncio.run(sim.simulate(60 * 60 * 24, 1, batch_size=200 if vectorised else 20, vectorised=vectorised))
+    return reports
+
+
+def test_reports_follow_the_run():
+    for vectorised in [False, True]:
+        reports = simulate(vectorised)
+        last = reports[-1]
+
+        assert [report['simulated_seconds'] for report in reports] == sorted(report['simulated_seconds'] for report in reports)
+        assert 0 < last['progress'] <= 1
+        assert last['events'] == sum(last['event_counts'].values()) > 0
+        assert last['ledger']['accounts'] > 0 and last['ledger']['bytes'] > 0
+        assert all(sum(latency['histogram'].values()) == latency['count'] for latency in last['latency'].values())
+        assert ('TICK' in last['latency']) == vectorised
+        json.dumps(last)
+
+
+def test_merge_adds_counters():
+    first, second = Telemetry(), Telemetry()
+    first.count('ATM_DEPOSIT', 2)
+    first.observe('ATM_DEPOSIT', .0002)
+    second.count('ATM_DEPOSIT')
+    second.observe('ATM_DEPOSIT', 2)
+    second.observe('TICK', .01)
+
+    first.merge(second)
+    assert first.events['ATM_DEPOSIT'] == 3
+    assert dict(zip(LATENCY_LABELS, first.latencies['ATM_DEPOSIT'].tolist()))['<=500us'] == 1
+    assert first.latencies['ATM_DEPOSIT'][-1] == 1 and first.latencies['TICK'].sum() == 1
@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+
+from src.lib.simulation.banking import Bank
+from src.lib.simulation.individual import Individual
+from src.lib.simulation.population import Population
+from src.lib.simulation.spatial import SpatialIndex
+
+
+def frozen(df: pd.DataFrame) -> pd.DataFrame:
+    """
+        Rebuild a frame over read only copies of its columns, so the views handed out can't be written to
+
+        @param df: The frame
+
+        @return: The read only frame
+    """
+    columns = {}
+    for column in df.columns:
+        columns[column] = df[column].to_numpy().copy()
+        columns[column].flags.writeable = False
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+class World:
+    """
+        Shared, cached views over the banks and individuals of a simulation
+    """
+
+    def __init__(self, banks: dict, individuals: dict, location_index: SpatialIndex = None, population: Population = None):
+        """
+            Initialize the world state
+
+            @param banks: The banks in the simulation
+            @param individuals: The individuals in the simulation
+            @param location_index: The spatial index over the locations of the simulation
+            @param population: The table the individuals live in, in the same order as individuals
+        """
+        self.banks = banks
+        self.individuals = individuals
+        self.population = population
+        self.location_index = location_index
+        self.version = 0
+        self._views = {}
+
+        # Index the bank devices by device_id
+        devices = self.devices
+        self.device_index = SpatialIndex(devices['device_id'], devices['latitude'], devices['longitude'])
+
+        # Index the merchant users by user_id
+        self.merchant_index = SpatialIndex()
+        for bvn in self.merchants['bvn'].unique():
+            self.index_merchant(bvn)
+
+
+    def invalidate(self):
+        """
+            Drop the cached views, they are rebuilt on next access
+        """
+        self.version += 1
+        self._views.clear()
+
+
+    def view(self, name: str, build):
+        """
+            Get a cached view, building it if the world changed since it was cached
+
+            @param name: The name of the view
+            @param build: Builds the view when it is missing
+
+            @return: The view
+        """
+        if name not in self._views:
+            self._views[name] = build()
+        return self._views[name]
+
+
+    @property
+    def offsets(self) -> np.ndarray:
+        # Where the accounts of each bank start in the accounts view, followed by the number of accounts
+        return self.view('offsets', lambda: np.cumsum([0] + [len(bank.account_ledger) for bank in self.banks.values()]))
+
+
+    def balances(self, positions=None) -> np.ndarray:
+        """
+            Read the live balances of accounts from the ledgers of their banks
+
+            @param positions: The positions of the accounts in the accounts view, every account when missing
+
+            @return: The balances, aligned with the positions
+        """
+        ledgers = [bank.account_ledger for bank in self.banks.values()]
+        if positions is None:
+            return np.concatenate([ledger.column('balance') for ledger in ledgers])
+
+        # Only the ledgers of the picked accounts are read
+        offsets, positions = self.offsets, np.asarray(positions)
+        banks = np.searchsorted(offsets, positions, side='right') - 1
+        balances = np.empty(len(positions))
+        for bank in np.unique(banks):
+            picked = banks == bank
+            balances[picked] = ledgers[bank].column('balance')[positions[picked] - offsets[bank]]
+        return balances
+
+
+    @property
+    def accounts(self) -> pd.DataFrame:
+        """
+            The accounts of every bank, their balances are read with balances
+
+            @return: A read only DataFrame of accounts, positioned like the balances
+        """
+        return self.view('accounts', lambda: frozen(pd.concat([bank.accounts for bank in self.banks.values()], ignore_index=True).drop(columns='balance'))).copy(deep=False)
+
+
+    @property
+    def merchants(self) -> pd.DataFrame:
+        # The accounts that belong to merchants, indexed by their position in the accounts view
+        return self.view('merchants', lambda: frozen(self.accounts[self.accounts['merchant']])).copy(deep=False)
+
+
+    @property
+    def devices(self) -> pd.DataFrame:
+        # The devices of every bank
+        return self.view('devices', lambda: frozen(pd.concat([bank.devices for bank in self.banks.values()], ignore_index=True).set_index('device_id', drop=False))).copy(deep=False)
+
+
+    @property
+    def profiles(self) -> pd.DataFrame:
+        # The profiles of every individual, read column by column from the population when there is one
+        if self.population is not None:
+            return self.view('profiles', self.population.frame)
+        return self.view('profiles', lambda: pd.DataFrame([individual.profile for individual in self.individuals.values()]))
+
+
+    def weights(self) -> np.ndarray:
+        # The running sums of the behaviour of every individual, aligned with the profiles view
+        if self.population is not None:
+            return self.population.weights()
+        return self.view('weights', lambda: np.cumsum([list(individual.behaviour.values()) for individual in self.individuals.values()], axis=1))
+
+
+    def add_individual(self, individual: Individual):
+        """
+            Add a new individual to the world
+
+            @param individual: The individual that joined
+        """
+        self.individuals[individual.profile['user_id']] = individual
+        self.invalidate()
+
+
+    async def open_account(self, bank: Bank, user: dict):
+        """
+            Open a new account and refresh the views that depend on it
+
+            @param bank: The bank to open the account with
+            @param user: The user data
+
+            @return: The account details
+        """
+        account = await bank.open_account(user)
+        if account['merchant']:
+            self.index_merchant(account['bvn'])
+
+        self.invalidate()
+        return account
+
+
+    async def generate_device(self, bank: Bank):
+        """
+            Generate a new bank device and add it to the device index
+
+            @param bank: The bank that owns the device
+
+            @return: The device details
+        """
+        device = await bank.generate_device()
+        self.device_index.add(device['device_id'], device['latitude'], device['longitude'])
+        self.invalidate()
+        return device
+
+
+    def index_merchant(self, user_id: str):
+        # Add a merchant user to the merchant index
+        if user_id in self.merchant_index:
+            return
+
+        profile = self.individuals[user_id].profile
+        self.merchant_index.add(user_id, profile['latitude'], profile['longitude'])
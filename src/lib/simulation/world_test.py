@@ -0,0 +1,52 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from src.lib.simulation.simulator import Simulator
+
+
+def make_simulator(min_amount: float = 100) -> Simulator:
+    sim = Simulator(num_users=200, num_banks=3, min_amount=min_amount, max_amount=100_000_000_000, geo=(9, 3), radius=10000, fraudulence=.05, seed=5)
+    asyncio.run(sim.setup_reality())
+    return sim
+
+
+def test_balances_are_read_by_position_from_the_ledgers():
+    sim = make_simulator()
+    world = sim.world
+    bank = list(sim.banks.values())[1]
+    bank.account_ledger.set(0, 'balance', 123.)
+
+    positions = np.array([world.offsets[2], world.offsets[1], 0, world.offsets[1] + 1])
+    assert world.balances(positions).tolist() == world.balances()[positions].tolist()
+    assert world.balances([world.offsets[1]])[0] == 123.
+    assert world.accounts['account_no'].iat[world.offsets[1]] == bank.account_ledger.get(0, 'account_no')
+
+
+def test_views_can_not_be_written_to():
+    world = make_simulator().world
+    accounts = world.accounts
+
+    with pytest.raises(ValueError):
+        accounts.loc[0, 'kyc'] = 9
+    accounts['balance'] = 0.
+    assert 'balance' not in world.accounts and 'balance' not in world.merchants
+
+    merchants = world.merchants
+    with pytest.raises(ValueError):
+        merchants.iloc[0, 0] = None
+
+
+def test_picked_accounts_can_start_an_event():
+    sim = make_simulator(min_amount=1_000_000)
+    balances = sim.world.balances()
+    eligible = sim.eligible_accounts(balances)
+    assert 0 < len(eligible) < len(balances)
+
+    picks = [sim.pick_account() for _ in range(300)]
+    assert set(picks) <= set(eligible.tolist())
+
+    # With no account able to spend, nothing is picked
+    sim.min_amount = balances.max() + 1
+    assert sim.pick_account() is None
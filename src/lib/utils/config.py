@@ -39,6 +39,12 @@ MONGO_URL = os.getenv('MONGO_URL')
 REDIS_URL = os.getenv('REDIS_URL')
 RABBIT_URL = os.getenv('RABBIT_URL')
 
+# Connection pools, shared by the requests and tasks of a process
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+
 # Email configuration
 DEFAULT_EMAIL = os.getenv('DEFAULT_EMAIL')
 MAIL_USER = os.getenv('MAIL_USER')
@@ -63,6 +69,40 @@ DATA_DIR = os.path.join(BASE_DIR, "datasets")
 VECTOR_DIR = os.path.join(BASE_DIR, "vectors")
 MODEL_DIR = os.path.join(BASE_DIR, "models")
 
+# Simulation worker processes and event batching
+SIMULATION_SHARDS = int(os.getenv('SIMULATION_SHARDS', 1))
+SIMULATION_VECTORISED = bool(int(os.getenv('SIMULATION_VECTORISED', 0)))
+SIMULATION_BATCH_SIZE = int(os.getenv('SIMULATION_BATCH_SIZE', 20))
+
+# Streaming simulated transactions to disk, parquet or csv
+SIMULATION_SINK_FORMAT = os.getenv('SIMULATION_SINK_FORMAT', 'parquet')
+SIMULATION_FLUSH_SIZE = int(os.getenv('SIMULATION_FLUSH_SIZE', 50_000))
+
+# Simulation checkpoints, every interval of simulated seconds to disk or gridfs
+SIMULATION_CHECKPOINT_INTERVAL = int(os.getenv('SIMULATION_CHECKPOINT_INTERVAL', 60 * 60 * 24))
+SIMULATION_CHECKPOINT_STORE = os.getenv('SIMULATION_CHECKPOINT_STORE', 'disk')
+
+# Datasets reused by simulations with the same settings, the most recently used are kept for a ttl in seconds
+DATASET_CACHE_PATH = os.path.join(UPLOAD_PATH, 'dataset_cache')
+DATASET_CACHE_SIZE = int(os.getenv('DATASET_CACHE_SIZE', 64))
+DATASET_CACHE_TTL = int(os.getenv('DATASET_CACHE_TTL', 60 * 60 * 24 * 7))
+
+# Seconds a shard waits on the other shards at a tick boundary before the run fails
+SHARD_TIMEOUT = int(os.getenv('SHARD_TIMEOUT', 60 * 10))
+
+# Bulk inserts of simulated records
+INSERT_CHUNK_SIZE = int(os.getenv('INSERT_CHUNK_SIZE', 5_000))
+INSERT_CONCURRENCY = int(os.getenv('INSERT_CONCURRENCY', 4))
+
+# Fraud model registry
+MODEL_CACHE_SIZE = int(os.getenv('MODEL_CACHE_SIZE', 8))
+
+# Materialised simulation analytics, the most recently read are kept in each process
+ANALYTICS_CACHE_SIZE = int(os.getenv('ANALYTICS_CACHE_SIZE', 8))
+
+# Transactions scored and written back at a time when their scores are stored
+SCORE_CHUNK = int(os.getenv('SCORE_CHUNK', 5000))
+
 # LLM configuration
 OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL')
 OLLAMA_API_KEY = os.getenv('OLLAMA_API_KEY')
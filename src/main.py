@@ -3,6 +3,8 @@ from fastapi import FastAPI, HTTPException
 from contextlib import asynccontextmanager
 from fastapi.exceptions import RequestValidationError, ResponseValidationError
 from fastapi.openapi.utils import get_openapi
+from src.db.connections import connections
+from src.db.indexes import ensure_indexes
 from src.lib.task.execute_messages import execute_messages
 from src.lib.task.message_queue import msg_queue
 from src.lib.task.publish_message import publish_message
@@ -20,10 +22,16 @@ logger = get_logger('app')
 async def lifespan(app: FastAPI):
     logger.info('🚀 Application starting...')
 
+    # The pooled clients are checked, and indexes created, once per process rather than on every request
+    checks = await connections.health()
+    if not all(checks.values()):
+        logger.warning(f'⚠️ Unhealthy connections: {checks}')
+    await ensure_indexes(connections.db())
     await execute_messages()
     
     yield
     logger.info("👋 Application shutting down...")
+    await connections.close()
 
 
 app = FastAPI(title=config.APP_NAME, lifespan=lifespan)
@@ -43,6 +51,14 @@ def home():
     return DataResponse(message='😊 Hey you.')
 
 
+@app.get('/health', tags=["Root"], response_model=DataResponse[dict])
+async def health():
+    checks = await connections.health()
+    if not all(checks.values()):
+        raise HTTPException(status_code=503, detail=f'Unhealthy connections: {checks}')
+    return DataResponse(data=checks, message='Healthy')
+
+
 def custom_openapi():
     if app.openapi_schema:
         return app.openapi_schema
@@ -1,10 +1,12 @@
+from datetime import datetime
 from typing_extensions import Literal, Optional
-from pydantic import Field, computed_field
+from pydantic import BaseModel, Field, computed_field
 
 from src.models.pagination import Page
 from src.models.entity import Creator, Update, Entity
 
 SimulationStatus = Literal['PENDING', 'COMPLETE', 'FAILED']
+SimulationStage = Literal['PENDING', 'SIMULATING', 'SAVING', 'COMPLETE']
 
 class CreateSimulation(Creator):
     num_banks: int = Field(..., description="The number of banks")
@@ -16,6 +18,7 @@ class CreateSimulation(Creator):
     min_amount: Optional[float] = Field(100, description="The min amount to be generated")
     max_amount: Optional[float] = Field(100_000_000_000, description="The maximium amount to be generated")
     days: Optional[float] = Field(7, description="The number of days to simulate")
+    seed: Optional[int] = Field(42, description="The seed of the simulation, the same seed gives the same data")
     
 
     @computed_field
@@ -36,6 +39,7 @@ class Simulation(Entity):
     author_id: str = Field(..., description="Unique identifier of the author who created the simulation")
     status: SimulationStatus = Field(..., description="The status of the simulation")
     days: float = Field(..., description="The number of days to simulate")
+    seed: int = Field(42, description="The seed of the simulation, the same seed gives the same data")
 
 
 class ListSimulations(Page):
@@ -52,4 +56,20 @@ class UpdateSimulation(Update):
     min_amount: Optional[float] = Field(None, description="The min amount to be generated")
     max_amount: Optional[float] = Field(None, description="The maximium amount to be generated")
     days: Optional[float] = Field(None, description="The number of days to simulate")
-    
\ No newline at end of file
+    seed: Optional[int] = Field(None, description="The seed of the simulation, the same seed gives the same data")
+    
+
+
+class SimulationProgress(BaseModel):
+    stage: SimulationStage = Field('PENDING', description="The stage the simulation is at")
+    progress: float = Field(0, description="The share of the simulated period that has run")
+    simulated_seconds: float = Field(0, description="The simulated time that has run, in seconds")
+    wall_seconds: float = Field(0, description="The wall time the run has taken, in seconds")
+    events: int = Field(0, description="The number of events that have run")
+    events_per_second: float = Field(0, description="The events run per wall second")
+    time_ratio: float = Field(0, description="The simulated seconds run per wall second")
+    event_counts: dict = Field({}, description="The number of events of each type")
+    latency: dict = Field({}, description="The latency histogram of each event type, or of each tick when vectorised")
+    ledger: dict = Field({}, description="The number of records held and the bytes of the ledgers")
+    peak_memory_bytes: int = Field(0, description="The peak memory of the simulating process")
+    updated_at: Optional[datetime] = Field(None, description="When the progress was reported")
@@ -1,11 +1,16 @@
 import asyncio
+import json
+from datetime import datetime
+import numpy as np
 from pandas import DataFrame
 from redis.asyncio import Redis
 from pymongo.database import Database
 from bson import ObjectId
 
+from src.db.bulk import bulk_insert, chunked, insert_chunks, validate_many
 from src.db.cache import get_cache
-from src.lib.utils.config import UPLOAD_PATH
+from src.db.connections import connections
+from src.lib.utils.config import CACHE_TTL, UPLOAD_PATH, SIMULATION_SHARDS, SIMULATION_VECTORISED, SIMULATION_BATCH_SIZE, SIMULATION_SINK_FORMAT, SIMULATION_FLUSH_SIZE, SIMULATION_CHECKPOINT_INTERVAL, SIMULATION_CHECKPOINT_STORE
 from src.db.database import get_db
 from src.models.simulation_account import CreateSimulationAccount
 from src.models.simulation_devices import CreateSimulationDevice
@@ -13,30 +18,119 @@ from src.models.simulation_profile import CreateSimulationProfile
 from src.models.simulation import Simulation
 from src.models.simulation_transaction import CreateSimulationTransaction
 from src.models.user import User
+from src.lib.simulation import checkpoint, dataset_cache
 from src.lib.simulation.simulator import Simulator
-from src.lib.utils.lazycache import lazyload
+from src.lib.simulation.sink import TransactionSink
+from src.lib.analytics.feature_store import FeatureStore, feature_frame, save_feature_store
+from src.lib.analytics.anomalizer import FraudModel
+from src.lib.analytics.registry import save_fraud_model
+from src.lib.analytics.materialized import build_analytics, drop_analytics
+from src.lib.utils.lazycache import EnhancedJSONEncoder, lazyload
 from src.lib.utils.logger import get_logger
 from src.tasks.send_mail import send_mail_task
 from src.lib.utils.config import ENV, ENVIRONMENTS
 from src.tasks.send_mail import send_mail_task
 from src.lib.task.publish_message import publish_message
 
+# The number of transactions the fraud model is fitted on
+FIT_SAMPLE_SIZE = 100_000
+
 
 async def run_simulation(payload: Simulation, user_id: str, db: Database, cache: Redis):
+    logger = get_logger('Simulation Logger')
     period = 60 * 60 * 24
-    sim = Simulator(
-        num_users=payload.get('min_num_user', 5),
-        num_banks=payload.get('num_banks', 5),
-        min_amount=payload.get('min_amount', None),
-        max_amount=payload.get('max_amount', None),
-        geo=(payload.get('latitude', 9), payload.get('longitude', 3)),
-        radius=payload.get('radius', None),
-        fraudulence=payload.get('fraudulence', None)
-    )
 
-    await sim.setup_reality()
-    await sim.simulate(period, payload['days'])
+    key, digest = str(payload['_id']), checkpoint.fingerprint(payload)
+
+    # Settings that were simulated before reuse that dataset
+    entry = await dataset_cache.find_dataset(digest, db)
+    if entry is not None and entry['simulation_id'] != key:
+        return await reuse_simulation(payload, user_id, entry, db, cache)
+
+    # The records of the simulation are about to be replaced, so they no longer serve as a dataset
+    await dataset_cache.forget_simulation(key, db)
+
+    # A redelivered simulation carries on from its last checkpoint when its settings are unchanged
+    checkpoints = simulation_checkpoints(db)
+    state = await checkpoints.load(key)
+    state = checkpoint.restore(state) if state is not None else None
+
+    if state is not None and state['fingerprint'] == digest:
+        sim: Simulator = state['simulator']
+        if sim.sink is not None:
+            sim.sink.rollback()
+        logger.info(f"Resuming simulation {key} from its {state['stage'].lower()} checkpoint")
+    else:
+        state = None
+        sim = Simulator(
+            num_users=payload.get('min_num_user', 5),
+            num_banks=payload.get('num_banks', 5),
+            min_amount=payload.get('min_amount', None),
+            max_amount=payload.get('max_amount', None),
+            geo=(payload.get('latitude', 9), payload.get('longitude', 3)),
+            radius=payload.get('radius', None),
+            fraudulence=payload.get('fraudulence', None),
+            seed=payload.get('seed', 42)
+        )
+
+        # Transactions are streamed next to the datasets instead of piling up in the banks
+        sim.sink = TransactionSink(f"{simulation_path(payload)}/transactions", format=SIMULATION_SINK_FORMAT, flush_size=SIMULATION_FLUSH_SIZE)
+        sim.sink.clear()
+        await checkpoints.delete(key)
+        await sim.setup_reality()
+
+    sim.checkpoint = lambda sim: checkpoints.save(key, checkpoint.snapshot(sim, 'SIMULATING', digest))
+    sim.checkpoint_interval = SIMULATION_CHECKPOINT_INTERVAL
+    sim.report = lambda report: publish_progress(key, 'SIMULATING', report, db, cache)
+
+    duration = period * payload['days']
+    if state is None or state['stage'] == 'SIMULATING':
+        await sim.simulate(period, payload['days'], batch_size=SIMULATION_BATCH_SIZE, shards=SIMULATION_SHARDS, vectorised=SIMULATION_VECTORISED, resume=state is not None)
+        await checkpoints.save(key, checkpoint.snapshot(sim, 'SIMULATED', digest))
+
+    await publish_progress(key, 'SAVING', sim.telemetry.report(sim, duration), db, cache)
     await save_simulation(payload, user_id, sim, db, cache)
+    await dataset_cache.store_dataset(digest, key, simulation_path(payload), db)
+
+    # Analyses read the scored transactions, so they are scored once before the simulation completes
+    await build_analytics(key, db)
+
+    # Only a fully saved simulation is complete, a crash before this resumes from the checkpoint
+    await db.simulations.update_one({'_id': ObjectId(payload['_id'])}, {'$set': {'status': 'COMPLETE'}})
+    await publish_progress(key, 'COMPLETE', sim.telemetry.report(sim, duration), db, cache)
+    await checkpoints.delete(key)
+    await notify_user(payload, user_id, sim.datasets, db, cache)
+
+
+async def publish_progress(simulation_id: str, stage: str, report: dict, db: Database, cache: Redis):
+    """
+        Share the progress of a running simulation
+
+        @param simulation_id: The id of the simulation
+        @param stage: The stage of the simulation
+        @param report: The telemetry report of the simulator
+        @param db: The database
+        @param cache: The cache
+    """
+    progress = {**report, 'stage': stage, 'updated_at': datetime.now()}
+
+    # The cache is read while the simulation runs, the document keeps the last report for later
+    await asyncio.gather(
+        cache.set(f'simulation:{simulation_id}:progress', json.dumps(progress, cls=EnhancedJSONEncoder), ex=CACHE_TTL),
+        db.simulations.update_one({'_id': ObjectId(simulation_id)}, {'$set': {'progress': progress}}),
+    )
+
+
+def simulation_checkpoints(db: Database):
+    # Where the checkpoints of simulations are kept
+    if SIMULATION_CHECKPOINT_STORE == 'gridfs':
+        return checkpoint.GridFSCheckpoints(db)
+    return checkpoint.DiskCheckpoints(f"{UPLOAD_PATH}/checkpoints")
+
+
+def simulation_path(payload: Simulation) -> str:
+    # The directory the datasets of a simulation are saved to
+    return f"{UPLOAD_PATH}/simulations/{payload['_id']}"
 
 
 def prepare_data(generated_data, payload, key):
@@ -46,39 +140,110 @@ def prepare_data(generated_data, payload, key):
     return data
 
 
+def prepare_chunks(generated_data, payload, key):
+    """
+        Prepare a dataset that may be streamed, one chunk at a time
+
+        @param generated_data: The data of the simulation
+        @param payload: The simulation
+        @param key: The name of the dataset
+
+        @return: An iterator over the records of each chunk
+    """
+    data = generated_data[key]
+    for chunk in ([data] if isinstance(data, DataFrame) else data):
+        # Records are replayed in time order, streamed parts are already sorted
+        chunk = chunk.sort_values(by='time', kind='stable') if 'time' in chunk else chunk
+        yield prepare_data({key: chunk}, payload, key)
+
+
+def sample_rows(sample: list, rows: list, seen: int, size: int, rng: np.random.Generator) -> int:
+    """
+        Keep a uniform sample of every row seen so far, by reservoir sampling
+
+        @param sample: The sample, updated in place
+        @param rows: The new rows
+        @param seen: The number of rows seen before these
+        @param size: The size of the sample
+        @param rng: The random generator
+
+        @return: The number of rows seen
+    """
+    for row in rows:
+        seen += 1
+        if len(sample) < size:
+            sample.append(row)
+        else:
+            slot = rng.integers(seen)
+            if slot < size:
+                sample[slot] = row
+    return seen
+
+
 async def save_simulation(payload: Simulation, user_id: str, sim: Simulator, db: Database, cache: Redis):
     logger = get_logger('Simulation Logger')
 
-    path = f"{UPLOAD_PATH}/simulations/{payload['_id']}"
-    await sim.save_data(path)
+    await sim.save_data(simulation_path(payload))
 
     logger.info(f"Simulation Completed")
-    
-    simulation_collection = db.simulations
-    await simulation_collection.update_one({'_id': ObjectId(payload['_id'])}, {'$set': {'status': 'COMPLETE'}})
 
-    user_collection = db.users
-    user_details: User = await lazyload(cache, f'user:{user_id}', loader=user_collection.find_one, params={'_id': ObjectId(user_id), 'hidden': False})
+    # A saved simulation is saved again in full, so a retried save does not double the records
+    await clear_simulation(payload['_id'], db)
+
+    accounts = prepare_data(sim.generated_data, payload, 'accounts')
+    progress = lambda name, count: logger.info(f"Inserted {count} documents into {name}")
+
+    # Streamed transactions are replayed a chunk at a time off the loop, only a sample is kept for fitting
+    store = FeatureStore()
+    account_index = index_accounts(accounts)
+    sample, seen, rng = [], 0, np.random.default_rng(0)
 
-    transactions = prepare_data(sim.generated_data, payload, 'transactions')
-    transactions = [CreateSimulationTransaction(**item).model_dump() for item in transactions]
-    simulation_transaction_collection = db.simulation_transactions  
-    await simulation_transaction_collection.insert_many(transactions)
+    def transaction_chunks():
+        nonlocal seen
+        for records in prepare_chunks(sim.generated_data, payload, 'transactions'):
+            for chunk in chunked(records):
+                features = replay_transactions(store, chunk, account_index)
+                documents = [{**document, 'features': feature} for document, feature in zip(validate_many(CreateSimulationTransaction, chunk), features)]
+                seen = sample_rows(sample, documents, seen, FIT_SAMPLE_SIZE, rng)
+                yield documents
 
-    bank_devices = prepare_data(sim.generated_data, payload, 'bank_devices')
-    bank_devices = [CreateSimulationDevice(**item).model_dump() for item in bank_devices]
-    simulation_devices_collection = db.simulation_devices 
-    await simulation_devices_collection.insert_many(bank_devices)
+    # The collections are written concurrently, each in unordered chunks
+    await asyncio.gather(
+        insert_chunks(db.simulation_transactions, transaction_chunks(), progress=progress),
+        bulk_insert(db.simulation_devices, CreateSimulationDevice, prepare_data(sim.generated_data, payload, 'bank_devices'), progress=progress),
+        bulk_insert(db.simulation_profiles, CreateSimulationProfile, prepare_data(sim.generated_data, payload, 'profiles'), progress=progress),
+        bulk_insert(db.simulation_accounts, CreateSimulationAccount, accounts, progress=progress),
+    )
+    await save_feature_store(payload['_id'], store, db)
 
-    profiles = prepare_data(sim.generated_data, payload, 'profiles')
-    profiles = [CreateSimulationProfile(**item).model_dump() for item in profiles]
-    simulation_profiles_collection = db.simulation_profiles 
-    await simulation_profiles_collection.insert_many(profiles)
+    # Fit the fraud detectors once, transactions are scored with them afterwards
+    model = FraudModel().fit(feature_frame(sample))
+    await save_fraud_model(payload['_id'], model, db)
 
-    accounts = prepare_data(sim.generated_data, payload, 'accounts')
-    accounts = [CreateSimulationAccount(**item).model_dump() for item in accounts]
-    simulation_accounts_collection = db.simulation_accounts
-    await simulation_accounts_collection.insert_many(accounts)
+    logger.info(f"Simulation Saved")
+
+
+async def clear_simulation(simulation_id: str, db: Database):
+    # Delete the records of a simulation before they are written again
+    await asyncio.gather(*[
+        db[name].delete_many({'simulation_id': simulation_id})
+        for name in [*dataset_cache.COLLECTIONS, 'simulation_features']
+    ])
+    await drop_analytics(simulation_id, db)
+
+
+async def notify_user(payload: Simulation, user_id: str, datasets: list, db: Database, cache: Redis):
+    """
+        Mail the datasets of a completed simulation to its author
+
+        @param payload: The simulation
+        @param user_id: The id of the author
+        @param datasets: The dataset files to attach
+        @param db: The database
+        @param cache: The cache
+    """
+    user_collection = db.users
+    user_details: User = await lazyload(cache, f'user:{user_id}', loader=user_collection.find_one, params={'_id': ObjectId(user_id), 'hidden': False})
 
     await publish_message(
         send_mail_task,
@@ -91,11 +256,57 @@ async def save_simulation(payload: Simulation, user_id: str, sim: Simulator, db:
                 'timestamp': payload['created_at']
             },
             'template_file': 'simulation_complete.html',
-            'attatchments': sim.datasets
+            'attatchments': datasets
         }
     )
 
-    logger.info(f"Simulation Saved")
+
+async def reuse_simulation(payload: Simulation, user_id: str, entry: dict, db: Database, cache: Redis):
+    """
+        Complete a simulation with the cached dataset of another simulation with the same settings
+
+        @param payload: The simulation
+        @param user_id: The id of the author
+        @param entry: The cache entry of the dataset
+        @param db: The database
+        @param cache: The cache
+    """
+    logger = get_logger('Simulation Logger')
+
+    await clear_simulation(payload['_id'], db)
+    datasets = await dataset_cache.clone_dataset(entry, payload['_id'], simulation_path(payload), db)
+    logger.info(f"Simulation {payload['_id']} reused the dataset of simulation {entry['simulation_id']}")
+    await build_analytics(str(payload['_id']), db)
+
+    await db.simulations.update_one({'_id': ObjectId(payload['_id'])}, {'$set': {'status': 'COMPLETE'}})
+    await publish_progress(payload['_id'], 'COMPLETE', {'progress': 1.}, db, cache)
+    await notify_user(payload, user_id, datasets, db, cache)
+
+
+def index_accounts(accounts: list) -> dict:
+    # Key the simulated accounts by account number and bank
+    return {(account['account_no'], account['bank_name']): account for account in accounts}
+
+
+def replay_transactions(store: FeatureStore, transactions: list, accounts: dict) -> list:
+    """
+        Replay transactions through a feature store in time order, chunks of a stream are replayed one after the other
+
+        @param store: The feature store
+        @param transactions: The transactions
+        @param accounts: The simulated accounts, keyed by account number and bank
+
+        @return: The point-in-time features of each transaction
+    """
+    features = [None] * len(transactions)
+
+    for position in sorted(range(len(transactions)), key=lambda x: transactions[x]['time']):
+        transaction = transactions[position]
+        holder_account = accounts[(transaction['holder'], transaction['holder_bank'])]
+        related_account = accounts.get((transaction['related'], transaction['related_bank']))
+        features[position] = store.observe(transaction, holder_account, related_account)
+
+    return features
 
 
 def run_simulation_task(payload: Simulation, user_id: str):
@@ -104,7 +315,11 @@ def run_simulation_task(payload: Simulation, user_id: str):
 
     async def run():
         db: Database = await get_db()
-        cache: Redis = get_cache()
-        await run_simulation(payload, user_id, db, cache)
+        cache: Redis = await get_cache()
+        try:
+            await run_simulation(payload, user_id, db, cache)
+        finally:
+            # The task runs on a loop of its own, whose pool goes with it
+            await connections.release()
 
     asyncio.run(run())
@@ -1,14 +1,15 @@
 from dotenv import load_dotenv
 from langchain_mongodb import MongoDBAtlasVectorSearch
-from pymongo import MongoClient
 
+from ..db.connections import connections
 from ..lib.utils.config import MONGO_VECTOR_COLLECTION, MONGO_VECTOR_INDEX, VECTOR_URL, MONGO_DB
 from .llms import get_embedding
 
 load_dotenv()
 
 def get_vector_store():
-    client = MongoClient(VECTOR_URL)
+    # The client is shared by every vector store of the process
+    client = connections.sync_client(VECTOR_URL)
     collection = client[MONGO_DB][MONGO_VECTOR_COLLECTION]
     embedding = get_embedding()
 